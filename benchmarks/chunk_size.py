@@ -0,0 +1,73 @@
+"""
+CPU per GB of fixed and adaptive read sizes at different link speeds
+
+Runs throughput.py once per link speed and read size setting. Fixed sizes set
+both bounds of the adaptive sizer to the same value through the environment of
+the run, so the pool workers pick them up.
+
+    python benchmarks/chunk_size.py [--size 64] [--speeds 10 100 0] [--save results/chunks.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from yundownload.utils.core import Environment
+
+KB = 1024
+SETTINGS = {
+    'fixed-64K': 64 * KB,
+    'fixed-1M': 1024 * KB,
+    'fixed-8M': 8192 * KB,
+    'adaptive': None,
+}
+
+
+def run(setting: str, speed: float, args) -> dict:
+    env = dict(os.environ)
+    size = SETTINGS[setting]
+    if size is not None:
+        env[Environment.MIN_CHUNK_SIZE] = env[Environment.MAX_CHUNK_SIZE] = str(size)
+    with tempfile.TemporaryDirectory() as directory:
+        output = Path(directory) / 'result.json'
+        subprocess.run([sys.executable, str(Path(__file__).with_name('throughput.py')),
+                        '--size', str(args.size), '--repeat', str(args.repeat), '--bandwidth', str(speed),
+                        '--only', *args.scenarios, '--save', str(output)],
+                       env=env, check=True, stdout=subprocess.DEVNULL)
+        return json.loads(output.read_text())['scenarios']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=64, help='size of the test file in MB')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario, the median is reported')
+    parser.add_argument('--speeds', type=float, nargs='*', default=[10, 100, 0],
+                        help='MB/s of every connection, 0 is unlimited')
+    parser.add_argument('--scenarios', nargs='*', default=['http-stream', 'http-sliced', 'm3u8'])
+    parser.add_argument('--save', type=Path, help='write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for speed in args.speeds:
+        label = f'{speed:g} MB/s' if speed else 'unlimited'
+        print(f'\n{label}')
+        print(f'  {"":<12}' + ''.join(f'{setting:>22}' for setting in SETTINGS))
+        rows = {setting: run(setting, speed, args) for setting in SETTINGS}
+        for scenario in args.scenarios:
+            cells = []
+            for setting in SETTINGS:
+                result = rows[setting].get(scenario, {})
+                cells.append(f'{result["cpu_seconds_per_gb"]:7.2f} s/GB {result["mb_per_s"]:6.1f} MB/s'
+                             if 'mb_per_s' in result else f'{"failed":>22}')
+            print(f'  {scenario:<12}' + ''.join(f'{cell:>22}' for cell in cells))
+        results[label] = rows
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
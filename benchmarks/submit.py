@@ -0,0 +1,90 @@
+"""
+Submit overhead per 100k resources
+
+Measures building the resources, pickling them the way the process pool does
+and handing them to the scheduler, without running any download.
+
+    python benchmarks/submit.py [count]
+"""
+import pickle
+import sys
+import time
+import tracemalloc
+from concurrent.futures import Future
+
+from yundownload import Downloader, Resources, Result
+from yundownload.core.scheduler import DownloadScheduler
+from yundownload.network import HttpProtocolHandler
+
+
+class PicklingPool:
+    """Pickles every task like ProcessPoolExecutor and completes it immediately"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def run_download(self, protocol, resources, slot):
+        self.bytes += len(pickle.dumps((protocol, resources, slot), pickle.HIGHEST_PROTOCOL))
+        future = Future()
+        future.set_result(Result.SUCCESS)
+        return future
+
+    def shutdown(self):
+        pass
+
+
+def build(count: int) -> list:
+    headers = {'User-Agent': 'bench'}
+    return [Resources(f'https://example.com/files/{i}.bin', f'data/{i}.bin', http_headers=headers)
+            for i in range(count)]
+
+
+def bench_build(count: int) -> dict:
+    start = time.perf_counter()
+    resources = build(count)
+    elapsed = time.perf_counter() - start
+    del resources
+    tracemalloc.start()
+    resources = build(count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {'build_seconds': elapsed, 'memory_bytes': memory, 'resources': resources}
+
+
+def bench_pickle(resources: list) -> dict:
+    start = time.perf_counter()
+    size = sum(len(pickle.dumps(r, pickle.HIGHEST_PROTOCOL)) for r in resources)
+    return {'pickle_seconds': time.perf_counter() - start, 'pickle_bytes': size}
+
+
+def bench_submit(count: int) -> dict:
+    downloader = Downloader(max_workers=1)
+    downloader.lock_protocol(HttpProtocolHandler)
+    pool = PicklingPool()
+    downloader._download_pool = pool
+    downloader._scheduler = DownloadScheduler(pool, downloader._task_slots)
+    start = time.perf_counter()
+    for i in range(count):
+        downloader.submit(Resources(f'https://example.com/files/{i}.bin', f'data/{i}.bin'))
+    elapsed = time.perf_counter() - start
+    downloader.close()
+    return {'submit_seconds': elapsed, 'submit_pickle_bytes': pool.bytes}
+
+
+def main(count: int = 100_000):
+    build = bench_build(count)
+    report = {
+        'build_seconds': build['build_seconds'],
+        'memory_bytes': build['memory_bytes'],
+        **bench_pickle(build.pop('resources')),
+        **bench_submit(count),
+    }
+    scale = 100_000 / count
+    print(f'per 100k resources ({count} measured)')
+    for key, value in report.items():
+        value *= scale
+        print(f'  {key:<22}' + (f'{value:10.3f} s' if key.endswith('seconds') else f'{value / 1024 / 1024:10.2f} MB'))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,209 @@
+"""
+End-to-end throughput of every download path against loopback stand-in servers
+
+Runs the stream, sliced, M3U8 (plain and AES-128), FTP and SFTP paths through a
+Downloader and reports MB/s, seconds to complete and CPU seconds per GB of the
+client (parent process and pool workers, the servers run in their own process).
+Results are stored as JSON and compared against an earlier run.
+
+    python benchmarks/throughput.py [--size 64] [--repeat 3] [--only http-sliced m3u8]
+                                    [--latency 0.02] [--bandwidth 50] [--failure-rate 0.05]
+                                    [--save results/main.json] [--compare results/main.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from servers import ServerProcess, write_hls
+
+from yundownload import Downloader, Resources, __version__, logger
+
+MB = 1024 * 1024
+# 越大越好的指标，其余越小越好
+HIGHER_IS_BETTER = {'mb_per_s'}
+
+
+def scenarios(endpoints: dict, size: int) -> dict:
+    """
+    :return: Name -> (uri, extra Resources arguments), None when the server is not available
+    """
+    http, ftp, sftp = endpoints['http'], endpoints['ftp'], endpoints['sftp']
+    return {
+        'http-stream': (f'{http}/data.bin', {'http_stream': True}),
+        'http-sliced': (f'{http}/data.bin', {'http_slice_threshold': MB, 'http_sliced_chunk_size': 4 * MB}),
+        'm3u8': (f'{http}/plain/index.m3u8', {}),
+        'm3u8-aes': (f'{http}/aes/index.m3u8', {}),
+        'ftp': (f'{ftp}/data.bin', {'ftp_slice_threshold': size + 1}) if ftp else None,
+        'ftp-sliced': (f'{ftp}/data.bin', {'ftp_slice_threshold': MB, 'ftp_sliced_chunk_size': 4 * MB})
+        if ftp else None,
+        'sftp': (f'{sftp}/data.bin', {'sftp_slice_threshold': size + 1}),
+        'sftp-sliced': (f'{sftp}/data.bin', {'sftp_slice_threshold': MB, 'sftp_sliced_chunk_size': 4 * MB}),
+    }
+
+
+def cpu_time() -> float:
+    # 包括已回收的工作进程，每次运行关闭下载器后工作进程即被回收
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def md5(path: Path) -> str:
+    digest = hashlib.md5()
+    with path.open('rb') as f:
+        while chunk := f.read(MB):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_once(uri: str, options: dict, save_path: Path, expected: str) -> dict:
+    cpu = cpu_time()
+    start = time.perf_counter()
+    with Downloader(max_workers=1) as downloader:
+        future = downloader.submit(Resources(uri, save_path, concurrency_warm_start=False, **options))
+        future.wait()
+    elapsed = time.perf_counter() - start
+    cpu = cpu_time() - cpu
+    if not future.state.is_success():
+        raise RuntimeError(f'{uri} finished with {future.state}')
+    if md5(save_path) != expected:
+        raise RuntimeError(f'{uri} downloaded corrupted content')
+    size = save_path.stat().st_size
+    stats = future.stats
+    return {
+        'seconds': elapsed,
+        'mb_per_s': size / MB / elapsed,
+        'cpu_seconds_per_gb': cpu / (size / 1024 ** 3),
+        'retries': stats.retries if stats is not None else 0,
+        'peak_concurrency': stats.peak_concurrency if stats is not None else 0,
+    }
+
+
+def summarize(runs: list[dict]) -> dict:
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    summary['runs'] = runs
+    return summary
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'version': __version__,
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'size_mb': args.size,
+        'repeat': args.repeat,
+        'latency': args.latency,
+        'bandwidth_mb': args.bandwidth,
+        'failure_rate': args.failure_rate,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Print the change of every metric against the baseline
+
+    :return: Regressions larger than threshold
+    """
+    regressions = []
+    print(f'\ncompared with {baseline["meta"].get("commit") or baseline["meta"].get("time")}')
+    for key in ('size_mb', 'latency', 'bandwidth_mb', 'failure_rate', 'cpus'):
+        if current['meta'].get(key) != baseline['meta'].get(key):
+            print(f'  warning: {key} differs, {baseline["meta"].get(key)} -> {current["meta"].get(key)}')
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None or 'error' in result or 'error' in before:
+            continue
+        changes = []
+        for key in ('mb_per_s', 'seconds', 'cpu_seconds_per_gb'):
+            if not before[key]:
+                continue
+            change = (result[key] - before[key]) / before[key]
+            changes.append(f'{key} {change:+.1%}')
+            worse = -change if key in HIGHER_IS_BETTER else change
+            if worse > threshold:
+                regressions.append(f'{name} {key} {before[key]:.3f} -> {result[key]:.3f}')
+        print(f'  {name:<12} ' + '  '.join(changes))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=64, help='size of the test file in MB')
+    parser.add_argument('--segment-size', type=int, default=1, help='size of an M3U8 segment in MB')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario, the median is reported')
+    parser.add_argument('--only', nargs='*', help='scenarios to run')
+    parser.add_argument('--latency', type=float, default=0, help='seconds before every HTTP response')
+    parser.add_argument('--bandwidth', type=float, default=0, help='MB/s of every HTTP connection, 0 is unlimited')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of HTTP responses dropped half way')
+    parser.add_argument('--save', type=Path, help='write the results to this JSON file')
+    parser.add_argument('--compare', type=Path, help='compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change reported as a regression')
+    args = parser.parse_args(argv)
+
+    logger.setLevel('WARNING')
+    work = Path(tempfile.mkdtemp(prefix='yundownload-bench-'))
+    try:
+        root = work / 'www'
+        root.mkdir()
+        source = root / 'data.bin'
+        with source.open('wb') as f:
+            for _ in range(args.size):
+                f.write(os.urandom(MB))
+        expected = md5(source)
+        write_hls(root, source, 'plain', args.segment_size * MB)
+        write_hls(root, source, 'aes', args.segment_size * MB, key=os.urandom(16))
+
+        report = {'meta': metadata(args), 'scenarios': {}}
+        with ServerProcess(root, args.latency, int(args.bandwidth * MB), args.failure_rate) as servers:
+            for name, scenario in scenarios(servers.endpoints, args.size * MB).items():
+                if args.only and name not in args.only:
+                    continue
+                if scenario is None:
+                    print(f'{name:<12} skipped, server not available')
+                    continue
+                uri, options = scenario
+                runs = []
+                try:
+                    for index in range(args.repeat):
+                        save_path = work / 'out' / f'{name}-{index}.bin'
+                        runs.append(run_once(uri, options, save_path, expected))
+                        shutil.rmtree(work / 'out', ignore_errors=True)
+                except Exception as e:
+                    report['scenarios'][name] = {'error': str(e)}
+                    print(f'{name:<12} failed: {e}')
+                    continue
+                result = report['scenarios'][name] = summarize(runs)
+                print(f'{name:<12} {result["mb_per_s"]:9.1f} MB/s {result["seconds"]:8.2f} s '
+                      f'{result["cpu_seconds_per_gb"]:8.2f} cpu s/GB  retries {result["retries"]:.0f}')
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        if regressions:
+            print('\nregressions:\n  ' + '\n  '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
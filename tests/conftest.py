@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from yundownload import Downloader, Resources, Result
+from yundownload.core.scheduler import DownloadScheduler
+from yundownload.network import HttpProtocolHandler
+from yundownload.utils.work import TaskSlots
+
+
+class FakePool:
+    """Records started downloads, their futures complete through ``finish``"""
+
+    def __init__(self):
+        self.started = []
+
+    def run_download(self, protocol, resources, slot):
+        future = Future()
+        self.started.append((resources.uri, slot, future))
+        return future
+
+    def finish(self, uri, result=Result.SUCCESS):
+        for index, (started_uri, _, future) in enumerate(self.started):
+            if started_uri == uri and not future.done():
+                future.set_result(result)
+                return
+
+
+class ThreadPool:
+    """Completes each download after the delay encoded in its file name"""
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(workers)
+        self.started = 0
+
+    def run_download(self, protocol, resources, slot):
+        self.started += 1
+        return self.executor.submit(self._run, resources)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    @staticmethod
+    def _run(resources):
+        time.sleep(float(resources.save_path.name))
+        resources.save_path.parent.mkdir(parents=True, exist_ok=True)
+        resources.save_path.write_text(resources.uri)
+        return Result.SUCCESS
+
+
+@pytest.fixture
+def make_scheduler():
+    """Scheduler in front of a FakePool, returns (pool, slots, scheduler)"""
+
+    def make(workers=1):
+        pool = FakePool()
+        slots = TaskSlots(workers)
+        return pool, slots, DownloadScheduler(pool, slots)
+
+    return make
+
+
+@pytest.fixture
+def submit():
+    """Schedule a download of http://host/<name>"""
+
+    def schedule(scheduler, name, **kwargs):
+        return scheduler.submit(HttpProtocolHandler, Resources(f'http://host/{name}', name), **kwargs)
+
+    return schedule
+
+
+@pytest.fixture
+def make_downloader():
+    """Downloader whose workers are a ThreadPool instead of processes"""
+
+    def make(workers=2, **kwargs):
+        downloader = Downloader(max_workers=workers, **kwargs)
+        on_start = downloader._scheduler.on_start
+        downloader._download_pool = ThreadPool(workers)
+        downloader._scheduler = DownloadScheduler(downloader._download_pool, downloader._task_slots)
+        downloader._scheduler.on_start = on_start
+        return downloader
+
+    return make
@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from yundownload import Resources, Result
+from yundownload.network.http import HttpProtocolHandler
+from yundownload.utils.checksum import Checksum
+
+DATA = bytes(range(256)) * 64
+
+
+class DigestHandler(BaseHTTPRequestHandler):
+    """Range 请求附带 Content-MD5，第一次请求第二个区间时返回损坏的数据"""
+    protocol_version = 'HTTP/1.1'
+    requests: list = []
+    corrupt = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):  # noqa
+        self._serve(False)
+
+    def do_GET(self):  # noqa
+        self._serve(True)
+
+    def _serve(self, body: bool):
+        self.requests.append((self.command, self.headers.get('Range')))
+        data = DATA
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(DATA) - 1
+            data = DATA[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(DATA)}')
+        else:
+            self.send_response(200)
+            self.send_header('Repr-Digest', f'sha-256=:{base64.b64encode(hashlib.sha256(DATA).digest()).decode()}:')
+        self.send_header('Content-MD5', base64.b64encode(hashlib.md5(data).digest()).decode())
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            if match and match.group(0) in self.corrupt:
+                self.corrupt.discard(match.group(0))
+                data = bytes([data[0] ^ 0xff]) + data[1:]
+            self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    handler = type('DigestHandler', (DigestHandler,), {'requests': [], 'corrupt': set()})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_parse_and_headers():
+    digest = hashlib.sha256(b'abc').digest()
+    assert Checksum.parse(f'SHA-256:{digest.hex()}').expected == digest
+    assert Checksum.parse(f'sha256:{base64.b64encode(digest).decode()}').expected == digest
+    with pytest.raises(ValueError):
+        Resources('http://host/file', 'file', checksum='sha256:abc')
+    headers = httpx.Headers({'Content-MD5': base64.b64encode(hashlib.md5(b'abc').digest()).decode(),
+                             'Digest': f'SHA-256={base64.b64encode(digest).decode()}'})
+    assert Checksum.from_headers(headers).describe() == f'sha256:{digest.hex()}'
+    # 区间响应只使用描述响应体的摘要
+    assert Checksum.from_headers(headers, partial=True).algorithm == 'md5'
+    assert Checksum.from_headers(httpx.Headers({'x-amz-checksum-sha256': 'abc-3'})) is None
+
+
+def test_stream_verified_from_headers(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/file'
+    handler = HttpProtocolHandler()
+    assert handler(Resources(uri, tmp_path / 'file', http_stream=True)) is Result.SUCCESS
+    assert handler.stats.checksum == f'sha256:{hashlib.sha256(DATA).hexdigest()}'
+
+    # 已存在的文件按摘要确认，不再传输内容
+    server.RequestHandlerClass.requests.clear()
+    handler = HttpProtocolHandler()
+    assert handler(Resources(uri, tmp_path / 'file', http_stream=True)) is Result.EXIST
+    assert server.RequestHandlerClass.requests == [('HEAD', None)]
+
+    # 大小相同但内容不同的文件被重新下载
+    (tmp_path / 'file').write_bytes(b'\0' * len(DATA))
+    handler = HttpProtocolHandler()
+    assert handler(Resources(uri, tmp_path / 'file', http_stream=True)) is Result.SUCCESS
+    assert (tmp_path / 'file').read_bytes() == DATA
+
+
+def test_expected_checksum_mismatch(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/file'
+    handler = HttpProtocolHandler()
+    result = handler(Resources(uri, tmp_path / 'file', http_stream=True, retry=1, retry_delay=0,
+                               checksum=f'md5:{hashlib.md5(b"other").hexdigest()}'))
+    assert result is Result.FAILURE
+    assert not (tmp_path / 'file').exists()
+
+
+def test_corrupt_slice_downloaded_again(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/file'
+    server.RequestHandlerClass.corrupt.add('bytes=4096-8191')
+    handler = HttpProtocolHandler()
+    result = handler(Resources(uri, tmp_path / 'file', http_slice_threshold=1024, http_sliced_chunk_size=4096,
+                               retry=2, retry_delay=0))
+    assert result is Result.SUCCESS
+    assert (tmp_path / 'file').read_bytes() == DATA
+    assert handler.stats.retries == 1
+    ranges = [value for method, value in server.RequestHandlerClass.requests if method == 'GET' and value]
+    # 重试时只有损坏的切片被再次请求
+    assert ranges.count('bytes=4096-8191') == 2
+    assert ranges.count('bytes=0-4095') == 1
+
+
+def test_verified_slices_kept_on_mismatch(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/file'
+    handler = HttpProtocolHandler()
+    result = handler(Resources(uri, tmp_path / 'file', http_slice_threshold=1024, http_sliced_chunk_size=4096,
+                               retry=2, retry_delay=0, checksum=f'md5:{hashlib.md5(b"other").hexdigest()}'))
+    assert result is Result.FAILURE
+    assert handler.stats.retries == 1
+    assert not (tmp_path / 'file').exists()
+    # 切片已按区间摘要校验，保留在磁盘上，重试时不再传输
+    slices = [path for path in tmp_path.rglob('*') if path.is_file()]
+    assert sum(path.stat().st_size for path in slices) == len(DATA)
+    ranges = [value for method, value in server.RequestHandlerClass.requests if method == 'GET' and value]
+    assert ranges.count('bytes=0-4095') == 1
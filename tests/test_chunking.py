@@ -0,0 +1,73 @@
+import asyncio
+
+from yundownload.utils.chunking import ChunkSizer
+
+
+def test_fixed_bounds():
+    sizer = ChunkSizer(minimum=4096, maximum=4096, initial=1024 * 1024)
+    assert sizer.size == 4096
+    sizer.record(4096, 0.000001, 0.01)
+    assert sizer.size == 4096
+
+
+def test_size_follows_throughput():
+    sizer = ChunkSizer(minimum=1024, maximum=64 * 1024 * 1024, initial=64 * 1024)
+    # 快速链路且每块固定开销 1ms：放大到上限附近
+    for _ in range(20):
+        sizer.record(sizer.size, sizer.size / 1e9, 0.001)
+    fast = sizer.size
+    assert fast >= 16 * 1024 * 1024
+    # 链路降到 10 KB/s：不超过 0.5 秒的数据
+    for _ in range(60):
+        sizer.record(sizer.size, sizer.size / 10_000, 0.001)
+    assert sizer.size <= 8192
+    assert sizer.size & (sizer.size - 1) == 0
+
+
+def test_size_ignores_per_byte_cost():
+    sizer = ChunkSizer(minimum=1024, maximum=64 * 1024 * 1024, initial=64 * 1024)
+    # 开销完全与大小成正比时增大分块没有收益
+    for _ in range(40):
+        sizer.record(sizer.size, sizer.size / 1e9, sizer.size / 1e9)
+    assert sizer.fixed_cost < 1e-6
+    assert sizer.size < 1024 * 1024
+
+
+def test_chunks_regroup_pieces():
+    sizer = ChunkSizer(minimum=100, maximum=100, initial=100)
+    pieces = [b'a' * 30] * 11
+    chunks = list(sizer.chunks(pieces, length=330))
+    assert [len(chunk) for chunk in chunks] == [120, 120, 90]
+    assert b''.join(chunks) == b'a' * 330
+
+    async def pieces_async():
+        for piece in pieces:
+            yield piece
+
+    async def collect():
+        return [chunk async for chunk in sizer.achunks(pieces_async())]
+
+    assert b''.join(asyncio.run(collect())) == b'a' * 330
+
+
+def test_chunks_flush_slow_link(monkeypatch):
+    sizer = ChunkSizer(minimum=1024, maximum=1024, initial=1024)
+    clock = iter(range(100))
+    monkeypatch.setattr('yundownload.utils.chunking.time.perf_counter', lambda: next(clock))
+    # 每个片段间隔 1 秒，超过 MAX_INTERVAL 后不再等待凑满一块
+    assert [len(chunk) for chunk in sizer.chunks([b'a' * 10] * 3)] == [10, 10, 10]
+
+
+def test_reads_stop_at_length():
+    sizer = ChunkSizer(minimum=64, maximum=64, initial=64)
+    data = bytearray(b'x' * 1000)
+    calls = []
+
+    def read(size):
+        calls.append(size)
+        chunk = bytes(data[:size])
+        del data[:size]
+        return chunk
+
+    assert len(b''.join(sizer.reads(read, 100))) == 100
+    assert calls == [64, 36]
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from yundownload import Resources, Result
+from yundownload.network.http import HttpProtocolHandler
+from yundownload.utils.tools import convert_slice_path
+
+DATA = b'id,name,value\n' + b''.join(b'%d,row-%d,%d\n' % (i, i, i * 7) for i in range(20000))
+ENCODED = gzip.compress(DATA)
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """请求接受 gzip 时返回压缩后的内容"""
+    protocol_version = 'HTTP/1.1'
+    requests: list = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):  # noqa
+        self._serve(False)
+
+    def do_GET(self):  # noqa
+        self._serve(True)
+
+    def _serve(self, body: bool):
+        encoding = self.headers.get('Accept-Encoding', '')
+        self.requests.append((self.command, encoding, self.headers.get('Range')))
+        data = ENCODED if 'gzip' in encoding else DATA
+        self.send_response(200)
+        if data is ENCODED:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    handler = type('GzipHandler', (GzipHandler,), {'requests': []})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_compressed_transfer(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/data.csv'
+    save_path = tmp_path / 'data.csv'
+    # 上次中断留下的解码文件从头重新写入
+    partial_path = convert_slice_path(save_path)('decoded')
+    partial_path.write_bytes(b'stale')
+    handler = HttpProtocolHandler()
+    result = handler(Resources(uri, save_path, http_compression=True,
+                               checksum=f'sha256:{hashlib.sha256(DATA).hexdigest()}'))
+    assert result is Result.SUCCESS
+    assert save_path.read_bytes() == DATA
+    assert not partial_path.exists()
+    # 统计的是网络上传输的编码字节
+    assert handler.stats.bytes == len(ENCODED) < len(DATA)
+    assert handler.stats.checksum == f'sha256:{hashlib.sha256(DATA).hexdigest()}'
+    assert all('gzip' in encoding for _, encoding, _ in server.RequestHandlerClass.requests)
+
+    server.RequestHandlerClass.requests.clear()
+    handler = HttpProtocolHandler()
+    assert handler(Resources(uri, save_path, http_compression=True)) is Result.EXIST
+    assert [method for method, _, _ in server.RequestHandlerClass.requests] == ['HEAD']
+
+
+def test_identity_by_default(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/data.csv'
+    handler = HttpProtocolHandler()
+    assert handler(Resources(uri, tmp_path / 'data.csv')) is Result.SUCCESS
+    assert (tmp_path / 'data.csv').read_bytes() == DATA
+    assert handler.stats.bytes == len(DATA)
+    assert all(encoding == 'identity' for _, encoding, _ in server.RequestHandlerClass.requests)
@@ -0,0 +1,64 @@
+import os
+
+from yundownload import Downloader, Resources, Result
+from yundownload.utils.content import ContentStore, link_file
+
+
+def test_identical_in_flight_requests_share_one_download(tmp_path, make_downloader):
+    with make_downloader(dedupe=True) as downloader:
+        first = downloader.submit(Resources('http://host/file', tmp_path / 'a' / '0.2'))
+        same = downloader.submit(Resources('http://host/file', tmp_path / 'a' / '0.2'))
+        other_path = downloader.submit(Resources('http://host/file', tmp_path / 'b' / '0.2'))
+        assert same is first
+        assert first.state is Result.SUCCESS and other_path.state is Result.SUCCESS
+        assert downloader._download_pool.started == 1
+        assert (tmp_path / 'b' / '0.2').read_text() == 'http://host/file'
+
+        again = downloader.submit(Resources('http://host/file', tmp_path / 'a' / '0.2'))
+        assert again is not first
+        again.wait()
+        assert downloader._download_pool.started == 2
+
+
+def test_request_key():
+    key = Downloader._request_key
+    assert key(Resources('http://host/file', 'a')) == key(Resources('http://host/file', 'b'))
+    # 请求头、Cookie、认证与代理不同的请求可能得到不同的内容
+    for options in ({'http_headers': {'Authorization': 'Bearer x'}}, {'http_cookies': {'session': 'x'}},
+                    {'http_auth': ('user', 'password')}, {'http_proxy': {'http': 'http://proxy:8080'}}):
+        assert key(Resources('http://host/file', 'a')) != key(Resources('http://host/file', 'a', **options))
+
+
+def test_dedupe_off_by_default():
+    with Downloader() as downloader:
+        assert not downloader.dedupe
+
+
+def test_content_store_links_duplicates(tmp_path):
+    store = ContentStore(tmp_path / 'store', link_mode='hardlink')
+    first = tmp_path / 'first.bin'
+    second = tmp_path / 'second.bin'
+    first.write_bytes(b'payload')
+    second.write_bytes(b'payload')
+    key = store.etag_key('http://host/first.bin', '"abc"', 7)
+    digest = store.add(first, key)
+    assert store.add(second) == digest
+    assert os.path.samefile(first, second)
+
+    target = tmp_path / 'mirror' / 'third.bin'
+    assert store.materialize(store.etag_key('http://host/first.bin', '"abc"', 7), target)
+    assert target.read_bytes() == b'payload'
+    # 同一主机上 ETag 与大小相同的其他文件可能内容不同
+    assert not store.materialize(store.etag_key('http://host/other/path', '"abc"', 7), tmp_path / 'y')
+    assert not store.materialize(store.etag_key('http://mirror/first.bin', '"abc"', 7), tmp_path / 'x')
+    assert store.etag_key('http://host/first.bin', 'W/"abc"', 7) is None
+
+
+def test_link_file_falls_back_to_copy(tmp_path):
+    source = tmp_path / 'source'
+    source.write_bytes(b'data')
+    target = tmp_path / 'target'
+    target.write_bytes(b'partial')
+    assert link_file(source, target, 'copy') == 'copy'
+    assert target.read_bytes() == b'data' and not os.path.samefile(source, target)
+    assert link_file(source, tmp_path / 'auto') in ('reflink', 'hardlink', 'copy')
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+from yundownload import Resources
+from yundownload.core.downloader import Downloader
+
+HEAVY_MODULES = ('httpx', 'httpcore', 'paramiko', 'm3u8', 'Crypto', 'aiofiles')
+
+
+def import_times(statement: str) -> dict[str, int]:
+    """``python -X importtime`` 的累计导入耗时（微秒）"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_does_not_load_protocol_dependencies():
+    times = import_times('import yundownload')
+    loaded = sorted(module for module in times if module.split('.')[0] in HEAVY_MODULES)
+    assert loaded == [], f"import yundownload took {times['yundownload'] / 1000:.1f} ms and loaded {loaded}"
+
+
+def test_protocol_imported_on_first_match():
+    times = import_times(
+        "from yundownload import Downloader, Resources; "
+        "Downloader()._match_protocol(Resources('sftp://host/file', 'file'))"
+    )
+    assert 'paramiko' in times
+    assert 'httpx' not in times and 'm3u8' not in times
+
+
+def test_lazy_protocol_matching():
+    with Downloader() as downloader:
+        match = downloader._match_protocol
+        assert match(Resources('https://host/a.m3u8?x=1', 'a')).__name__ == 'M3U8ProtocolHandler'
+        assert match(Resources('HTTP://host/a.bin', 'a')).__name__ == 'HttpProtocolHandler'
+        assert match(Resources('ftp://host/a', 'a')).__name__ == 'FTPProtocolHandler'
@@ -0,0 +1,67 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+from yundownload.utils.logger import Logger
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.name, self.format(record), threading.current_thread().name))
+
+
+def make_logger():
+    logger = Logger()
+    capture = Capture()
+    logger.handlers = [capture]
+    return logger, capture
+
+
+def test_subsystem_levels():
+    logger, capture = make_logger()
+    http = logger.subsystem('http')
+    http.debug('hidden %s', 1)
+    logger.set_levels('http=DEBUG, m3u8=warning')
+    http.debug('slice %s-%s', 0, 99)
+    logger.subsystem('m3u8').info('hidden')
+    logger.subsystem('ftp').info('inherited')
+    logger.set_levels({'*': 'ERROR'})
+    logger.subsystem('ftp').info('hidden')
+    assert [(name, message) for name, message, _ in capture.records] == [
+        ('download.http', 'slice 0-99'), ('download.ftp', 'inherited')]
+
+
+def test_queue_formats_in_listener_thread():
+    logger, capture = make_logger()
+    logger.use_queue()
+    logger.info('queued %s', 'message')
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.error('failed', exc_info=True)
+    logger.stop_queue()
+    assert logger.handlers == [capture]
+    assert capture.records[0][1:] == ('queued message', capture.records[1][2])
+    assert capture.records[0][2] != threading.current_thread().name
+    assert 'ValueError: boom' in capture.records[1][1]
+
+
+def test_queue_is_flushed_when_pool_workers_exit():
+    code = ('from concurrent.futures import ProcessPoolExecutor\n'
+            'from yundownload.utils.logger import logger\n'
+            'def work():\n'
+            '    for index in range(5000):\n'
+            '        logger.subsystem("http").info("from worker %s", index)\n'
+            'if __name__ == "__main__":\n'
+            '    with ProcessPoolExecutor(1) as pool:\n'
+            '        pool.submit(work).result()\n')
+    env = dict(os.environ, YUNDOWNLOAD_LOG_QUEUE='1')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env,
+                            check=True, timeout=60).stderr
+    assert 'from worker 4999' in output
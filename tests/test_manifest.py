@@ -0,0 +1,52 @@
+import json
+
+from yundownload import Resources, Result
+from yundownload.core.manifest import read_manifest
+
+
+def test_read_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / 'tasks.jsonl'
+    jsonl.write_text(json.dumps({'uri': 'http://host/a', 'save_path': 'a', 'retry': 5}) + '\n\n' +
+                     json.dumps({'uri': 'http://host/b', 'save_path': 'b', 'priority': 3}) + '\n')
+    entries = list(read_manifest(jsonl, base_dir=tmp_path))
+    assert entries[0] == {'uri': 'http://host/a', 'save_path': tmp_path / 'a', 'retry': 5}
+    assert entries[1]['priority'] == 3
+
+    csv_path = tmp_path / 'tasks.csv'
+    csv_path.write_text('uri,save_path,retry,http_headers\n'
+                        'http://host/a,a,3,"{""x"": ""1""}"\n'
+                        'http://host/b,b,,\n')
+    entries = list(read_manifest(csv_path))
+    assert entries[0] == {'uri': 'http://host/a', 'save_path': 'a', 'retry': 3, 'http_headers': {'x': '1'}}
+    assert entries[1] == {'uri': 'http://host/b', 'save_path': 'b'}
+
+
+def test_submit_many_bounded_window_completion_order(tmp_path, make_downloader):
+    pulled = 0
+
+    def items():
+        nonlocal pulled
+        for index, delay in enumerate(('0.6', '0.05', '0.1', '0.05', '0.05', '0.05')):
+            pulled += 1
+            yield {'uri': f'http://host/{index}', 'save_path': tmp_path / str(index) / delay}
+
+    with make_downloader(workers=2) as downloader:
+        finished = []
+        for future in downloader.submit_many(items(), window=3):
+            assert pulled - len(finished) <= 3
+            assert future.state is Result.SUCCESS
+            finished.append(future.resources.save_path.name)
+    assert len(finished) == 6
+    # 慢任务最先提交但最后完成
+    assert finished[-1] == '0.6'
+
+
+def test_submit_many_close_cancels_pending(tmp_path, make_downloader):
+    with make_downloader(workers=1) as downloader:
+        futures = downloader.submit_many(
+            (Resources(f'http://host/{i}', tmp_path / '0.05') for i in range(100)), window=4)
+        first = next(futures)
+        futures.close()
+        assert first.state is Result.SUCCESS
+    # 已取消的任务在出队时被跳过
+    assert downloader._download_pool.started <= 2
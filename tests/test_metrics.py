@@ -0,0 +1,59 @@
+import urllib.request
+
+from yundownload import MetricsRegistry, Result, TransferStats
+from yundownload.utils.metrics import DownloadMetrics
+from yundownload.utils.trace import TimingSummary
+
+
+def test_render_text_format():
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests', ('host',)).inc(2, host='a"b')
+    registry.gauge('active', 'Active').set(3)
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 5):
+        histogram.observe(value)
+    text = registry.render()
+    assert 'requests_total{host="a\\"b"} 2' in text
+    assert '# TYPE active gauge\nactive 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+
+
+def test_download_metrics_from_scheduler(make_scheduler, submit):
+    pool, slots, scheduler = make_scheduler(workers=2)
+    registry = MetricsRegistry()
+    metrics = DownloadMetrics(registry, scheduler)
+    scheduler.on_finish = metrics.record
+    submit(scheduler, 'a')
+    submit(scheduler, 'b')
+    submit(scheduler, 'c')
+    slots.array[1 * slots.FIELDS + slots.SPEED] = 1024
+    text = registry.render()
+    assert 'yundownload_active_transfers 2' in text
+    assert 'yundownload_queued_tasks 1' in text
+    assert 'yundownload_throughput_bytes_per_second{protocol="http",host="host"} 1024.0' in text
+
+    timings = TimingSummary()
+    for phase, duration in (('connect', 0.003), ('ttfb', 0.02), ('ttfb', 0.2)):
+        timings.observe(phase, duration)
+    stats = TransferStats('stream', bytes=4096, wall_time=2.0, ttfb=0.2, retries=1, timings=timings)
+    pool.finish('http://host/a', (Result.SUCCESS, stats))
+    pool.finish('http://host/b', (Result.FAILURE, None))
+    text = registry.render()
+    assert 'yundownload_bytes_total{protocol="http",host="host"} 4096' in text
+    assert 'yundownload_retries_total{protocol="http",host="host"} 1' in text
+    assert 'yundownload_errors_total{protocol="http",host="host"} 1' in text
+    assert 'yundownload_downloads_total{protocol="http",host="host",result="success"} 1' in text
+    assert 'yundownload_ttfb_seconds_count{protocol="http"} 1' in text
+    assert 'yundownload_request_phase_seconds_bucket{protocol="http",phase="ttfb",le="0.025"} 1' in text
+    assert 'yundownload_request_phase_seconds_count{protocol="http",phase="ttfb"} 2' in text
+    assert 'yundownload_request_phase_seconds_count{protocol="http",phase="connect"} 1' in text
+
+    server = registry.serve(port=0)
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+            assert 'yundownload_active_transfers 1' in response.read().decode()
+    finally:
+        registry.close()
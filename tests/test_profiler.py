@@ -0,0 +1,53 @@
+import threading
+import time
+
+from yundownload import Downloader, Resources, Result
+from yundownload.network.base import BaseProtocolHandler
+from yundownload.utils import TaskProfiler, summarize_profiles
+from yundownload.utils.profiler import run_coroutine
+
+
+def spin():
+    return sum(i * i for i in range(200_000))
+
+
+class BlockingHandler(BaseProtocolHandler):
+    """在事件循环中阻塞 0.2 秒，并在单独线程中计算"""
+
+    @staticmethod
+    def check_protocol(uri: str) -> bool:
+        return True
+
+    def download(self, resources):
+        super().download(resources)
+
+        async def block():
+            time.sleep(0.2)
+
+        run_coroutine(block())
+        # 失败的断言使任务失败
+        assert TaskProfiler.current().slow_callbacks == 1
+        thread = threading.Thread(target=spin)
+        thread.start()
+        thread.join()
+        return Result.SUCCESS
+
+    def close(self):
+        pass
+
+
+def test_profile_every_task(tmp_path):
+    with Downloader(profile=tmp_path / 'profiles') as downloader:
+        downloader.lock_protocol(BlockingHandler)
+        futures = [downloader.submit(Resources(f'http://host/{name}', tmp_path / name)) for name in ('a', 'b')]
+        for future in futures:
+            future.wait()
+            assert future.state is Result.SUCCESS
+
+    reports = sorted((tmp_path / 'profiles').glob('*.txt'))
+    assert len(reports) == 2 and len(list((tmp_path / 'profiles').glob('*.prof'))) == 2
+    report = reports[0].read_text()
+    assert 'slow callbacks (>0.1s): 1' in report
+    assert 'threads: 2' in report
+    assert 'spin' in report
+    assert summarize_profiles(tmp_path / 'profiles').startswith('2 task profiles')
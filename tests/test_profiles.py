@@ -0,0 +1,77 @@
+import json
+import time
+
+from yundownload.utils.equilibrium import AIMDConcurrencyController
+from yundownload.utils.profiles import HostProfileStore
+
+URI = 'https://Example.com:8443/file.bin'
+
+
+def converged(concurrency: float = 10, requests: int = 20) -> AIMDConcurrencyController:
+    controller = AIMDConcurrencyController(min_concurrency=2, max_concurrency=30)
+    for _ in range(requests):
+        controller.record_result(0.05, True)
+    controller.current_concurrency = concurrency
+    return controller
+
+
+def write_profile(path, updated_at: float, concurrency: float = 10, base_response_time: float = 0.05):
+    path.write_text(json.dumps({HostProfileStore.host_key(URI): {
+        'concurrency': concurrency, 'base_response_time': base_response_time,
+        'failure_rate': 0, 'updated_at': updated_at}}))
+
+
+def test_persisted_across_instances(tmp_path):
+    path = tmp_path / 'profiles' / 'hosts.json'
+    store = HostProfileStore(path)
+    store.record(URI, converged())
+    assert path.is_file()
+
+    profile = HostProfileStore(path).get('https://example.com:8443/other')
+    assert profile['concurrency'] == 10 and profile['base_response_time'] == 0.05
+    # 请求数不足的控制器尚未收敛，不会覆盖已有的记录
+    store.record(URI, converged(concurrency=3, requests=5))
+    assert HostProfileStore(path).get(URI)['concurrency'] == 10
+
+    store.clear()
+    assert not path.exists() and HostProfileStore(path).get(URI) is None
+
+
+def test_warm_start_new_controller(tmp_path):
+    path = tmp_path / 'hosts.json'
+    write_profile(path, time.time())
+    controller = AIMDConcurrencyController(min_concurrency=2, max_concurrency=30)
+    assert HostProfileStore(path).warm_start(URI, controller)
+    assert round(controller.current_concurrency) == 10
+    # 跳过慢启动，并沿用记录的基准响应时间
+    assert controller.slow_start_threshold == controller.current_concurrency
+    assert controller.baseline_response_time == 0.05
+    assert not HostProfileStore(path).warm_start('https://other.com/file.bin', AIMDConcurrencyController())
+
+
+def test_half_life_decay(tmp_path):
+    path = tmp_path / 'hosts.json'
+    write_profile(path, time.time() - 2 * 3600)
+    controller = AIMDConcurrencyController(min_concurrency=2, max_concurrency=30)
+    assert HostProfileStore(path, half_life=3600).warm_start(URI, controller)
+    # 两个半衰期后只保留四分之一的差值，过旧的基准响应时间被丢弃
+    assert abs(controller.current_concurrency - 4) < 0.01
+    assert controller.baseline_response_time is None
+
+
+def test_corrupt_or_unreadable_file(tmp_path):
+    path = tmp_path / 'hosts.json'
+    path.write_text('{not json')
+    store = HostProfileStore(path)
+    assert store.get(URI) is None
+    # 损坏的文件在下次记录时被替换
+    store.record(URI, converged())
+    assert json.loads(path.read_text())[HostProfileStore.host_key(URI)]['concurrency'] == 10
+
+    directory = tmp_path / 'directory'
+    directory.mkdir()
+    store = HostProfileStore(directory)
+    assert store.get(URI) is None
+    store.record(URI, converged())
+    # 无法持久化时仍保留在内存中
+    assert store.get(URI)['concurrency'] == 10
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from yundownload import Resources, Result, WorkerFuture
+from yundownload.core.scheduler import DownloadScheduler
+from yundownload.network import HttpProtocolHandler
+from yundownload.utils.work import TaskSlots, TaskSlot
+
+
+class PublishingPool:
+    """Publishes progress into the task slot like a worker would"""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.executor = ThreadPoolExecutor(2)
+        self.step = threading.Semaphore(0)
+
+    def run_download(self, protocol, resources, slot):
+        return self.executor.submit(self._run, TaskSlot(self.slots, slot))
+
+    def _run(self, task_slot):
+        for done in (256, 768, 1024):
+            self.step.acquire()
+            task_slot.publish(done, 1024, 0, 0, done * 2.0, 4)
+        return Result.SUCCESS
+
+
+def test_progress_from_shared_slot():
+    slots = TaskSlots(1)
+    pool = PublishingPool(slots)
+    scheduler = DownloadScheduler(pool, slots)
+    resources = Resources('http://host/a', 'a')
+    task = scheduler.schedule(HttpProtocolHandler, resources)
+    future = WorkerFuture(task.future, HttpProtocolHandler, resources, task)
+    assert future.progress.bytes_done == 0
+
+    events = []
+
+    async def watch():
+        async for progress in future.events(interval=0.01):
+            events.append(progress)
+            pool.step.release()
+
+    asyncio.run(watch())
+    assert future.state is Result.SUCCESS
+    # 初始的空进度、两次中间进度和最终进度
+    assert [progress.bytes_done for progress in events] == [0, 256, 768, 1024]
+    final = future.progress
+    assert (final.bytes_done, final.total, final.concurrency) == (1024, 1024, 4)
+    assert final.fraction == 1.0
+    assert slots.available() == 1
@@ -0,0 +1,56 @@
+import threading
+
+from yundownload import Resources
+from yundownload.utils.reporter import ProgressReporter, _Transfer
+from yundownload.utils.work import TaskSlots, TaskSlot
+
+
+class Handler:
+    """进度报告只读取处理器的计数器"""
+
+    def __init__(self, uri, slots=None):
+        self.resources = Resources(uri, 'file')
+        self.current_size = 0
+        self._resumed_size = 0
+        self._total_size = 1000
+        self._steps = 0
+        self._total = 0
+        self._peak_speed = 0
+        self._peak_concurrency = 0
+        self.snapshot = None
+        self.task_slot = TaskSlot(slots, 0) if slots else None
+
+    progress = 0
+
+
+def test_smoothed_speed_and_eta():
+    reporter = ProgressReporter(half_life=1)
+    handler = Handler('http://host/a')
+    transfer = _Transfer(handler, 0)
+    handler.current_size = 100
+    assert reporter._sample(transfer, 1).speed == 100
+    handler.current_size = 400
+    snapshot = reporter._sample(transfer, 2)
+    # 间隔等于半衰期，新速率占一半权重
+    assert snapshot.speed == 200
+    assert snapshot.eta == 3
+    assert handler._peak_speed == 300
+    handler.current_size = 0
+    assert reporter._sample(transfer, 3).speed == 100
+
+
+def test_one_thread_for_all_transfers():
+    slots = TaskSlots(1)
+    reporter = ProgressReporter(interval=0.01, log_every=60)
+    handlers = [Handler(f'http://host/{index}', slots if index == 0 else None) for index in range(20)]
+    before = threading.active_count()
+    for handler in handlers:
+        reporter.register(handler)
+    assert threading.active_count() == before + 1
+    handlers[0].current_size = 512
+    final = reporter.unregister(handlers[0])
+    assert final.bytes_done == 512 and handlers[0].snapshot is final
+    assert slots.get(0, TaskSlots.BYTES_DONE) == 512
+    for handler in handlers[1:]:
+        reporter.unregister(handler)
+    assert reporter.snapshot(handlers[1]) is None
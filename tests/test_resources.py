@@ -0,0 +1,72 @@
+import pickle
+
+import pytest
+
+from yundownload import Resources, HttpOptions
+from yundownload.utils.equilibrium import AIMDConcurrencyController
+
+
+def test_option_groups_shared_by_reference():
+    first = Resources('http://host/a', 'a')
+    second = Resources('http://host/b', 'b')
+    assert first.http is second.http and first.ftp is second.ftp
+
+    headers = {'User-Agent': 'test'}
+    first = Resources('http://host/a', 'a', http_headers=headers)
+    second = Resources('http://host/b', 'b', http_headers=headers)
+    assert first.http is second.http
+    assert first.http_headers == headers
+
+
+def test_flat_options_copy_on_write():
+    options = HttpOptions(timeout=5, headers={'a': 'b'})
+    resources = Resources('http://host/a', 'a', http=options, http_verify=True)
+    assert resources.http_timeout == 5 and resources.http_verify
+    assert not options.verify
+
+    resources = Resources('http://host/a', 'a', http=options)
+    resources.http_timeout = 9
+    assert options.timeout == 5 and resources.http_timeout == 9
+    with pytest.raises(AttributeError):
+        options.timeout = 1
+
+    resources.lock()
+    with pytest.raises(AttributeError):
+        resources.http_timeout = 1
+    resources.semaphore = None
+
+
+def test_pickle_without_controller():
+    resources = Resources('http://host/a', 'a', concurrency_strategy='aimd', max_concurrency=8)
+    resources.lock()
+    assert isinstance(resources.dcc, AIMDConcurrencyController)
+    payload = pickle.dumps(resources)
+    assert b'AIMDConcurrencyController' not in payload
+
+    restored = pickle.loads(payload)
+    assert restored.http is resources.http
+    assert restored._dcc is None
+    assert isinstance(restored.dcc, AIMDConcurrencyController)
+    assert restored.dcc.max_concurrency == 8
+    with pytest.raises(AttributeError):
+        restored.uri = 'http://host/b'
+
+
+def test_dict_options_not_shared():
+    headers = {'User-Agent': 'test'}
+    first = Resources('http://host/a', 'a', http_headers=headers)
+    second = Resources('http://host/b', 'b', http_headers=headers)
+    first.http_headers['Accept'] = '*/*'
+    first.http_proxy['http'] = 'http://proxy:8080'
+    assert first.http_headers == {'User-Agent': 'test', 'Accept': '*/*'}
+    assert first.http_proxy == {'http': 'http://proxy:8080'}
+    # 其他资源、调用者的字典与默认选项都不受影响
+    assert second.http_headers == {'User-Agent': 'test'} and second.http_proxy == {}
+    assert Resources('http://host/c', 'c').http_proxy == {}
+    assert headers == {'User-Agent': 'test'}
+
+    restored = pickle.loads(pickle.dumps(first))
+    assert restored.http_headers == first.http_headers and restored.http_proxy == first.http_proxy
+    second.lock()
+    second.http_headers['Accept'] = '*/*'
+    assert second.http_headers == {'User-Agent': 'test'}
@@ -0,0 +1,105 @@
+from yundownload import Resources, Result
+from yundownload.network import HttpProtocolHandler
+from yundownload.utils.work import TaskSlots
+
+
+def started(pool):
+    return [uri.rsplit('/', 1)[-1] for uri, _, _ in pool.started]
+
+
+def test_priority_before_submission_order(make_scheduler, submit):
+    pool, _, scheduler = make_scheduler()
+    submit(scheduler, 'running')
+    submit(scheduler, 'bulk')
+    submit(scheduler, 'urgent', priority=10)
+    pool.finish('http://host/running')
+    assert started(pool) == ['running', 'urgent']
+
+
+def test_fair_share_between_tenants(make_scheduler, submit):
+    pool, _, scheduler = make_scheduler()
+    submit(scheduler, 'a0', tenant='a')
+    for index in range(1, 4):
+        submit(scheduler, f'a{index}', tenant='a')
+    submit(scheduler, 'b0', tenant='b')
+    submit(scheduler, 'b1', tenant='b')
+    for name in ['a0', 'a1', 'b0', 'a2', 'b1']:
+        pool.finish(f'http://host/{name}')
+    assert started(pool) == ['a0', 'a1', 'b0', 'a2', 'b1', 'a3']
+
+
+def test_deadline_jumps_queue(make_scheduler, submit):
+    pool, _, scheduler = make_scheduler()
+    submit(scheduler, 'running')
+    submit(scheduler, 'high', priority=5)
+    submit(scheduler, 'due', deadline=1)
+    pool.finish('http://host/running')
+    assert started(pool) == ['running', 'due']
+
+
+def test_preempted_task_is_requeued(make_scheduler, submit):
+    pool, slots, scheduler = make_scheduler()
+    bulk = submit(scheduler, 'bulk')
+    urgent = submit(scheduler, 'urgent', priority=10)
+    assert slots.get(0, TaskSlots.CONTROL) == TaskSlots.PREEMPT
+    pool.finish('http://host/bulk', Result.WAIT)
+    assert not bulk.done()
+    pool.finish('http://host/urgent')
+    assert urgent.result() is Result.SUCCESS
+    pool.finish('http://host/bulk')
+    assert bulk.result() is Result.SUCCESS
+    assert started(pool) == ['bulk', 'urgent', 'bulk']
+
+
+def test_cancel_queued_task(make_scheduler, submit):
+    pool, _, scheduler = make_scheduler()
+    submit(scheduler, 'running')
+    queued = submit(scheduler, 'queued')
+    assert queued.cancel()
+    pool.finish('http://host/running')
+    scheduler.join()
+    assert started(pool) == ['running']
+
+
+def test_cancel_running_task(make_scheduler):
+    pool, slots, scheduler = make_scheduler()
+    task = scheduler.schedule(HttpProtocolHandler, Resources('http://host/big', 'big'))
+    assert scheduler.cancel(task)
+    assert slots.get(0, TaskSlots.CONTROL) == TaskSlots.CANCEL
+    # 工作进程在数据块边界停止
+    pool.finish('http://host/big', Result.CANCEL)
+    assert task.future.result() is Result.CANCEL
+    assert not scheduler.cancel(task)
+    assert slots.available() == 1
+
+
+def test_pause_and_resume_running_task(make_scheduler, submit):
+    pool, slots, scheduler = make_scheduler()
+    task = scheduler.schedule(HttpProtocolHandler, Resources('http://host/big', 'big'))
+    submit(scheduler, 'next')
+    assert scheduler.pause(task)
+    assert slots.get(0, TaskSlots.CONTROL) == TaskSlots.PAUSE
+    pool.finish('http://host/big', Result.WAIT)
+    # 暂停的任务让出工作进程且不重新排队
+    assert not task.future.done()
+    assert scheduler.paused == 1
+    assert started(pool) == ['big', 'next']
+    assert scheduler.resume(task)
+    pool.finish('http://host/next')
+    assert started(pool) == ['big', 'next', 'big']
+    assert slots.get(0, TaskSlots.CONTROL) == TaskSlots.RUN
+    pool.finish('http://host/big')
+    assert task.future.result() is Result.SUCCESS
+
+
+def test_pause_queued_task_then_cancel(make_scheduler, submit):
+    pool, _, scheduler = make_scheduler()
+    submit(scheduler, 'running')
+    task = scheduler.schedule(HttpProtocolHandler, Resources('http://host/queued', 'queued'))
+    assert scheduler.pause(task)
+    pool.finish('http://host/running')
+    scheduler.join()
+    assert started(pool) == ['running']
+    assert scheduler.cancel(task)
+    assert task.future.cancelled()
+    assert scheduler.paused == 0
@@ -0,0 +1,37 @@
+from yundownload.utils.simulation import (
+    simulate,
+    BandwidthServer,
+    LatencyGrowthServer,
+    ThrottlingServer,
+    FlakyServer,
+)
+
+PER_CONNECTION = BandwidthServer(100e6, per_connection=5e6, request_size=10 * 1024 * 1024)
+
+
+def test_deterministic():
+    server = FlakyServer(LatencyGrowthServer(), failure_rate=0.05)
+    first = simulate('gradient', server, duration=120, seed=7)
+    second = simulate('gradient', server, duration=120, seed=7)
+    assert first.as_dict() == second.as_dict()
+
+
+def test_aimd_converges_faster_than_default():
+    default = simulate('default', PER_CONNECTION, duration=120)
+    aimd = simulate('aimd', PER_CONNECTION, duration=120)
+    assert aimd.steady_state_concurrency == default.steady_state_concurrency == 30
+    assert aimd.convergence_time < default.convergence_time
+
+
+def test_shrink_limits_requests_in_flight():
+    server = ThrottlingServer(PER_CONNECTION, limit=12)
+    report = simulate('aimd', server, duration=120)
+    assert report.steady_state_concurrency <= 12
+    assert report.steady_state_throughput > 30e6
+
+
+def test_report_metrics():
+    report = simulate('bbr', BandwidthServer(50e6, request_size=10 * 1024 * 1024), duration=120)
+    assert 0 <= report.convergence_time <= 120
+    assert report.steady_state_throughput > 40e6
+    assert report.oscillation >= 0
@@ -0,0 +1,172 @@
+import asyncio
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from Crypto.Cipher import AES
+
+from yundownload import Downloader, Resources, Result
+from yundownload.utils.exceptions import DownloadException
+from yundownload.utils.sink import OrderedParts, Sink
+
+DATA = bytes(range(256)) * 16384
+KEY = bytes(range(16))
+IV = '0x' + '00' * 15 + '01'
+SEGMENTS = [bytes([index]) * 16 * 2500 for index in range(3)]
+PLAYLIST = ('#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n'
+            f'#EXT-X-KEY:METHOD=AES-128,URI="key",IV={IV}\n' +
+            ''.join(f'#EXTINF:10,\nseg{index}.ts\n' for index in range(len(SEGMENTS))) +
+            '#EXT-X-ENDLIST\n')
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """支持 Range 的文件与 AES-128 加密的 m3u8，truncate 为真时第一次完整请求只返回一半内容"""
+    protocol_version = 'HTTP/1.1'
+    requests: list = []
+    truncate = False
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):  # noqa
+        self._serve(False)
+
+    def do_GET(self):  # noqa
+        self._serve(True)
+
+    def _serve(self, body: bool):
+        self.requests.append((self.command, self.path, self.headers.get('Range')))
+        if self.path != '/file':
+            if self.path == '/video.m3u8':
+                data = PLAYLIST.encode()
+            elif self.path == '/key':
+                data = KEY
+            elif self.path == '/broken.m3u8':
+                data = PLAYLIST.replace('seg2.ts', 'odd.ts').encode()
+            elif self.path == '/odd.ts':
+                # 末尾多出不足一个块的字节
+                data = AES.new(KEY, AES.MODE_CBC, bytes.fromhex(IV[2:])).encrypt(SEGMENTS[2]) + b'odd'
+            else:
+                index = int(self.path[4:-3])
+                data = AES.new(KEY, AES.MODE_CBC, bytes.fromhex(IV[2:])).encrypt(SEGMENTS[index])
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if body:
+                self.wfile.write(data)
+            return
+        data = DATA
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(DATA) - 1
+            data = DATA[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(DATA)}')
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if not body:
+            return
+        if not match and self.truncate:
+            type(self).truncate = False
+            self.wfile.write(data[:len(data) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    handler = type('RangeHandler', (RangeHandler,), {'requests': [], 'truncate': False})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sliced_stream_in_order(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/file'
+    with Downloader() as downloader:
+        stream = downloader.stream(Resources(uri, tmp_path / 'file', http_slice_threshold=1024,
+                                             http_sliced_chunk_size=65536), buffer_size=65536)
+        assert b''.join(stream) == DATA
+    assert stream.result is Result.SUCCESS
+    assert stream.stats.mode == 'sliced'
+    assert stream.stats.slices == len(DATA) // 65536
+    # 不写入保存路径，也不留下切片文件
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_retry_resumes_after_delivered(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/file'
+    server.RequestHandlerClass.truncate = True
+    with Downloader() as downloader:
+        stream = downloader.stream(Resources(uri, tmp_path / 'file', http_stream=True, retry=2, retry_delay=0))
+        assert stream.read(100) == DATA[:100]
+        assert stream.read() == DATA[100:]
+        assert stream.read() == b''
+    assert stream.stats.retries == 1
+    ranges = [value for method, _, value in server.RequestHandlerClass.requests if method == 'GET' and value]
+    # 第二次尝试从已交付的位置继续
+    resumed = int(re.fullmatch(r'bytes=(\d+)-', ranges[-1]).group(1))
+    assert 0 < resumed <= len(DATA) // 2
+
+
+def test_m3u8_decrypted_in_order(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/video.m3u8'
+    chunks = []
+
+    class ListSink(Sink):
+        def write(self, data: bytes):
+            chunks.append(data)
+
+    with Downloader() as downloader:
+        assert downloader.download_to(Resources(uri, tmp_path / 'video.mp4'), ListSink()) is Result.SUCCESS
+    assert b''.join(chunks) == b''.join(SEGMENTS)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_m3u8_partial_block_fails(server, tmp_path):
+    uri = f'http://127.0.0.1:{server.server_address[1]}/broken.m3u8'
+    with Downloader() as downloader:
+        stream = downloader.stream(Resources(uri, tmp_path / 'video.mp4', retry=1))
+        with pytest.raises(DownloadException) as info:
+            stream.read()
+    assert stream.result is Result.FAILURE
+    assert 'not a whole block' in str(info.value.__cause__)
+
+
+def test_ordered_parts_bounded():
+    written = []
+
+    async def main():
+        parts = OrderedParts(written.append, 2, buffer_size=10)
+        await parts.write(1, b'b' * 8)
+        # 超出缓冲上限的后续部分等待前面的部分完成
+        blocked = asyncio.create_task(parts.write(1, b'c' * 8))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await parts.write(0, b'a' * 4)
+        assert written == [b'a' * 4]
+        parts.finish(0)
+        await blocked
+        parts.finish(1)
+        assert b''.join(written) == b'a' * 4 + b'b' * 8 + b'c' * 8
+
+        # 出错后等待中的部分抛出同一异常
+        parts = OrderedParts(written.append, 2, buffer_size=4)
+        await parts.write(1, b'x' * 4)
+        blocked = asyncio.create_task(parts.write(1, b'y'))
+        await asyncio.sleep(0.01)
+        error = OSError('boom')
+        parts.abort(error)
+        with pytest.raises(OSError):
+            await blocked
+
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from yundownload import Resources, Result
+from yundownload.network.http import HttpProtocolHandler
+from yundownload.network.m3u import M3U8ProtocolHandler
+from yundownload.utils.exceptions import InsufficientSpaceException
+from yundownload.utils.space import free_space, merged_path, preallocate, reserve
+
+HUGE = 1 << 50
+SEGMENTS = [bytes([index]) * 1000 for index in range(20)]
+PLAYLIST = ('#EXTM3U\n#EXT-X-TARGETDURATION:10\n' +
+            ''.join(f'#EXTINF:10,\n{index}.ts\n' for index in range(len(SEGMENTS))) + '#EXT-X-ENDLIST\n')
+
+
+class HugeHandler(BaseHTTPRequestHandler):
+    """声明一个远超磁盘容量的文件"""
+    protocol_version = 'HTTP/1.1'
+    requests: list = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):  # noqa
+        self.requests.append(self.command)
+        self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(HUGE))
+        self.end_headers()
+
+    def do_GET(self):  # noqa
+        self.requests.append(self.command)
+        self.send_response(500)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class PlaylistHandler(BaseHTTPRequestHandler):
+    """未加密的 m3u8，记录每个请求"""
+    protocol_version = 'HTTP/1.1'
+    requests: list = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):  # noqa
+        self._serve(False)
+
+    def do_GET(self):  # noqa
+        self._serve(True)
+
+    def _serve(self, body: bool):
+        self.requests.append(self.command)
+        data = PLAYLIST.encode() if self.path.endswith('.m3u8') else SEGMENTS[int(self.path[1:-3])]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+
+def test_reserve(tmp_path):
+    save_path = tmp_path / 'sub' / 'file'
+    # 目录尚未创建时按最近的已存在目录计算
+    assert free_space(save_path) > 0
+    with pytest.raises(InsufficientSpaceException):
+        reserve(save_path, HUGE)
+    parts = [tmp_path / 'part-0', tmp_path / 'part-1']
+    parts[0].write_bytes(b'\0' * 4096)
+    merged = reserve(tmp_path / 'file', 8192, parts)
+    assert merged == merged_path(tmp_path / 'file')
+    # 不支持预分配的文件系统上文件只会被创建
+    assert merged.stat().st_size in (0, 8192)
+    assert preallocate(tmp_path / 'other', 4096) is ((tmp_path / 'other').stat().st_size == 4096)
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_fails_before_transfer(tmp_path, stream):
+    handler_class = type('HugeHandler', (HugeHandler,), {'requests': []})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        handler = HttpProtocolHandler()
+        result = handler(Resources(f'http://127.0.0.1:{httpd.server_address[1]}/file', tmp_path / 'file',
+                                   http_stream=stream, http_sliced_chunk_size=1 << 40,
+                                   retry=3, retry_delay=0))
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert result is Result.FAILURE
+    assert isinstance(handler.error, InsufficientSpaceException)
+    # 不重试，也没有请求内容
+    assert handler_class.requests == ['HEAD']
+    assert handler.stats.retries == 0
+    assert not (tmp_path / 'file').exists()
+
+
+def test_m3u8_sizes_sampled(tmp_path):
+    handler_class = type('PlaylistHandler', (PlaylistHandler,), {'requests': []})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        handler = M3U8ProtocolHandler()
+        result = handler(Resources(f'http://127.0.0.1:{httpd.server_address[1]}/video.m3u8', tmp_path / 'video.ts'))
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert result is Result.SUCCESS
+    assert (tmp_path / 'video.ts').read_bytes() == b''.join(SEGMENTS)
+    # 只探测少量分段估算总大小，且不计入请求统计
+    assert 0 < handler_class.requests.count('HEAD') <= M3U8ProtocolHandler.SIZE_SAMPLES
+    assert handler.stats.timings.requests == len(SEGMENTS)
@@ -0,0 +1,74 @@
+import functools
+import pickle
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from yundownload import Resources, Result, TransferStats
+from yundownload.network.base import BaseProtocolHandler
+from yundownload.network.http import HttpProtocolHandler
+
+
+class FlakyHandler(BaseProtocolHandler):
+    """第一次尝试传输 100 字节后失败，第二次从已有的 300 字节续传"""
+
+    @staticmethod
+    def check_protocol(uri: str) -> bool:
+        return True
+
+    def download(self, resources):
+        super().download(resources)
+        self._total_size = 1000
+        self._mode = 'stream'
+        if self._attempts == 1:
+            self._mark_first_byte()
+            self.current_size += 100
+            raise IOError('connection reset')
+        self._add_resumed(300)
+        self.current_size += 700
+        return Result.SUCCESS
+
+    def close(self):
+        pass
+
+
+def test_stats_count_retries_and_resumed_bytes():
+    handler = FlakyHandler()
+    result = handler(Resources('http://host/file', 'file', retry=2, retry_delay=0))
+    stats = handler.stats
+    assert result is Result.SUCCESS
+    assert (stats.mode, stats.retries, stats.bytes, stats.resumed_bytes, stats.total_size) == \
+           ('stream', 1, 800, 300, 1000)
+    assert stats.ttfb is not None and stats.ttfb <= stats.wall_time
+    assert stats.peak_speed >= stats.speed > 0
+    assert stats.controller is None
+
+    copy = pickle.loads(pickle.dumps(stats))
+    assert isinstance(copy, TransferStats)
+    assert copy.to_dict() == stats.to_dict()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def test_http_request_timings(tmp_path):
+    (tmp_path / 'www').mkdir()
+    (tmp_path / 'www' / 'file').write_bytes(b'x' * 4096)
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 functools.partial(QuietHandler, directory=str(tmp_path / 'www')))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        handler = HttpProtocolHandler()
+        result = handler(Resources(f'http://127.0.0.1:{server.server_address[1]}/file', tmp_path / 'file'))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert result is Result.SUCCESS
+    timings = handler.stats.timings
+    # HEAD、Range 探测与下载请求
+    assert timings.requests == 3
+    assert timings.count('connect') >= 1 and timings.count('transfer') >= 1
+    assert timings.mean('ttfb') >= timings.mean('wait') > 0
+    assert handler.stats.to_dict()['timings']['requests'] == 3
+    assert pickle.loads(pickle.dumps(handler.stats)).timings.series == timings.series
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+
+from yundownload import Resources, Result, JobStore
+
+
+def test_job_lifecycle(tmp_path):
+    with JobStore(tmp_path / 'jobs.db', batch_size=2, commit_interval=60) as store:
+        first = Resources('http://host/a', tmp_path / 'a')
+        second = Resources('http://host/b', tmp_path / 'b')
+        store.add(first, priority=3, tenant='x')
+        store.add(second)
+        store.started(first)
+        (tmp_path / 'a').write_bytes(b'12345')
+        store.finished(first, Result.SUCCESS)
+        store.started(second)
+        store.finished(second, Result.FAILURE)
+        assert store.counts() == {'pending': 0, 'running': 0, 'failed': 1, 'done': 1, 'cancelled': 0}
+        assert store.remaining() == 0
+        assert store.remaining(include_failed=True) == 1
+        bytes_done, attempts = store._conn.execute(
+            'SELECT bytes_done, attempts FROM jobs WHERE key = ?', (store.job_key(first),)).fetchone()
+        assert (bytes_done, attempts) == (5, 1)
+
+        store.add(second)
+        entry, = store.unfinished()
+        assert entry['resources'].uri == 'http://host/b' and entry['tenant'] == 'default'
+
+
+def test_resume_after_crash(tmp_path, make_downloader):
+    path = tmp_path / 'jobs.db'
+    store = JobStore(path)
+    for name in ('a', 'b', 'c'):
+        store.add(Resources(f'http://host/{name}', tmp_path / '0.01'), priority=1)
+    store.started(Resources('http://host/a', tmp_path / '0.01'))
+    store.finished(Resources('http://host/c', tmp_path / '0.01'), Result.EXIST)
+    store.flush()
+    # 模拟父进程崩溃：不关闭数据库，直接重新打开
+    with make_downloader(job_store=path) as downloader:
+        resumed = sorted(future.resources.uri for future in downloader.resume())
+    assert resumed == ['http://host/a', 'http://host/b']
+    with JobStore(path) as store:
+        assert store.counts()['done'] == 3
+
+
+def test_unfinished_queries_use_partial_indexes(tmp_path):
+    with JobStore(tmp_path / 'jobs.db') as store:
+        for include_failed, index in ((False, 'jobs_retryable'), (True, 'jobs_unfinished')):
+            plan = store._conn.execute(
+                f'EXPLAIN QUERY PLAN SELECT id FROM jobs WHERE {store._UNFINISHED[include_failed]} '
+                f'AND id > ? ORDER BY id LIMIT ?', (0, 10)).fetchall()
+            assert index in plan[0][-1]
+
+
+def test_failed_batch_is_retried(tmp_path):
+    path = tmp_path / 'jobs.db'
+    with JobStore(path, commit_interval=60) as store:
+        store._conn.execute('PRAGMA busy_timeout = 0')
+        other = sqlite3.connect(path, isolation_level=None)
+        # 另一个连接持有写锁，提交失败
+        other.execute('BEGIN IMMEDIATE')
+        store.add(Resources('http://host/a', tmp_path / 'a'))
+        store.flush()
+        assert len(store._pending) == 1
+        other.execute('ROLLBACK')
+        other.close()
+        assert store.counts()['pending'] == 1
+        assert not store._pending
+
+
+def test_user_cancel_is_not_resumed(tmp_path, make_downloader):
+    path = tmp_path / 'jobs.db'
+    with make_downloader(workers=1, job_store=path) as downloader:
+        downloader.submit(Resources('http://host/running', tmp_path / 'running' / '0.2'))
+        queued = downloader.submit(Resources('http://host/cancelled', tmp_path / 'cancelled' / '0.2'))
+        assert queued.cancel()
+        # 提前关闭 submit_many 取消的任务仍然待下载
+        tasks = downloader.submit_many(Resources(f'http://host/{name}', tmp_path / name / '0.1') for name in 'abc')
+        next(tasks)
+        tasks.close()
+    with JobStore(path) as store:
+        assert store.counts()['cancelled'] == 1
+        unfinished = [entry['resources'].uri for entry in store.unfinished()]
+        assert 'http://host/c' in unfinished and 'http://host/cancelled' not in unfinished
+        assert store.remaining() == len(unfinished)
+
+
+def test_updates_do_not_wait_for_the_database(tmp_path):
+    with JobStore(tmp_path / 'jobs.db', batch_size=1, commit_interval=60) as store:
+        resources = Resources('http://host/a', tmp_path / 'a')
+        # 模拟正在进行的提交，记录更新不会等待它
+        with store._lock:
+            recorder = threading.Thread(target=lambda: (store.add(resources), store.started(resources)))
+            recorder.start()
+            recorder.join(5)
+            assert not recorder.is_alive()
+        store.flush()
+        assert store.counts()['running'] == 1
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from yundownload.utils import writer as writer_module
+from yundownload.utils.writer import DiskWriter
+
+
+def test_adjacent_writes_coalesced(tmp_path):
+    writer = DiskWriter()
+    file = writer.open(tmp_path / 'a.bin')
+    # 同一批次中相邻的请求合并为一次 pwritev
+    writer._flush([(file, 0, b'ab', None, None), (file, 4, b'ef', None, None), (file, 2, b'cd', None, None),
+                   (file, 10, b'x', None, None)])
+    writer_module.os.close(file._fd)
+    assert writer.calls == 2
+    assert (tmp_path / 'a.bin').read_bytes() == b'abcdef\0\0\0\0x'
+
+
+def test_write_and_append(tmp_path):
+    path = tmp_path / 'b.bin'
+    path.write_bytes(b'head')
+    writer = DiskWriter()
+
+    async def main():
+        async with writer.open(path, append=True) as f:
+            assert f.offset == 4
+            for index in range(100):
+                await f.write(bytes([index]) * 1000)
+
+    asyncio.run(main())
+    assert path.read_bytes() == b'head' + b''.join(bytes([index]) * 1000 for index in range(100))
+    assert writer.requests == 100
+    assert writer.calls <= 100
+
+
+def test_backpressure(tmp_path, monkeypatch):
+    write_at = writer_module._write_at
+    writer = DiskWriter(buffer_size=4096)
+    peak = []
+
+    def slow_write(fd, buffers, offset):
+        peak.append(writer._pending)
+        time.sleep(0.01)
+        return write_at(fd, buffers, offset)
+
+    monkeypatch.setattr(writer_module, '_write_at', slow_write)
+
+    async def main():
+        async with writer.open(tmp_path / 'c.bin') as f:
+            for _ in range(50):
+                await f.write(b'x' * 1024)
+
+    asyncio.run(main())
+    assert max(peak) <= 4096
+    assert (tmp_path / 'c.bin').stat().st_size == 50 * 1024
+
+
+def test_backpressure_across_loops(tmp_path, monkeypatch):
+    write_at = writer_module._write_at
+    writer = DiskWriter(buffer_size=4096)
+    peak = []
+
+    def slow_write(fd, buffers, offset):
+        peak.append(writer._pending)
+        time.sleep(0.01)
+        return write_at(fd, buffers, offset)
+
+    monkeypatch.setattr(writer_module, '_write_at', slow_write)
+
+    async def main(name):
+        async with writer.open(tmp_path / name) as f:
+            for _ in range(20):
+                await f.write(b'x' * 1024)
+
+    # 多个线程各自的事件循环同时写入，缓冲上限依然成立
+    threads = [threading.Thread(target=asyncio.run, args=(main(f'{index}.bin'),)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert max(peak) <= 4096
+    assert all((tmp_path / f'{index}.bin').stat().st_size == 20 * 1024 for index in range(4))
+
+
+def test_error_raised_on_close(tmp_path, monkeypatch):
+    def failing_write(fd, buffers, offset):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(writer_module, '_write_at', failing_write)
+    writer = DiskWriter()
+
+    async def main():
+        async with writer.open(tmp_path / 'd.bin') as f:
+            await f.write(b'x')
+
+    with pytest.raises(OSError):
+        asyncio.run(main())
@@ -1,5 +1,7 @@
-from .core import Resources, Downloader
+from .core import Resources, Downloader, HttpOptions, FTPOptions, SFTPOptions, JobStore
 from .utils import Result, logger
 from .utils.cli import cli
 from .utils.work import WorkerFuture
+from .utils.stats import TransferStats
+from .utils.metrics import MetricsRegistry
 from .version import __version__
\ No newline at end of file
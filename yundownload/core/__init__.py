@@ -1,2 +1,3 @@
 from yundownload.core.downloader import Downloader
-from yundownload.core.resources import Resources
\ No newline at end of file
+from yundownload.core.resources import Resources, HttpOptions, FTPOptions, SFTPOptions
+from yundownload.core.store import JobStore
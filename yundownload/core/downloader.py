@@ -1,30 +1,60 @@
+import os
+import queue
+import threading
 from concurrent.futures import ProcessPoolExecutor, Future
-from typing import TYPE_CHECKING, Type
+from pathlib import Path
+from typing import Type, Optional, Iterable, Iterator, Union
 
-from ..utils.work import WorkerFuture
+from .manifest import read_manifest, SCHEDULE_FIELDS
+from .resources import Resources
+from .scheduler import DownloadScheduler
+from .store import JobStore
+from ..utils.work import WorkerFuture, TaskSlots
+from ..network import PROTOCOLS, resolve_protocol, preload_protocols
 from ..network.base import BaseProtocolHandler
-from ..network.ftp import FTPProtocolHandler
-from ..network.http import HttpProtocolHandler
-from ..network.m3u import M3U8ProtocolHandler
-from ..network.sftp import SFTPProtocolHandler
-from ..utils.core import Result
+from ..utils.content import ContentStore, link_file
+from ..utils.core import Result, Environment
 from ..utils.exceptions import NotSupportedProtocolException
 from ..utils.logger import logger
+from ..utils.metrics import MetricsRegistry, DownloadMetrics
+from ..utils.profiler import TaskProfiler
+from ..utils.config import DEFAULT_STREAM_BUFFER_SIZE
+from ..utils.sink import Sink, ChunkStream
+from ..utils.stats import TransferStats
 from ..utils.tools import retry
 
-if TYPE_CHECKING:
-    from ..core import Resources
 
+def _init_worker(slots: 'TaskSlots', content_store: Optional['ContentStore'], preload: tuple[str, ...],
+                 profiler: Optional['TaskProfiler'] = None):
+    """
+    Process pool initializer
+    """
+    TaskSlots.bind(slots)
+    ContentStore.bind(content_store)
+    TaskProfiler.bind(profiler)
+    preload_protocols(preload)
 
-def _run(protocols: Type['BaseProtocolHandler'], resources: 'Resources') -> 'Result':
+
+def _run(protocols: Type['BaseProtocolHandler'],
+         resources: 'Resources',
+         slot: Optional[int] = None) -> tuple['Result', Optional['TransferStats']]:
     """
     Run the download callback
 
     :param protocols: Protocol Matcher
     :param resources: Resource Object
-    :return: Result
+    :param slot: Index of the shared task slot
+    :return: Result and the transfer statistics of the run
     """
-    return protocols()(resources)
+    handler = protocols()
+    handler.task_slot = TaskSlots.attach(slot)
+    profiler = TaskProfiler.current()
+    if profiler is None:
+        result = handler(resources)
+    else:
+        with profiler.profile(resources):
+            result = handler(resources)
+    return result, handler.stats
 
 
 class DownloadProcessPoolExecutor(ProcessPoolExecutor):
@@ -35,15 +65,19 @@ class DownloadProcessPoolExecutor(ProcessPoolExecutor):
     def __init__(self, max_workers: int = None, **kwargs):
         super().__init__(max_workers, **kwargs)
 
-    def run_download(self, protocol: Type['BaseProtocolHandler'], resources: 'Resources') -> 'Future[Result]':
+    def run_download(self,
+                     protocol: Type['BaseProtocolHandler'],
+                     resources: 'Resources',
+                     slot: Optional[int] = None) -> 'Future[tuple[Result, Optional[TransferStats]]]':
         """
         提交下载任务
 
         :param protocol: Protocol Matcher
         :param resources: Resource Object
-        :return: A Future object that returns the result
+        :param slot: Index of the shared task slot
+        :return: A Future object that returns the result and the transfer statistics
         """
-        return super().submit(_run, protocol, resources)
+        return super().submit(_run, protocol, resources, slot)
 
 
 class Downloader:
@@ -51,33 +85,306 @@ class Downloader:
     Downloader
     """
 
-    def __init__(self, max_workers: int = 1):
+    def __init__(self,
+                 max_workers: int = 1,
+                 job_store: Union[str, Path, 'JobStore', None] = None,
+                 dedupe: bool = False,
+                 content_store: Union[str, Path, 'ContentStore', None] = None,
+                 preload: Iterable[str] = (),
+                 metrics: Optional['MetricsRegistry'] = None,
+                 profile: Union[str, Path, None] = None):
         """
         Downloader
 
         :param max_workers: Maximum number of processes
+        :param job_store: SQLite job store path or JobStore that records every task, see ``resume``
+        :param dedupe: Share one download between identical requests that are in flight at the same time,
+            requests with different headers, cookies, authentication or proxy are not identical
+        :param content_store: Content-addressed store directory or ContentStore, duplicates are linked
+            from it instead of being downloaded again
+        :param preload: Protocols imported when a worker starts, e.g. ('http', 'sftp'), the others are
+            imported by the first task that needs them
+        :param metrics: Registry the downloader reports throughput, transfers, queue depth, retries,
+            errors, concurrency targets and latency histograms to, see ``MetricsRegistry.serve``
+        :param profile: Directory the workers write a CPU profile and a hot function summary of every
+            task to, with asyncio slow callback detection, defaults to the YUNDOWNLOAD_PROFILE_DIR variable
         """
-        self._protocols: list = [M3U8ProtocolHandler, HttpProtocolHandler, FTPProtocolHandler, SFTPProtocolHandler]
+        self._protocols: list = list(PROTOCOLS)
         self._lock_protocol = None
-        self._download_pool = DownloadProcessPoolExecutor(max_workers=max_workers)
+        self._task_slots = TaskSlots(max_workers)
+        self._content_store: Optional['ContentStore'] = (ContentStore(content_store)
+                                                         if isinstance(content_store, (str, Path))
+                                                         else content_store)
+        self.dedupe = dedupe
+        self._inflight: dict[tuple, 'WorkerFuture'] = {}
+        # 完成回调可能在提交线程中同步执行，需要可重入锁
+        self._inflight_lock = threading.RLock()
+        # 由下载器而非用户取消的任务，在任务存储中回到待下载状态
+        self._requeue: set['WorkerFuture'] = set()
+        self._closing = False
+        profile = profile or os.getenv(Environment.PROFILE_DIR)
+        profiler = (TaskProfiler(profile, float(os.getenv(Environment.PROFILE_SLOW_CALLBACK, 0.1)))
+                    if profile else None)
+        self._download_pool = DownloadProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(self._task_slots, self._content_store, tuple(preload), profiler)
+        )
+        self._scheduler = DownloadScheduler(self._download_pool, self._task_slots)
+        self._owns_job_store = isinstance(job_store, (str, Path))
+        self._job_store: Optional['JobStore'] = JobStore(job_store) if self._owns_job_store else job_store
+        if self._job_store:
+            # 在调度锁内执行，只把状态变化加入任务存储的批量写入队列
+            self._scheduler.on_start = lambda task: self._job_store.started(task.resources)
+        self._metrics: Optional['DownloadMetrics'] = DownloadMetrics(metrics, self._scheduler) if metrics else None
+        if self._metrics:
+            self._scheduler.on_finish = self._metrics.record
 
-    def submit(self, resources: 'Resources') -> 'WorkerFuture':
+    def submit(self,
+               resources: 'Resources',
+               priority: int = 0,
+               tenant: str = 'default',
+               deadline: Optional[float] = None) -> 'WorkerFuture':
         """
         提交任务
 
         :param resources: Resource Object
+        :param priority: Higher values are dispatched first and may preempt lower priority downloads
+            at their next slice or segment boundary
+        :param tenant: Tenants of the same priority share the workers fairly
+        :param deadline: Seconds from now by which the task should be dispatched
         :return:
         """
-        if self._lock_protocol:
-            protocol = self._lock_protocol
-        else:
-            protocol = self._match_protocol(resources)
+        protocol = self._protocol_for(resources)
         resources.lock()
-        return WorkerFuture(
-            future=self._download_pool.run_download(protocol, resources),
+        if not self.dedupe:
+            return self._submit(protocol, resources, priority, tenant, deadline)
+        key = self._request_key(resources)
+        with self._inflight_lock:
+            primary = self._inflight.get(key)
+            if primary is None:
+                future = self._submit(protocol, resources, priority, tenant, deadline)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f: self._forget(key, f))
+                return future
+        if primary.resources.save_path == resources.save_path:
+            logger.info('Sharing in-flight download of %s', resources.uri)
+            return primary
+        return self._follow(primary, protocol, resources, priority, tenant)
+
+    def _submit(self,
+                protocol: Type['BaseProtocolHandler'],
+                resources: 'Resources',
+                priority: int,
+                tenant: str,
+                deadline: Optional[float]) -> 'WorkerFuture':
+        if self._job_store:
+            self._job_store.add(resources, priority, tenant)
+        task = self._scheduler.schedule(protocol, resources, priority, tenant, deadline)
+        future = WorkerFuture(
+            future=task.future,
             protocol=protocol,
-            resources=resources
+            resources=resources,
+            task=task
         )
+        if self._job_store:
+            future.add_done_callback(self._record_job)
+        return future
+
+    @staticmethod
+    def _request_key(resources: 'Resources') -> tuple:
+        """相同的请求返回相同的内容，请求头、Cookie、认证与代理都可能改变响应"""
+        return (resources.uri, resources.http_method, repr(resources.http_params), repr(resources.http_data),
+                repr(resources.http_headers), repr(resources.http_cookies), repr(resources.http_auth),
+                repr(resources.http_proxy), resources.ftp_port, resources.sftp_port)
+
+    def _forget(self, key: tuple, future: 'WorkerFuture'):
+        with self._inflight_lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _follow(self,
+                primary: 'WorkerFuture',
+                protocol: Type['BaseProtocolHandler'],
+                resources: 'Resources',
+                priority: int,
+                tenant: str) -> 'WorkerFuture':
+        """
+        Wait for an in-flight download of the same request and link its file to another save path
+        """
+        logger.info('Sharing in-flight download of %s to %s', resources.uri, resources.save_path)
+        follower: 'Future[Result]' = Future()
+        link_mode = self._content_store.link_mode if self._content_store else 'auto'
+
+        def complete(_):
+            if primary.cancelled():
+                follower.cancel()
+                return
+            if not follower.set_running_or_notify_cancel():
+                return
+            try:
+                result = primary.state
+                if result & (Result.SUCCESS | Result.EXIST):
+                    link_file(primary.resources.save_path, resources.save_path, link_mode)
+                    result = Result.SUCCESS
+            except Exception as e:
+                follower.set_exception(e)
+                return
+            follower.set_result(result)
+
+        future = WorkerFuture(future=follower, protocol=protocol, resources=resources)
+        if self._job_store:
+            self._job_store.add(resources, priority, tenant)
+            future.add_done_callback(self._record_job)
+        primary.add_done_callback(complete)
+        return future
+
+    def resume(self, window: Optional[int] = None, include_failed: bool = False) -> Iterator['WorkerFuture']:
+        """
+        Submit the unfinished jobs of the job store again, see ``submit_many``
+
+        Jobs that were queued or running when the previous process died are resumed,
+        finished jobs are not touched.
+
+        :param window: Maximum number of pending tasks, defaults to four per worker
+        :param include_failed: Also retry the jobs that failed
+        :return: Iterator of finished WorkerFuture objects
+        """
+        if not self._job_store:
+            raise RuntimeError("Downloader was created without a job store")
+        return self.submit_many(self._job_store.unfinished(include_failed), window)
+
+    @property
+    def job_store(self) -> Optional['JobStore']:
+        return self._job_store
+
+    def _record_job(self, future: 'WorkerFuture'):
+        if future.cancelled():
+            if future in self._requeue or self._closing:
+                self._job_store.reset(future.resources)
+            else:
+                self._job_store.finished(future.resources, Result.CANCEL)
+            self._requeue.discard(future)
+        elif future.exception():
+            self._job_store.finished(future.resources, None)
+        else:
+            self._job_store.finished(future.resources, future.state)
+
+    def submit_many(self,
+                    items: Iterable[Union['Resources', dict]],
+                    window: Optional[int] = None,
+                    priority: int = 0,
+                    tenant: str = 'default') -> Iterator['WorkerFuture']:
+        """
+        Submit a stream of downloads with backpressure
+
+        Items are only pulled from the iterable while fewer than ``window`` of them are
+        pending, so arbitrarily large inputs are processed in bounded memory. Finished
+        tasks are yielded in completion order. Closing the iterator early cancels the
+        pending tasks, running downloads stop at their next chunk boundary.
+
+        :param items: Resource objects or dicts of Resources arguments (or with a ``resources``
+            key holding the object), dicts may also carry priority, tenant and deadline
+        :param window: Maximum number of pending tasks, defaults to four per worker
+        :param priority: Default priority of the items
+        :param tenant: Default tenant of the items
+        :return: Iterator of finished WorkerFuture objects
+        """
+        window = window or self._task_slots.size * 4
+        if window < 1:
+            raise ValueError("Submission window must be positive")
+        completed: 'queue.SimpleQueue[WorkerFuture]' = queue.SimpleQueue()
+        # 去重后多个条目可能共享同一个 future，窗口按条目计数
+        pending: set['WorkerFuture'] = set()
+        in_flight = 0
+        items = iter(items)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and in_flight < window:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = self._submit_item(item, priority, tenant)
+                    pending.add(future)
+                    in_flight += 1
+                    future.add_done_callback(completed.put)
+                if not in_flight:
+                    return
+                future = completed.get()
+                in_flight -= 1
+                pending.discard(future)
+                yield future
+        finally:
+            for future in pending:
+                if not future.done():
+                    # 提前关闭迭代器取消的任务不是用户的取消，resume 时继续下载
+                    self._requeue.add(future)
+                    future.cancel()
+
+    def download_manifest(self,
+                          path: Union[str, Path],
+                          window: Optional[int] = None,
+                          base_dir: Union[str, Path, None] = None,
+                          priority: int = 0,
+                          tenant: str = 'default') -> Iterator['WorkerFuture']:
+        """
+        Download every entry of a JSONL or CSV manifest, see ``submit_many``
+
+        :param path: Manifest path, one Resources argument dict per JSONL line or CSV row
+        :param window: Maximum number of pending tasks, defaults to four per worker
+        :param base_dir: Directory relative save paths are resolved against
+        :param priority: Default priority of the entries
+        :param tenant: Default tenant of the entries
+        :return: Iterator of finished WorkerFuture objects
+        """
+        return self.submit_many(read_manifest(path, base_dir), window, priority, tenant)
+
+    def _submit_item(self, item: Union['Resources', dict], priority: int, tenant: str) -> 'WorkerFuture':
+        if isinstance(item, Resources):
+            return self.submit(item, priority, tenant)
+        entry = dict(item)
+        schedule = {key: entry.pop(key) for key in SCHEDULE_FIELDS if key in entry}
+        resources = entry.pop('resources') if 'resources' in entry else Resources(**entry)
+        return self.submit(resources,
+                           schedule.get('priority', priority),
+                           schedule.get('tenant', tenant),
+                           schedule.get('deadline'))
+
+    def stream(self, resources: 'Resources', buffer_size: int = DEFAULT_STREAM_BUFFER_SIZE) -> 'ChunkStream':
+        """
+        Download into in-order chunks instead of the save path
+
+        The transfer runs on a thread of this process instead of the worker pool, the save
+        path is not written. Retries continue after the bytes that were already delivered.
+
+        :param resources: Resource Object
+        :param buffer_size: Bytes waiting for the consumer before the download pauses
+        :return: Chunks to iterate, ``async for`` or ``read``, closing them cancels the download
+        """
+        return ChunkStream(buffer_size).start(self._protocol_for(resources)(), resources)
+
+    def download_to(self, resources: 'Resources', sink: 'Sink') -> 'Result':
+        """
+        Download into a sink on the calling thread instead of the save path
+
+        :param resources: Resource Object
+        :param sink: Receives the content in order
+        :return: Result
+        """
+        handler = self._protocol_for(resources)()
+        handler.sink = sink
+        try:
+            return handler(resources)
+        finally:
+            handler.sink = None
+
+    def _protocol_for(self, resources: 'Resources') -> Type['BaseProtocolHandler']:
+        if self._lock_protocol:
+            return self._lock_protocol
+        return self._match_protocol(resources)
 
     def lock_protocol(self, protocol: BaseProtocolHandler):
         """
@@ -99,7 +406,8 @@ class Downloader:
         """
         for protocol in self._protocols:
             if protocol.check_protocol(resources.uri):
-                logger.info(f"Protocol {protocol.__name__} is supported for {resources.uri}")
+                protocol = resolve_protocol(protocol)
+                logger.debug("Protocol %s is supported for %s", protocol.__name__, resources.uri)
                 return protocol
         raise NotSupportedProtocolException(resources.uri)
 
@@ -127,8 +435,27 @@ class Downloader:
             raise TypeError("protocol_handler must be a subclass of BaseProtocolHandler "
                             "and implement its required methods")
 
+    def set_tenant_weight(self, tenant: str, weight: float):
+        """
+        Set the fair share weight of a tenant
+
+        :param tenant: Tenant name
+        :param weight: Relative share, defaults to 1
+        """
+        self._scheduler.set_weight(tenant, weight)
+
     def close(self):
+        self._scheduler.join()
+        # 暂停的任务不会再被恢复，取消后保留已下载的部分，任务存储中仍为待下载
+        self._closing = True
+        self._scheduler.cancel_paused()
         self._download_pool.shutdown()
+        if self._owns_job_store:
+            self._job_store.close()
+        elif self._job_store:
+            self._job_store.flush()
+        if self._metrics:
+            self._metrics.close()
 
     def __enter__(self):
         return self
@@ -0,0 +1,65 @@
+import csv
+import json
+from pathlib import Path
+from typing import Iterator, Union
+
+# 由调度器消费而非传给 Resources 的字段
+SCHEDULE_FIELDS = ('priority', 'tenant', 'deadline')
+
+
+def _parse_csv_value(value: str):
+    """CSV 单元格尝试按 JSON 解析，使数字、布尔与字典字段保持原类型"""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def read_manifest(path: Union[str, Path], base_dir: Union[str, Path, None] = None) -> Iterator[dict]:
+    """
+    Lazily read download entries from a JSONL or CSV manifest
+
+    Every entry holds the keyword arguments of ``Resources`` and optionally
+    ``priority``, ``tenant`` and ``deadline``. CSV manifests name the arguments in
+    their header row, empty cells are left out.
+
+    :param path: Manifest path, ``.jsonl``/``.ndjson`` or ``.csv``
+    :param base_dir: Directory relative save paths are resolved against
+    :return: Iterator of entries
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix in ('.jsonl', '.ndjson'):
+        entries = _read_jsonl(path)
+    elif suffix == '.csv':
+        entries = _read_csv(path)
+    else:
+        raise ValueError(f"Unsupported manifest format: {path}")
+
+    for line, entry in entries:
+        if 'uri' not in entry or 'save_path' not in entry:
+            raise ValueError(f"Manifest entry {path}:{line} requires uri and save_path")
+        if base_dir is not None:
+            entry['save_path'] = Path(base_dir) / entry['save_path']
+        yield entry
+
+
+def _read_jsonl(path: Path) -> Iterator[tuple[int, dict]]:
+    with path.open('r', encoding='utf-8') as f:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"Invalid manifest entry {path}:{line}: {e}")
+
+
+def _read_csv(path: Path) -> Iterator[tuple[int, dict]]:
+    with path.open('r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            entry = {key: value if key in ('uri', 'save_path', 'tenant') else _parse_csv_value(value)
+                     for key, value in row.items() if key and value not in ('', None)}
+            if entry:
+                yield reader.line_num, entry
@@ -1,11 +1,200 @@
 from pathlib import Path
-from typing import Union, Literal, Dict, Optional
+from types import MappingProxyType
+from typing import Union, Literal, Dict, Optional, Type
 
-from yundownload.utils import DynamicConcurrencyController, DynamicSemaphore
+from yundownload.utils import DynamicSemaphore, ThreadDynamicSemaphore
+from yundownload.utils.checksum import Checksum
+from yundownload.utils.equilibrium import BaseConcurrencyController, create_concurrency_controller
+from yundownload.utils.profiles import host_profiles
+
+
+class _OptionGroup:
+    """
+    Immutable group of protocol options
+
+    Groups are shared by reference between resources, so changing an option of one
+    resource replaces its group with a modified copy instead of mutating the group.
+    Dict options are stored as read-only copies, a resource takes its own copy when
+    it reads one, see ``_Option``.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, MappingProxyType(dict(value)) if isinstance(value, dict) else value)
+
+    def replace(self, **changes) -> '_OptionGroup':
+        """
+        Copy the group with some options changed
+
+        :param changes: Options to change
+        :return: New option group
+        """
+        if not changes:
+            return self
+        unknown = changes.keys() - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"{type(self).__name__} got unexpected options {', '.join(sorted(unknown))}")
+        return type(self)(**{name: changes.get(name, getattr(self, name)) for name in self.__slots__})
+
+    def _own(self, name: str) -> tuple['_OptionGroup', dict]:
+        """
+        Copy the group for a single resource, with a mutable copy of the dict option name
+
+        :return: New option group and its dict
+        """
+        value = dict(getattr(self, name))
+        group = object.__new__(type(self))
+        for slot in self.__slots__:
+            object.__setattr__(group, slot, value if slot == name else getattr(self, slot))
+        return group, value
+
+    def _values(self) -> tuple:
+        return tuple(dict(value) if isinstance(value, MappingProxyType) else value
+                     for value in (getattr(self, name) for name in self.__slots__))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} is immutable, use replace()')
+
+    def __reduce__(self):
+        # 默认选项组按模块全局变量名序列化
+        name = _DEFAULT_GROUPS.get(type(self))
+        if name and globals()[name] is self:
+            return name
+        return type(self), self._values()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,
+                               ', '.join(f'{name}={value!r}' for name, value in zip(self.__slots__, self._values())))
+
+
+class HttpOptions(_OptionGroup):
+    """
+    HTTP options, also used by the M3U8 protocol
+    """
+    __slots__ = ('method', 'params', 'headers', 'data', 'proxy', 'cookies', 'timeout', 'auth', 'verify',
+                 'slice_threshold', 'sliced_chunk_size', 'stream', 'compression')
+
+    def __init__(self,
+                 method: Literal['GET', 'POST', 'PUT', 'DELETE'] = 'GET',
+                 params: dict = None,
+                 headers: dict = None,
+                 data: dict = None,
+                 proxy: Dict[Literal['http', 'https'], str] = None,
+                 cookies: dict = None,
+                 timeout: int = 30,
+                 auth: tuple[str, str] = None,
+                 verify: bool = False,
+                 slice_threshold: int = 2048 * 1024 * 1024,
+                 sliced_chunk_size: int = 2048 * 1024 * 1024,
+                 stream: bool = False,
+                 compression: bool = False):
+        """
+        :param method: Request method
+        :param params: Request parameters
+        :param headers: Request headers
+        :param data: Request data
+        :param proxy: Request proxy { 'http': 'http://xxx', 'https': 'https://xxx' }
+        :param cookies: Request cookie
+        :param timeout: Request timeout period
+        :param auth: Authentication
+        :param verify: Verify TLS certificates
+        :param slice_threshold: Sharding threshold
+        :param sliced_chunk_size: Sharding chunk size
+        :param stream: Force streaming download
+        :param compression: Accept compressed transfer encodings and decompress while writing
+        """
+        super().__init__(method, params, headers, data, proxy if proxy else {}, cookies, timeout, auth, verify,
+                         slice_threshold, sliced_chunk_size, stream, compression)
+
+
+class FTPOptions(_OptionGroup):
+    """
+    FTP options
+    """
+    __slots__ = ('timeout', 'port', 'slice_threshold', 'sliced_chunk_size')
+
+    def __init__(self,
+                 timeout: int = 30,
+                 port: int = 21,
+                 slice_threshold: int = 2048 * 1024 * 1024,
+                 sliced_chunk_size: int = 2048 * 1024 * 1024):
+        """
+        :param timeout: Request timeout period
+        :param port: Request port
+        :param slice_threshold: Sharding threshold (requires REST support)
+        :param sliced_chunk_size: Sharding chunk size
+        """
+        super().__init__(timeout, port, slice_threshold, sliced_chunk_size)
+
+
+class SFTPOptions(_OptionGroup):
+    """
+    SFTP options
+    """
+    __slots__ = ('port', 'slice_threshold', 'sliced_chunk_size')
+
+    def __init__(self,
+                 port: int = 22,
+                 slice_threshold: int = 2048 * 1024 * 1024,
+                 sliced_chunk_size: int = 2048 * 1024 * 1024):
+        """
+        :param port: Request port
+        :param slice_threshold: Sharding threshold
+        :param sliced_chunk_size: Sharding chunk size
+        """
+        super().__init__(port, slice_threshold, sliced_chunk_size)
+
+
+# 未指定选项的资源共享同一份默认选项组
+DEFAULT_HTTP_OPTIONS = HttpOptions()
+DEFAULT_FTP_OPTIONS = FTPOptions()
+DEFAULT_SFTP_OPTIONS = SFTPOptions()
+# 批量创建参数相同的资源时共享覆盖后的选项组
+_last_merge: dict[type, tuple['_OptionGroup', dict, '_OptionGroup']] = {}
+_DEFAULT_GROUPS = {HttpOptions: 'DEFAULT_HTTP_OPTIONS', FTPOptions: 'DEFAULT_FTP_OPTIONS',
+                   SFTPOptions: 'DEFAULT_SFTP_OPTIONS'}
+
+
+class _Option:
+    """
+    Flat ``<group>_<name>`` attribute delegating to an option group
+    """
+    __slots__ = ('group', 'name')
+
+    def __init__(self, group: str, name: str):
+        self.group = group
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        group = getattr(instance, self.group)
+        value = getattr(group, self.name)
+        if instance._locked:
+            # 锁定的资源不可修改，字典选项返回副本
+            return dict(value) if isinstance(value, (dict, MappingProxyType)) else value
+        if not isinstance(value, MappingProxyType):
+            return value
+        # 第一次读取字典选项时复制一份归该资源所有，修改它不影响共享选项组的其他资源
+        group, value = group._own(self.name)
+        setattr(instance, self.group, group)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.group, getattr(instance, self.group).replace(**{self.name: value}))
 
 
 class Resources:
-    _set_lock = True
+    __slots__ = ('uri', 'save_path', 'retry', 'retry_delay', 'http', 'ftp', 'sftp', 'metadata',
+                 'min_concurrency', 'max_concurrency', 'window_size', 'concurrency_strategy',
+                 'concurrency_warm_start', 'checksum', 'semaphore', '_dcc', '_locked')
+
+    # 只在工作进程中产生的运行时状态，锁定后仍可修改
+    _RUNTIME_FIELDS = ('dcc', '_dcc', 'semaphore')
+    _STATE = ('uri', 'save_path', 'retry', 'retry_delay', 'http', 'ftp', 'sftp', 'metadata', 'min_concurrency',
+              'max_concurrency', 'window_size', 'concurrency_strategy', 'concurrency_warm_start', '_locked',
+              'checksum')
 
     def __init__(self,
                  uri: str,
@@ -23,14 +212,25 @@ class Resources:
                  http_sliced_chunk_size: int = 2048 * 1024 * 1024,
                  ftp_timeout: int = 30,
                  ftp_port: int = 21,
+                 ftp_slice_threshold: int = 2048 * 1024 * 1024,
+                 ftp_sliced_chunk_size: int = 2048 * 1024 * 1024,
                  sftp_port: int = 22,
+                 sftp_slice_threshold: int = 2048 * 1024 * 1024,
+                 sftp_sliced_chunk_size: int = 2048 * 1024 * 1024,
                  http_stream: bool = False,
+                 http_compression: bool = False,
                  metadata: dict = None,
                  retry: int = 3,
                  retry_delay: int | tuple[int, int] = 10,
                  min_concurrency: int = 2,
                  max_concurrency: int = 30,
-                 window_size: int = 100):
+                 window_size: int = 100,
+                 concurrency_strategy: Union[str, Type['BaseConcurrencyController']] = 'default',
+                 concurrency_warm_start: bool = True,
+                 checksum: Optional[str] = None,
+                 http: Optional['HttpOptions'] = None,
+                 ftp: Optional['FTPOptions'] = None,
+                 sftp: Optional['SFTPOptions'] = None):
         """
         Resource Object
 
@@ -48,54 +248,149 @@ class Resources:
         :param http_sliced_chunk_size: HTTP protocol sharding chunk size
         :param ftp_timeout: FTP request timeout period
         :param ftp_port: FTP protocol request port
+        :param ftp_slice_threshold: FTP protocol sharding threshold (requires REST support)
+        :param ftp_sliced_chunk_size: FTP protocol sharding chunk size
         :param sftp_port: SFTP request port
+        :param sftp_slice_threshold: SFTP protocol sharding threshold
+        :param sftp_sliced_chunk_size: SFTP protocol sharding chunk size
+        :param http_stream: Force streaming download
+        :param http_compression: Accept gzip, deflate and, when installed, brotli and zstd transfers that are
+            decompressed while writing (Valid for HTTP protocol)
         :param metadata: Custom metadata (for adapting custom protocols)
         :param retry: Number of retries
         :param retry_delay: Retry interval
         :param min_concurrency: Adaptive concurrency minimum
         :param max_concurrency: Adaptive concurrency maximum
         :param window_size: Adaptive concurrency window size
+        :param concurrency_strategy: Adaptive concurrency strategy, 'default', 'aimd', 'gradient', 'bbr'
+            or a subclass of BaseConcurrencyController
+        :param concurrency_warm_start: Start from the concurrency previously learned for the same host
+        :param checksum: Expected digest of the content as '<algorithm>:<digest>', e.g. 'sha256:9f86d0...',
+            checked while downloading. HTTP downloads without one use the digest headers of the server
+        :param http: Shared HTTP option group, the http_* arguments override single options of it
+        :param ftp: Shared FTP option group, the ftp_* arguments override single options of it
+        :param sftp: Shared SFTP option group, the sftp_* arguments override single options of it
         """
+        self._locked = False
         self.uri = uri
         self.save_path = Path(save_path)
 
         self.retry = retry
         self.retry_delay = retry_delay
-        self.dcc = DynamicConcurrencyController(min_concurrency, max_concurrency, window_size)
-        self.semaphore: Optional['DynamicSemaphore'] = None
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.window_size = window_size
+        self.concurrency_strategy = concurrency_strategy
+        self.concurrency_warm_start = concurrency_warm_start
+        # 提前校验格式，避免在工作进程中才失败
+        self.checksum = Checksum.parse(checksum).describe() if checksum else None
+        # 并发控制器在工作进程中首次使用时创建，不随任务序列化
+        self._dcc: Optional['BaseConcurrencyController'] = None
+        self.semaphore: Optional[Union['DynamicSemaphore', 'ThreadDynamicSemaphore']] = None
 
         # http protocol and part m3u8 protocol
-        self.http_stream = http_stream
-        self.http_method = http_method
-        self.http_params = http_params
-        self.http_headers = http_headers
-        self.http_data = http_data
-        self.http_proxy = http_proxy if http_proxy else dict()
-        self.http_cookies = http_cookies
-        self.http_timeout = http_timeout
-        self.http_auth = http_auth
-        self.http_verify = http_verify
-        self.http_slice_threshold = http_slice_threshold
-        self.http_sliced_chunk_size = http_sliced_chunk_size
-
-        self.ftp_timeout = ftp_timeout
-        self.ftp_port = ftp_port
-
-        self.sftp_port = sftp_port
+        self.http = self._merge(http or DEFAULT_HTTP_OPTIONS, DEFAULT_HTTP_OPTIONS, {
+            'method': http_method, 'params': http_params, 'headers': http_headers, 'data': http_data,
+            'proxy': http_proxy or {}, 'cookies': http_cookies, 'timeout': http_timeout, 'auth': http_auth,
+            'verify': http_verify, 'slice_threshold': http_slice_threshold,
+            'sliced_chunk_size': http_sliced_chunk_size, 'stream': http_stream, 'compression': http_compression
+        })
+        self.ftp = self._merge(ftp or DEFAULT_FTP_OPTIONS, DEFAULT_FTP_OPTIONS, {
+            'timeout': ftp_timeout, 'port': ftp_port, 'slice_threshold': ftp_slice_threshold,
+            'sliced_chunk_size': ftp_sliced_chunk_size
+        })
+        self.sftp = self._merge(sftp or DEFAULT_SFTP_OPTIONS, DEFAULT_SFTP_OPTIONS, {
+            'port': sftp_port, 'slice_threshold': sftp_slice_threshold,
+            'sliced_chunk_size': sftp_sliced_chunk_size
+        })
 
         self.metadata = metadata if metadata else {}
 
+    @staticmethod
+    def _merge(group: '_OptionGroup', defaults: '_OptionGroup', values: dict) -> '_OptionGroup':
+        """只有显式传入（不同于默认值）的扁平参数才会复制选项组，与上一次相同的覆盖复用同一个选项组"""
+        changes = {name: value for name, value in values.items() if value != getattr(defaults, name)}
+        if not changes:
+            return group
+        last = _last_merge.get(type(group))
+        if last and last[0] is group and last[1] == changes:
+            return last[2]
+        merged = group.replace(**changes)
+        _last_merge[type(group)] = (group, changes, merged)
+        return merged
+
+    http_method = _Option('http', 'method')
+    http_params = _Option('http', 'params')
+    http_headers = _Option('http', 'headers')
+    http_data = _Option('http', 'data')
+    http_proxy = _Option('http', 'proxy')
+    http_cookies = _Option('http', 'cookies')
+    http_timeout = _Option('http', 'timeout')
+    http_auth = _Option('http', 'auth')
+    http_verify = _Option('http', 'verify')
+    http_slice_threshold = _Option('http', 'slice_threshold')
+    http_sliced_chunk_size = _Option('http', 'sliced_chunk_size')
+    http_stream = _Option('http', 'stream')
+    http_compression = _Option('http', 'compression')
+    ftp_timeout = _Option('ftp', 'timeout')
+    ftp_port = _Option('ftp', 'port')
+    ftp_slice_threshold = _Option('ftp', 'slice_threshold')
+    ftp_sliced_chunk_size = _Option('ftp', 'sliced_chunk_size')
+    sftp_port = _Option('sftp', 'port')
+    sftp_slice_threshold = _Option('sftp', 'slice_threshold')
+    sftp_sliced_chunk_size = _Option('sftp', 'sliced_chunk_size')
+
+    @property
+    def dcc(self) -> 'BaseConcurrencyController':
+        """
+        Adaptive concurrency controller, created on first use inside the worker
+        """
+        if self._dcc is None:
+            self._dcc = create_concurrency_controller(self.concurrency_strategy, self.min_concurrency,
+                                                      self.max_concurrency, self.window_size)
+        return self._dcc
+
+    @dcc.setter
+    def dcc(self, controller: 'BaseConcurrencyController'):
+        self._dcc = controller
+
     def lock(self):
         """
         Lock the resource object
         """
-        self._set_lock = False
+        self._locked = True
+
+    def update_semaphore(self, thread_safe: bool = False):
+        """
+        Create the adaptive semaphore for this download
+
+        :param thread_safe: Create a semaphore for thread pools instead of asyncio tasks
+        """
+        if self.concurrency_warm_start and self.semaphore is None:
+            host_profiles.warm_start(self.uri, self.dcc)
+        self.semaphore = ThreadDynamicSemaphore(self.dcc) if thread_safe else DynamicSemaphore(self.dcc)
+
+    def record_profile(self):
+        """
+        Remember the concurrency learned for this host
+        """
+        if self.concurrency_warm_start and self.semaphore is not None:
+            host_profiles.record(self.uri, self.dcc)
+
+    def __getstate__(self):
+        # 按字段顺序序列化为元组，不含运行时状态
+        return tuple(getattr(self, name) for name in self._STATE)
 
-    def update_semaphore(self):
-        self.semaphore = DynamicSemaphore(self.dcc)
+    def __setstate__(self, state):
+        # 旧版本持久化的状态没有后加入的字段
+        object.__setattr__(self, 'checksum', None)
+        for name, value in zip(self._STATE, state):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_dcc', None)
+        object.__setattr__(self, 'semaphore', None)
 
     def __setattr__(self, key, value):
-        if self._set_lock or key in ('dcc', 'semaphore'):
+        if key in self._RUNTIME_FIELDS or not getattr(self, '_locked', False):
             return super().__setattr__(key, value)
         raise AttributeError(f'{self.__repr__()} it is locked and cannot be modified')
 
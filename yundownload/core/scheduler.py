@@ -0,0 +1,392 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Type, Optional, Callable
+
+from ..utils.core import Result
+from ..utils.logger import logger as download_logger
+from ..utils.work import TaskSlots, Progress
+
+if TYPE_CHECKING:
+    from ..core import Resources
+    from ..core.downloader import DownloadProcessPoolExecutor
+    from ..network.base import BaseProtocolHandler
+    from ..utils.stats import TransferStats
+
+logger = download_logger.subsystem('scheduler')
+
+
+class ScheduledTask:
+    """
+    A download waiting in or dispatched by the scheduler
+    """
+    __slots__ = ('protocol', 'resources', 'future', 'priority', 'tenant', 'deadline', 'seq', 'slot', 'queued',
+                 'started', 'preempting', 'interrupted', 'paused', 'cancelling', 'slots', 'last_progress', 'scheduler',
+                 'stats')
+
+    def __init__(self, protocol: Type['BaseProtocolHandler'], resources: 'Resources', priority: int, tenant: str,
+                 deadline: Optional[float], seq: int, slots: Optional['TaskSlots'] = None,
+                 scheduler: Optional['DownloadScheduler'] = None):
+        self.protocol = protocol
+        self.resources = resources
+        self.future: Future = Future()
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.seq = seq
+        self.slot: Optional[int] = None
+        self.queued = False
+        self.started = False
+        self.preempting = False
+        # 本次分发后是否请求过让出工作进程（抢占或暂停）
+        self.interrupted = False
+        self.paused = False
+        self.cancelling = False
+        self.slots = slots
+        self.scheduler = scheduler
+        # 最近一次运行的传输统计
+        self.stats: Optional['TransferStats'] = None
+        # 释放槽位前保存的最后进度
+        self.last_progress: Optional[list[float]] = None
+
+    def progress(self) -> 'Progress':
+        """
+        Progress read from the shared slot while running, the last snapshot otherwise
+        """
+        slot = self.slot
+        if slot is not None and self.slots is not None:
+            fields = self.slots.snapshot(slot)
+            # 读取期间槽位可能已被释放并分配给其他任务
+            if self.slot == slot:
+                return Progress(fields)
+        return Progress(self.last_progress)
+
+    @property
+    def sort_key(self) -> tuple[float, int]:
+        return self.deadline if self.deadline is not None else math.inf, self.seq
+
+    def __lt__(self, other: 'ScheduledTask') -> bool:
+        return self.sort_key < other.sort_key
+
+    def __repr__(self):
+        return f'<ScheduledTask {self.resources} priority {self.priority} tenant {self.tenant}>'
+
+
+class DownloadScheduler:
+    """
+    Priority, fair share and deadline aware dispatcher in front of the process pool
+
+    Only as many tasks as there are task slots are handed to the pool, everything else
+    waits here so the pool never runs a FIFO backlog. The next task is picked as follows:
+
+    1. A task whose deadline is within ``deadline_slack`` seconds, earliest deadline first
+    2. The highest priority level with waiting tasks
+    3. Within that level, the tenant with the least weighted service so far
+    4. Within that tenant, earliest deadline then submission order
+
+    When no slot is free and a higher priority task arrives, the lowest priority running
+    task is asked to yield at its next chunk boundary. It returns ``Result.WAIT`` and is
+    queued again, resuming from its partial slices later.
+
+    Running tasks are paused and cancelled the same way: a paused task yields its worker
+    and waits outside the queue until it is resumed, a cancelled task finishes with
+    ``Result.CANCEL`` and leaves its partial files for a later download.
+    """
+
+    def __init__(self, pool: 'DownloadProcessPoolExecutor', slots: 'TaskSlots', deadline_slack: float = 5.0):
+        """
+        :param pool: Download process pool
+        :param slots: Shared task slots, one per task that may run at the same time
+        :param deadline_slack: Seconds before its deadline at which a task jumps the queue
+        """
+        self._pool = pool
+        self._slots = slots
+        self.deadline_slack = deadline_slack
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # priority -> tenant -> heap
+        self._levels: dict[int, dict[str, list['ScheduledTask']]] = {}
+        self._deadlines: list['ScheduledTask'] = []
+        self._usage: dict[str, float] = {}
+        self._weights: dict[str, float] = {}
+        self._running: dict[int, 'ScheduledTask'] = {}
+        self._paused: dict[int, 'ScheduledTask'] = {}
+        self._queued = 0
+        # 任务分发到进程池时调用，在调度锁内执行
+        self.on_start: Optional[Callable[['ScheduledTask'], None]] = None
+        # 每次运行结束时调用 on_finish(task, result, error, final)，在锁外执行，
+        # final 为 False 表示任务让出工作进程后还会再次运行
+        self.on_finish: Optional[Callable[['ScheduledTask', Optional[Result], Optional[BaseException], bool],
+                                          None]] = None
+
+    def submit(self,
+               protocol: Type['BaseProtocolHandler'],
+               resources: 'Resources',
+               priority: int = 0,
+               tenant: str = 'default',
+               deadline: Optional[float] = None) -> 'Future[Result]':
+        """
+        Queue a download
+
+        :param protocol: Protocol Matcher
+        :param resources: Resource Object
+        :param priority: Higher values are dispatched first
+        :param tenant: Tenant sharing the pool fairly with the other tenants of the same priority
+        :param deadline: Seconds from now by which the task should be dispatched
+        :return: A Future object that returns the result
+        """
+        return self.schedule(protocol, resources, priority, tenant, deadline).future
+
+    def schedule(self,
+                 protocol: Type['BaseProtocolHandler'],
+                 resources: 'Resources',
+                 priority: int = 0,
+                 tenant: str = 'default',
+                 deadline: Optional[float] = None) -> 'ScheduledTask':
+        """
+        Queue a download, see ``submit``
+
+        :return: The scheduled task, its future returns the result
+        """
+        task = ScheduledTask(protocol, resources, priority, tenant,
+                             time.time() + deadline if deadline is not None else None,
+                             next(self._seq), self._slots, self)
+        with self._cond:
+            self._enqueue(task)
+            self._dispatch()
+            if task.slot is None:
+                self._preempt_for(task)
+        return task
+
+    def cancel(self, task: 'ScheduledTask') -> bool:
+        """
+        Cancel a task, a running download stops at its next chunk boundary
+
+        :param task: Task returned by ``schedule``
+        :return: False when the task is already done
+        """
+        with self._cond:
+            if task.future.done() or task.cancelling:
+                return False
+            task.cancelling = True
+            if task.slot is not None:
+                self._slots.set(task.slot, TaskSlots.CONTROL, TaskSlots.CANCEL)
+                logger.info('Cancelling %s', task.resources)
+                return True
+            if task.queued:
+                self._dequeue(task)
+            self._paused.pop(task.seq, None)
+            self._cond.notify_all()
+        # 在锁外完成 future，原因同 _on_done
+        if not task.started:
+            return task.future.cancel()
+        task.future.set_result(Result.CANCEL)
+        return True
+
+    def pause(self, task: 'ScheduledTask') -> bool:
+        """
+        Pause a task, a running download yields its worker at its next chunk boundary
+
+        :param task: Task returned by ``schedule``
+        :return: False when the task is already done, paused or being cancelled
+        """
+        with self._cond:
+            if task.future.done() or task.paused or task.cancelling:
+                return False
+            task.paused = True
+            if task.slot is not None:
+                task.interrupted = True
+                self._slots.set(task.slot, TaskSlots.CONTROL, TaskSlots.PAUSE)
+                logger.info('Pausing %s', task.resources)
+            elif task.queued:
+                self._dequeue(task)
+                self._paused[task.seq] = task
+                self._cond.notify_all()
+        return True
+
+    def resume(self, task: 'ScheduledTask') -> bool:
+        """
+        Resume a paused task
+
+        :param task: Task returned by ``schedule``
+        :return: False when the task is not paused
+        """
+        with self._cond:
+            if not task.paused:
+                return False
+            task.paused = False
+            if self._paused.pop(task.seq, None) is not None:
+                self._enqueue(task)
+                self._dispatch()
+            elif task.slot is not None and not task.cancelling:
+                # 工作进程尚未让出时撤回暂停请求
+                self._slots.set(task.slot, TaskSlots.CONTROL,
+                                TaskSlots.PREEMPT if task.preempting else TaskSlots.RUN)
+        return True
+
+    def cancel_paused(self):
+        """
+        Cancel every paused task
+        """
+        with self._cond:
+            tasks = list(self._paused.values())
+        for task in tasks:
+            self.cancel(task)
+
+    def set_weight(self, tenant: str, weight: float):
+        """
+        Set the fair share weight of a tenant
+
+        :param tenant: Tenant name
+        :param weight: Relative share, defaults to 1
+        """
+        if weight <= 0:
+            raise ValueError("Tenant weight must be positive")
+        with self._cond:
+            self._weights[tenant] = weight
+
+    @property
+    def queued(self) -> int:
+        """等待调度的任务数"""
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        """已分发到进程池的任务数"""
+        return len(self._running)
+
+    @property
+    def paused(self) -> int:
+        """已暂停且未在运行的任务数"""
+        return len(self._paused)
+
+    def running_tasks(self) -> list['ScheduledTask']:
+        """已分发到进程池的任务"""
+        with self._cond:
+            return list(self._running.values())
+
+    def join(self):
+        """
+        Block until every queued and running task has finished, paused tasks are not waited for
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._queued and not self._running)
+
+    def _enqueue(self, task: 'ScheduledTask'):
+        if task.tenant not in self._usage:
+            # 新租户从当前最小用量起步，避免长期空闲的租户独占进程池
+            self._usage[task.tenant] = min(self._usage.values(), default=0)
+        heapq.heappush(self._levels.setdefault(task.priority, {}).setdefault(task.tenant, []), task)
+        if task.deadline is not None:
+            heapq.heappush(self._deadlines, task)
+        task.queued = True
+        self._queued += 1
+
+    def _dequeue(self, task: 'ScheduledTask'):
+        # 截止时间堆中的条目在 _next_task 中惰性删除
+        tenants = self._levels[task.priority]
+        tenants[task.tenant].remove(task)
+        heapq.heapify(tenants[task.tenant])
+        if not tenants[task.tenant]:
+            del tenants[task.tenant]
+            if not tenants:
+                del self._levels[task.priority]
+        task.queued = False
+        self._queued -= 1
+
+    def _next_task(self) -> 'ScheduledTask':
+        # 截止时间堆采用惰性删除，跳过已出队的任务
+        while self._deadlines and not self._deadlines[0].queued:
+            heapq.heappop(self._deadlines)
+        if self._deadlines and self._deadlines[0].deadline - time.time() <= self.deadline_slack:
+            task = heapq.heappop(self._deadlines)
+            tenants = self._levels[task.priority]
+            tenants[task.tenant].remove(task)
+            heapq.heapify(tenants[task.tenant])
+        else:
+            tenants = self._levels[max(self._levels)]
+            tenant = min(tenants, key=lambda name: (self._usage[name], tenants[name][0].seq))
+            task = heapq.heappop(tenants[tenant])
+        if not tenants[task.tenant]:
+            del tenants[task.tenant]
+            if not tenants:
+                del self._levels[task.priority]
+        self._usage[task.tenant] += 1 / self._weights.get(task.tenant, 1)
+        task.queued = False
+        self._queued -= 1
+        return task
+
+    def _dispatch(self):
+        while self._queued and self._slots.available():
+            task = self._next_task()
+            if not task.started:
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+                task.started = True
+            if task.deadline is not None and task.deadline < time.time():
+                logger.warning('Task dispatched after its deadline: %s', task.resources)
+            task.slot = self._slots.acquire()
+            task.preempting = False
+            task.interrupted = False
+            self._running[task.slot] = task
+            if self.on_start:
+                self.on_start(task)
+            try:
+                pool_future = self._pool.run_download(task.protocol, task.resources, task.slot)
+            except Exception as e:
+                self._finish(task)
+                task.future.set_exception(e)
+                continue
+            pool_future.add_done_callback(lambda f, t=task: self._on_done(t, f))
+
+    def _preempt_for(self, task: 'ScheduledTask'):
+        candidates = [t for t in self._running.values()
+                      if not t.preempting and not t.paused and not t.cancelling and t.priority < task.priority]
+        if not candidates:
+            return
+        victim = min(candidates, key=lambda t: (t.priority, -t.seq))
+        victim.preempting = True
+        victim.interrupted = True
+        self._slots.set(victim.slot, TaskSlots.CONTROL, TaskSlots.PREEMPT)
+        logger.info('Preempting %s for %s', victim.resources, task.resources)
+
+    def _finish(self, task: 'ScheduledTask'):
+        task.last_progress = self._slots.snapshot(task.slot)
+        del self._running[task.slot]
+        self._slots.release(task.slot)
+        task.slot = None
+
+    def _on_done(self, task: 'ScheduledTask', pool_future: 'Future[Result]'):
+        error = pool_future.exception()
+        result = None if error else pool_future.result()
+        if isinstance(result, tuple):
+            # 工作进程返回结果与传输统计，只返回 Result 的进程池同样可用
+            result, task.stats = result
+        with self._cond:
+            self._finish(task)
+            # 让出工作进程的任务重新排队，已暂停的等待恢复
+            held = task.interrupted and not task.cancelling and result is Result.WAIT
+            if held:
+                if task.paused:
+                    self._paused[task.seq] = task
+                else:
+                    self._enqueue(task)
+            self._dispatch()
+            self._cond.notify_all()
+        if not held and task.cancelling and result is not None and result & (Result.WAIT | Result.CANCEL):
+            result = Result.CANCEL
+        if self.on_finish:
+            try:
+                self.on_finish(task, result, error, not held)
+            except Exception as e:
+                logger.warning('on_finish hook failed for %s: %s', task.resources, e)
+        if held:
+            return
+        # 在锁外完成 future，回调中可以安全地再次提交任务
+        if error:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
@@ -0,0 +1,248 @@
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Union, Iterator, Optional, TYPE_CHECKING
+
+from ..utils.core import Result
+from ..utils.logger import logger
+
+if TYPE_CHECKING:
+    from ..core import Resources
+
+
+class JobStore:
+    """
+    Crash-safe SQLite job store
+
+    Every submitted resource is recorded together with its state, attempts, bytes on
+    disk and result code. Updates are buffered and committed in batches by a background
+    thread, either when ``batch_size`` updates are pending or after ``commit_interval``
+    seconds, into a database in WAL mode so a crash loses at most the last batch and
+    never corrupts it. Recording an update never waits for the database.
+    """
+    # 任务状态，未完成的状态值小于 DONE，用户取消的任务不再恢复
+    PENDING = 0
+    RUNNING = 1
+    FAILED = 2
+    DONE = 3
+    CANCELLED = 4
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, uri TEXT NOT NULL, save_path TEXT NOT NULL, '
+        'payload BLOB NOT NULL, '
+        'priority INTEGER NOT NULL DEFAULT 0, tenant TEXT NOT NULL DEFAULT \'default\', '
+        'state INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, '
+        'bytes_done INTEGER NOT NULL DEFAULT 0, result INTEGER, updated_at REAL NOT NULL)',
+        # 部分索引只包含未完成的任务，百万行中查询剩余任务只需扫描剩余部分
+        'CREATE INDEX IF NOT EXISTS jobs_unfinished ON jobs(id) WHERE state < 3',
+        # SQLite 不会由 state < 2 推出 state < 3，不含失败任务的查询使用单独的部分索引
+        'CREATE INDEX IF NOT EXISTS jobs_retryable ON jobs(id) WHERE state < 2',
+    )
+    # 查询条件与部分索引的条件字面一致才能使用该索引
+    _UNFINISHED = {False: 'state < 2', True: 'state < 3'}
+    _ADD = ('INSERT INTO jobs (key, uri, save_path, payload, priority, tenant, state, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, 0, ?) '
+            'ON CONFLICT(key) DO UPDATE SET payload = excluded.payload, priority = excluded.priority, '
+            'tenant = excluded.tenant, state = 0, result = NULL, updated_at = excluded.updated_at')
+    _START = 'UPDATE jobs SET state = 1, attempts = attempts + 1, updated_at = ? WHERE key = ?'
+    _FINISH = 'UPDATE jobs SET state = ?, result = ?, bytes_done = ?, updated_at = ? WHERE key = ?'
+    _RESET = 'UPDATE jobs SET state = 0, updated_at = ? WHERE key = ? AND state = 1'
+
+    def __init__(self, path: Union[str, Path], batch_size: int = 500, commit_interval: float = 1.0):
+        """
+        :param path: SQLite database path
+        :param batch_size: Buffered updates that trigger a commit
+        :param commit_interval: Seconds after which buffered updates are committed
+        """
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in self._SCHEMA:
+            self._conn.execute(statement)
+        # _lock 保护数据库连接，_queue_lock 只保护待提交的更新，记录更新时不会等待正在进行的提交
+        self._lock = threading.Lock()
+        self._queue_lock = threading.Lock()
+        self._pending: list[tuple[str, tuple]] = []
+        self._closed = threading.Event()
+        self._full = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='JobStoreFlusher', daemon=True)
+        self._flusher.start()
+
+    @staticmethod
+    def job_key(resources: 'Resources') -> str:
+        """
+        Identity of a job, the same URI saved to the same path is the same job
+
+        :param resources: Resource Object
+        :return: Job key
+        """
+        return f'{resources.uri}\n{resources.save_path}'
+
+    def add(self, resources: 'Resources', priority: int = 0, tenant: str = 'default'):
+        """
+        Record a submitted resource, a job submitted again becomes pending again
+
+        :param resources: Resource Object
+        :param priority: Scheduling priority
+        :param tenant: Scheduling tenant
+        """
+        self._write(self._ADD, (self.job_key(resources), resources.uri, str(resources.save_path),
+                                pickle.dumps(resources, pickle.HIGHEST_PROTOCOL), priority, tenant, time.time()))
+
+    def started(self, resources: 'Resources'):
+        """
+        Mark a job as dispatched to a worker
+
+        :param resources: Resource Object
+        """
+        self._write(self._START, (time.time(), self.job_key(resources)))
+
+    def finished(self, resources: 'Resources', result: Optional['Result']):
+        """
+        Record the outcome of a job
+
+        :param resources: Resource Object
+        :param result: Result of the download, None when the worker raised, ``Result.CANCEL``
+            when the user cancelled it
+        """
+        if result is not None and result & (Result.SUCCESS | Result.EXIST):
+            state = self.DONE
+        elif result is Result.CANCEL:
+            state = self.CANCELLED
+        else:
+            state = self.FAILED
+        try:
+            bytes_done = resources.save_path.stat().st_size
+        except OSError:
+            bytes_done = 0
+        self._write(self._FINISH, (state, int(result) if result is not None else None, bytes_done, time.time(),
+                                   self.job_key(resources)))
+
+    def reset(self, resources: 'Resources'):
+        """
+        Return a dispatched job to pending, e.g. after it was cancelled
+
+        :param resources: Resource Object
+        """
+        self._write(self._RESET, (time.time(), self.job_key(resources)))
+
+    def remaining(self, include_failed: bool = False) -> int:
+        """
+        Number of jobs left to do
+
+        :param include_failed: Also count failed jobs
+        :return: Number of jobs
+        """
+        self.flush()
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT COUNT(*) FROM jobs WHERE {self._UNFINISHED[include_failed]}'
+            ).fetchone()[0]
+
+    def counts(self) -> dict[str, int]:
+        """
+        Number of jobs per state
+
+        :return: {'pending': n, 'running': n, 'failed': n, 'done': n, 'cancelled': n}
+        """
+        self.flush()
+        names = {self.PENDING: 'pending', self.RUNNING: 'running', self.FAILED: 'failed', self.DONE: 'done',
+                 self.CANCELLED: 'cancelled'}
+        counts = dict.fromkeys(names.values(), 0)
+        with self._lock:
+            for state, count in self._conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'):
+                counts[names[state]] = count
+        return counts
+
+    def unfinished(self, include_failed: bool = False, page_size: int = 1000) -> Iterator[dict]:
+        """
+        Lazily iterate the jobs left to do in submission order
+
+        Jobs that were running when the process died are included.
+
+        :param include_failed: Also retry failed jobs
+        :param page_size: Rows read per query
+        :return: Iterator of {'resources', 'priority', 'tenant'} entries for ``Downloader.submit_many``
+        """
+        self.flush()
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT id, payload, priority, tenant FROM jobs '
+                    f'WHERE {self._UNFINISHED[include_failed]} AND id > ? ORDER BY id LIMIT ?',
+                    (last_id, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for last_id, payload, priority, tenant in rows:
+                yield {'resources': pickle.loads(payload), 'priority': priority, 'tenant': tenant}
+
+    def flush(self):
+        """
+        Commit the buffered updates
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """
+        Commit the buffered updates and close the database
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._full.set()
+        self._flusher.join()
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def _write(self, statement: str, params: tuple):
+        # 只加入队列，由后台线程提交，调度器分发任务时不访问数据库
+        with self._queue_lock:
+            self._pending.append((statement, params))
+            if len(self._pending) >= self.batch_size:
+                self._full.set()
+
+    def _flush(self):
+        with self._queue_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            self._conn.execute('BEGIN')
+            for statement, params in pending:
+                self._conn.execute(statement, params)
+            self._conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+            # 放回队首，下次提交时按原顺序重试
+            with self._queue_lock:
+                self._pending[:0] = pending
+            logger.error('Unable to commit %s job updates to %s, retrying: %s', len(pending), self.path, e)
+
+    def _flush_loop(self):
+        while True:
+            self._full.wait(self.commit_interval)
+            self._full.clear()
+            if self._closed.is_set():
+                return
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f'<JobStore {self.path}>'
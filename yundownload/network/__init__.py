@@ -1,5 +1,93 @@
-from yundownload.network.base import BaseProtocolHandler
-from yundownload.network.http import HttpProtocolHandler
-from yundownload.network.ftp import FTPProtocolHandler
-from yundownload.network.sftp import SFTPProtocolHandler
-from yundownload.network.m3u import M3U8ProtocolHandler
\ No newline at end of file
+"""
+Protocol handlers
+
+Handlers are registered by scheme and only imported when a URI needs them, so
+importing yundownload does not pull in httpx, paramiko, m3u8 or pycryptodome.
+"""
+import importlib
+from typing import TYPE_CHECKING, Type, Union
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from yundownload.network.base import BaseProtocolHandler
+
+
+class LazyProtocol:
+    """
+    Protocol handler imported on first use
+    """
+    __slots__ = ('name', 'module', 'attribute', 'schemes', 'suffixes')
+
+    def __init__(self, name: str, module: str, attribute: str, schemes: tuple[str, ...],
+                 suffixes: tuple[str, ...] = ()):
+        """
+        :param name: Protocol name used by ``Downloader(preload=...)``
+        :param module: Module defining the handler
+        :param attribute: Handler class name
+        :param schemes: URI schemes the handler may support
+        :param suffixes: URI path suffixes the handler may support, any when empty
+        """
+        self.name = name
+        self.module = module
+        self.attribute = attribute
+        self.schemes = schemes
+        self.suffixes = suffixes
+
+    def load(self) -> Type['BaseProtocolHandler']:
+        """
+        Import the handler class
+        """
+        return getattr(importlib.import_module(self.module), self.attribute)
+
+    def check_protocol(self, uri: str) -> bool:
+        # 先按 scheme 与后缀筛选，只有可能匹配时才导入处理器
+        parsed = urlparse(uri)
+        if parsed.scheme not in self.schemes:
+            return False
+        if self.suffixes and not parsed.path.endswith(self.suffixes):
+            return False
+        return self.load().check_protocol(uri)
+
+    def __repr__(self):
+        return f'<LazyProtocol {self.name} {self.module}.{self.attribute}>'
+
+
+# 按匹配优先级排列
+PROTOCOLS: list['LazyProtocol'] = [
+    LazyProtocol('m3u8', 'yundownload.network.m3u', 'M3U8ProtocolHandler', ('http', 'https'), ('.m3u8',)),
+    LazyProtocol('http', 'yundownload.network.http', 'HttpProtocolHandler', ('http', 'https')),
+    LazyProtocol('ftp', 'yundownload.network.ftp', 'FTPProtocolHandler', ('ftp',)),
+    LazyProtocol('sftp', 'yundownload.network.sftp', 'SFTPProtocolHandler', ('sftp',)),
+]
+
+_EXPORTS = {
+    'BaseProtocolHandler': 'yundownload.network.base',
+    **{protocol.attribute: protocol.module for protocol in PROTOCOLS},
+}
+
+
+def resolve_protocol(protocol: Union['LazyProtocol', Type['BaseProtocolHandler']]) -> Type['BaseProtocolHandler']:
+    """
+    Get the handler class of a registered protocol
+    """
+    return protocol.load() if isinstance(protocol, LazyProtocol) else protocol
+
+
+def preload_protocols(names):
+    """
+    Import the handlers of the given protocol names, used to warm up pool workers
+
+    :param names: Protocol names, e.g. ('http', 'sftp')
+    """
+    for protocol in PROTOCOLS:
+        if protocol.name in names:
+            protocol.load()
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['LazyProtocol', 'PROTOCOLS', 'resolve_protocol', 'preload_protocols', *_EXPORTS]
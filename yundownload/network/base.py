@@ -1,17 +1,36 @@
 import os
+import shutil
+import threading
 import time
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
 
 from yundownload.utils import retry
-from yundownload.utils.core import Environment
-
-from yundownload.utils.tools import Interval
+from yundownload.utils.checksum import Checksum
+from yundownload.utils.chunking import ChunkSizer
+from yundownload.utils.config import DEFAULT_MERGE_CHUNK_SIZE
+from yundownload.utils.content import ContentStore
+from yundownload.utils.reporter import reporter
+from yundownload.utils.space import merged_path, reserve
+from yundownload.utils.tools import convert_slice_path
 from yundownload.utils import Result
+from yundownload.utils.exceptions import (InterruptException, PreemptException, PauseException, CancelException,
+                                          ChecksumMismatchException, InsufficientSpaceException)
 from yundownload.utils.logger import logger
+from yundownload.utils.stats import TransferStats
+from yundownload.utils.trace import RequestTimings, TimingSummary
+from yundownload.utils.work import TaskSlots
 
 if TYPE_CHECKING:
     from yundownload.core import Resources
+    from yundownload.utils.reporter import Snapshot
+    from yundownload.utils.sink import Sink
+    from yundownload.utils.work import TaskSlot
+
+# 切片下载与合并的逐块日志
+slice_logger = logger.subsystem('slice')
 
 
 class BaseProtocolHandler(ABC):
@@ -22,16 +41,44 @@ class BaseProtocolHandler(ABC):
         """
         self.start_time = time.time()
         self.current_size = 0
-        self._last_current_size = 0
-        self._last_time = time.time()
         self._total_size = 0
         self._total = 0
         self._steps = 0
         self.resources = None
-        self.timer = Interval(int(os.getenv(Environment.LOG_EVERY, 5)), self._print)
-
-    def _print(self):
-        logger.resource_p2s(self.resources, self.progress, self.speed)
+        self.task_slot: Optional['TaskSlot'] = None
+        # 内容存储中标识该资源内容的键（如 HTTP ETag），由具体协议设置
+        self.content_key: Optional[str] = None
+        # 进程内的进度报告线程最近一次采样的结果
+        self.snapshot: Optional['Snapshot'] = None
+        # 传输统计，峰值由进度报告线程采样，避免在读取循环中计算
+        self.stats: Optional['TransferStats'] = None
+        self._mode: Optional[str] = None
+        self._slices = 0
+        self._resumed_size = 0
+        self._retried_size = 0
+        self._attempts = 0
+        self._called_at = time.monotonic()
+        self._first_byte_time: Optional[float] = None
+        self._peak_speed = 0
+        self._peak_concurrency = 0
+        self._timings = TimingSummary()
+        # 本次传输的读取大小，由各协议的读取循环共同调节
+        self._sizer = ChunkSizer()
+        # 期望的整个文件摘要、流式下载中累计的摘要与校验通过的摘要
+        self._checksum: Optional['Checksum'] = None
+        self._digest = None
+        self._verified: Optional[str] = None
+        # 设置后内容按顺序交给它而不写入保存路径，见 Downloader.stream
+        self.sink: Optional['Sink'] = None
+        # 已交给 sink 的字节数，与本次尝试中需要丢弃的重复字节数
+        self._delivered = 0
+        self._skip = 0
+        # 交给 sink 的内容的摘要，跨越重试累计
+        self._sink_digest = None
+        # 最近一次失败的异常
+        self.error: Optional[BaseException] = None
+        # 本次调用中按区间摘要校验过的完整切片，整个文件校验失败时保留
+        self._verified_slices: set[Path] = set()
 
     @property
     def progress(self) -> float:
@@ -51,19 +98,18 @@ class BaseProtocolHandler(ABC):
     @property
     def speed(self) -> float:
         """
-        Get the download speed
+        Get the download speed, smoothed over the samples of the progress reporter
 
-        :return: Download speed
+        :return: Download speed in bytes per second
         """
-        if self.current_size == 0:
-            return 0
-        current_size = self.current_size - self._last_current_size
-        self._last_current_size = self.current_size
-        if time.time() - self._last_time == 0:
-            return 0
-        speed = current_size / (time.time() - self._last_time)
-        self._last_time  = time.time()
-        return speed
+        return self.snapshot.speed if self.snapshot is not None else 0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        Seconds left at the current speed, None when unknown
+        """
+        return self.snapshot.eta if self.snapshot is not None else None
 
     @staticmethod
     @abstractmethod
@@ -84,45 +130,368 @@ class BaseProtocolHandler(ABC):
         :return: Result object
         """
         logger.resource_start(resources)
+        self._called_at = time.monotonic()
+        self._delivered = 0
+        self._sink_digest = None
+        self.error = None
+        self._verified_slices = set()
         try:
-            self.timer.start()
             self.resources = resources
+            reporter.register(self)
             result = retry(
                 retry_count=resources.retry,
                 retry_delay=resources.retry_delay,
-                before_retry=self._flush()
+                before_retry=self._before_attempt,
+                # 磁盘空间不足时重试没有意义
+                no_retry=(InterruptException, InsufficientSpaceException)
             )(self.download)(resources)
+            if result.is_success() and self.sink is not None:
+                self._finish_sink_digest()
             if result.is_success():
+                self._store_content(resources)
                 logger.resource_result(resources, result)
             elif result.is_exist():
                 logger.resource_exist(resources)
+        except CancelException as e:
+            result = Result.CANCEL
+            logger.resource_log(resources, str(e))
+        except InterruptException as e:
+            result = Result.WAIT
+            logger.resource_log(resources, str(e))
         except Exception as e:
             result = Result.FAILURE
+            self.error = e
             logger.resource_error(resources, e)
         finally:
-            self.timer.cancel()
-            self._print()
+            reporter.unregister(self)
+            self.stats = self._collect_stats(resources)
+            resources.record_profile()
 
         return result
 
+    def _before_attempt(self):
+        self._attempts += 1
+        if self._attempts > 1:
+            self._retried_size += self.current_size - self._resumed_size
+        self._flush()
+
+    def _add_resumed(self, size: int):
+        """
+        Count bytes that were already on disk from an earlier run
+        """
+        self.current_size += size
+        self._resumed_size += size
+
+    def _mark_first_byte(self):
+        if self._first_byte_time is None:
+            self._first_byte_time = time.monotonic()
+
+    def _deliver(self, data: bytes):
+        """
+        Pass the next bytes of the content to the sink
+
+        An attempt that starts over from the beginning drops the bytes delivered by the
+        attempts before it, so the sink receives every byte once and in order.
+        """
+        if self._skip:
+            if len(data) <= self._skip:
+                self._skip -= len(data)
+                return
+            data = data[self._skip:]
+            self._skip = 0
+        if self._checksum is not None:
+            # 摘要必须从第一个字节开始计算
+            if self._sink_digest is None and not self._delivered:
+                self._sink_digest = self._checksum.new()
+            if self._sink_digest is not None:
+                self._sink_digest.update(data)
+        self.sink.write(data)
+        self._delivered += len(data)
+
+    def _finish_sink_digest(self):
+        """
+        Compare the digest of the delivered content with the expected digest
+
+        :raise ChecksumMismatchException: The content differs, the sink already received it
+        """
+        if self._sink_digest is None:
+            return
+        digest, self._sink_digest = self._sink_digest, None
+        if not self._checksum.matches(digest):
+            raise ChecksumMismatchException(self.resources.uri, self._checksum.describe(),
+                                            self._checksum.describe(digest))
+        self._verified = self._checksum.describe()
+
+    def _trace(self) -> 'RequestTimings':
+        """
+        Start timing a request, its phases are added to the statistics of this download
+        """
+        return RequestTimings(self._timings)
+
+    def _collect_stats(self, resources: 'Resources') -> 'TransferStats':
+        wall_time = time.monotonic() - self._called_at
+        transferred = self._retried_size + self.current_size - self._resumed_size
+        semaphore = resources.semaphore
+        return TransferStats(
+            mode=self._mode,
+            bytes=transferred,
+            resumed_bytes=self._resumed_size,
+            total_size=self._total_size,
+            wall_time=wall_time,
+            ttfb=self._first_byte_time - self._called_at if self._first_byte_time is not None else None,
+            # 短于一个采样间隔的下载以平均速度为峰值
+            peak_speed=max(self._peak_speed, transferred / wall_time if wall_time > 0 else 0),
+            retries=max(self._attempts - 1, 0),
+            slices=self._slices,
+            segments=self._total,
+            peak_concurrency=max(self._peak_concurrency, semaphore.current_target if semaphore is not None else 0),
+            controller=resources.dcc.snapshot() if semaphore is not None else None,
+            timings=self._timings if self._timings.requests else None,
+            chunk_size=self._sizer.size if self._mode in ('stream', 'sliced', 'segments') else 0,
+            checksum=self._verified
+        )
+
+    def checkpoint(self):
+        """
+        Interruption point, called between slices and segments and after every chunk read
+
+        Partial slice and segment files are left in place, so the download resumes from them.
+
+        :raise PreemptException: The scheduler asked this download to yield its worker
+        :raise PauseException: The download was paused
+        :raise CancelException: The download was cancelled
+        """
+        if self.task_slot is None:
+            return
+        control = self.task_slot.control
+        if control == TaskSlots.RUN:
+            return
+        if control == TaskSlots.PREEMPT:
+            raise PreemptException(self.resources.uri)
+        if control == TaskSlots.PAUSE:
+            raise PauseException(self.resources.uri)
+        if control == TaskSlots.CANCEL:
+            raise CancelException(self.resources.uri)
+
+    def _from_content_store(self, resources: 'Resources') -> bool:
+        """
+        Materialize the resource from the content store when its content key is known
+
+        :return: Whether the save path was created from the store
+        """
+        store = ContentStore.current()
+        if store is None or self.content_key is None:
+            return False
+        try:
+            return store.materialize(self.content_key, resources.save_path)
+        except OSError as e:
+            logger.warning('content store unavailable for %s: %s', resources.uri, e)
+            return False
+
+    def _store_content(self, resources: 'Resources'):
+        store = ContentStore.current()
+        if store is None or self.sink is not None or not resources.save_path.is_file():
+            return
+        # 已按 SHA-256 校验的内容无需再次读取
+        digest = self._verified[7:] if self._verified and self._verified.startswith('sha256:') else None
+        try:
+            store.add(resources.save_path, self.content_key, digest)
+        except OSError as e:
+            logger.warning('unable to add %s to the content store: %s', resources.save_path, e)
+
     def _flush(self):
         """
         Flush the current status
         """
         self.current_size = 0
-        self._last_current_size = 0
-        self._last_time = time.time()
         self._total_size = 0
         self._total = 0
         self._steps = 0
+        self._resumed_size = 0
+        self._mode = None
+        self._slices = 0
+        self._digest = None
+        self._verified = None
         self.start_time = time.time()
 
+    def _check_existing(self, path: Path) -> bool:
+        """
+        Whether a file that looks complete can be kept, checked by its digest when one is expected
+
+        A file failing the check is removed so it is downloaded again.
+        """
+        if self._checksum is None:
+            return True
+        digest = self._checksum.hash_file(path)
+        if self._checksum.matches(digest):
+            self._verified = self._checksum.describe()
+            return True
+        logger.warning('existing file %s does not match %s, downloading it again', path, self._checksum.describe())
+        path.unlink()
+        return False
+
+    def _begin_digest(self, path: Optional[Path] = None, resumed: int = 0):
+        """
+        Start hashing the written content when a digest is expected
+
+        :param path: File whose first resumed bytes are already on disk
+        :param resumed: Bytes kept from an earlier run, hashed from the file
+        :return: The running hash to update with every chunk, None without an expected digest
+        """
+        if self._checksum is None:
+            self._digest = None
+        elif resumed:
+            self._digest = self._checksum.hash_file(path, resumed)
+        else:
+            self._digest = self._checksum.new()
+        return self._digest
+
+    def _finish_digest(self, path: Path):
+        """
+        Compare the running hash with the expected digest
+
+        :raise ChecksumMismatchException: The content differs, the file is removed
+        """
+        if self._digest is None:
+            return
+        digest, self._digest = self._digest, None
+        if not self._checksum.matches(digest):
+            path.unlink(missing_ok=True)
+            raise ChecksumMismatchException(self.resources.uri, self._checksum.describe(),
+                                            self._checksum.describe(digest))
+        self._verified = self._checksum.describe()
+        logger.debug('checksum verified: %s %s', path, self._verified)
+
+    def _threaded_sliced_download(self,
+                                  resources: 'Resources',
+                                  content_length: int,
+                                  sliced_chunk_size: int,
+                                  fetch_range: Callable[[int, int, Callable[[bytes], None]], None]) -> 'Result':
+        """
+        Download slices in parallel from a thread pool under the adaptive semaphore
+
+        Used by the blocking protocol handlers, each slice is fetched on its own connection
+        and resumed from the size of its slice file.
+
+        :param resources: Resource object
+        :param content_length: Remote file size
+        :param sliced_chunk_size: Size of a slice
+        :param fetch_range: Callable(start, end, write) that passes the bytes start..end (inclusive) to write
+        :return: Result
+        """
+        resources.update_semaphore(thread_safe=True)
+        sem = resources.semaphore
+        path_template = convert_slice_path(resources.save_path)
+        size_lock = threading.Lock()
+
+        def download_slice(start: int, end: int) -> Path:
+            slice_path = path_template(start)
+            with sem:
+                self.checkpoint()
+                offset = start
+                if slice_path.exists():
+                    slice_size = slice_path.stat().st_size
+                    if slice_size > end - start + 1:
+                        slice_logger.debug('slice size is larger than the slice size: %s to %s', resources.uri, slice_path)
+                        slice_path.unlink()
+                        slice_size = 0
+                    offset += slice_size
+                    with size_lock:
+                        self._add_resumed(slice_size)
+                    if offset > end:
+                        slice_logger.debug('slice exist skip download: %s to %s', resources.uri, slice_path)
+                        return slice_path
+
+                slice_logger.debug('start sliced download: %s to %s %s-%s', resources.uri, slice_path, offset, end)
+                with slice_path.open('ab') as f:
+                    def write(data: bytes):
+                        self._mark_first_byte()
+                        f.write(data)
+                        with size_lock:
+                            self.current_size += len(data)
+                        self.checkpoint()
+
+                    begin = time.monotonic()
+                    try:
+                        fetch_range(offset, end, write)
+                    except InterruptException:
+                        raise
+                    except Exception:
+                        sem.record_result(success=False)
+                        sem.adaptive_update()
+                        raise
+                sem.record_result(time.monotonic() - begin, True, end - offset + 1)
+                sem.adaptive_update()
+            slice_logger.debug('sliced download success: %s to %s', resources.uri, slice_path)
+            return slice_path
+
+        self._mode = 'sliced'
+        self._slices = -(-content_length // sliced_chunk_size)
+        reserve(resources.save_path, content_length,
+                [path_template(start) for start in range(0, content_length, sliced_chunk_size)])
+        with ThreadPoolExecutor(max_workers=resources.dcc.max_concurrency) as pool:
+            futures = [
+                pool.submit(download_slice, start, min(start + sliced_chunk_size, content_length) - 1)
+                for start in range(0, content_length, sliced_chunk_size)
+            ]
+            try:
+                chunks_path = [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        self._merge_chunk(resources.save_path, chunks_path)
+        return Result.SUCCESS
+
+    def _merge_chunk(self, save_path: Path, result: list[Path]):
+        """
+        Concatenate the slices into save_path and remove them
+
+        The slices are written into the merged file reserved by ``reserve`` and renamed when
+        complete, so an interrupted merge never leaves a save path that looks complete.
+        The expected digest is checked on the merged file before the slices are removed.
+
+        :raise ChecksumMismatchException: The merged content differs, the slices verified
+            by a digest of their range are kept, the others are removed
+        """
+        merged = merged_path(save_path)
+        digest = self._begin_digest()
+        # 保留预分配的空间，写完后截断到实际长度
+        with merged.open('r+b' if merged.exists() else 'wb') as f:
+            for chunk_path in result:
+                with chunk_path.open('rb') as f_chunk:
+                    if digest is None:
+                        shutil.copyfileobj(f_chunk, f, DEFAULT_MERGE_CHUNK_SIZE)
+                    else:
+                        # 合并时本就要读取全部切片，顺带计算摘要
+                        while block := f_chunk.read(DEFAULT_MERGE_CHUNK_SIZE):
+                            digest.update(block)
+                            f.write(block)
+                slice_logger.debug('merge chunk success: %s to %s', save_path, chunk_path)
+            f.truncate()
+        try:
+            self._finish_digest(merged)
+        except ChecksumMismatchException:
+            # 无法判断是哪个未校验的切片出错，重试时只重新下载这些切片
+            for chunk_path in result:
+                if chunk_path not in self._verified_slices:
+                    chunk_path.unlink(missing_ok=True)
+            raise
+        os.replace(merged, save_path)
+        for chunk_path in result:
+            chunk_path.unlink()
+            slice_logger.debug('delete chunk success: %s', chunk_path)
+        slice_logger.info('merge file success: %s', save_path)
+
     @abstractmethod
     def download(self, resources: 'Resources') -> 'Result':  # noqa
         """
         Download resources
         """
         self._flush()
+        self._checksum = Checksum.parse(resources.checksum) if resources.checksum else None
+        # 默认每次尝试从头传输，能从已交付位置继续的协议将其清零
+        self._skip = self._delivered
         pass
 
     @abstractmethod
@@ -1,12 +1,17 @@
 from ftplib import FTP, error_perm, error_reply
 from pathlib import Path
+from typing import Callable
 from urllib.parse import urlparse, unquote
 
 from yundownload.core.resources import Resources
 from yundownload.network.base import BaseProtocolHandler
 from yundownload.utils.core import Result
 from yundownload.utils.exceptions import ConnectionException, AuthException
-from yundownload.utils.logger import logger
+from yundownload.utils.logger import logger as download_logger
+from yundownload.utils.space import reserve
+
+
+logger = download_logger.subsystem('ftp')
 
 
 class FTPProtocolHandler(BaseProtocolHandler):
@@ -15,6 +20,7 @@ class FTPProtocolHandler(BaseProtocolHandler):
         self.ftp = None
         self.support_rest = False
         self.support_size = False
+        self._login_info = None
 
     @staticmethod
     def check_protocol(uri: str) -> bool:
@@ -41,41 +47,98 @@ class FTPProtocolHandler(BaseProtocolHandler):
             # 某些FTP服务器不需要前导斜杠
             remote_path = remote_path[1:]
         if not remote_path:
-            logger.error(f"Empty remote path in URI: {uri}")
+            logger.error("Empty remote path in URI: %s", uri)
             return Result.FAILURE
 
+        self._login_info = (host, port, resources.ftp_timeout, username, password)
         self._connect(host, port, resources.ftp_timeout)
         self._login(username, password)
 
-        logger.info(f"Login success to {uri}")
+        logger.info("Login success to %s", uri)
 
         file_size = self._get_remote_size(remote_path)
 
+        if self.sink is not None:
+            # 内存中无法重组乱序到达的区间，下载到 sink 时只使用单连接
+            self._total_size = file_size
+            self._mode = 'stream'
+            start_pos = self._delivered if self.support_rest else 0
+            self._skip = self._delivered - start_pos
+            self._add_resumed(start_pos)
+            logger.info("FTP download to sink started from %s", uri)
+            if not self._retrieve(remote_path, start_pos, self._deliver):
+                logger.error("The FTP transfer did not complete %s", uri)
+                return Result.FAILURE
+            return Result.SUCCESS
+
         prepare = self._prepare_local_file(local_path, file_size)
         self._total_size = file_size
-        if prepare == Result.EXIST:
+        if prepare == Result.EXIST and self._check_existing(local_path):
             return Result.EXIST
 
+        if self.support_rest and file_size > resources.ftp_slice_threshold:
+            logger.info('sliced download: %s %s to %s', file_size, uri, local_path)
+            return self._threaded_sliced_download(
+                resources,
+                file_size,
+                resources.ftp_sliced_chunk_size,
+                lambda start, end, write: self._fetch_range(remote_path, start, end, write)
+            )
+
+        reserve(local_path, file_size)
         with open(local_path, "ab" if self.support_rest else "wb") as f:
-            self.current_size += local_path.stat().st_size
+            self._mode = 'stream'
+            self._add_resumed(local_path.stat().st_size)
             start_pos = f.tell()
+            digest = self._begin_digest(local_path, start_pos)
 
             if self.support_rest and start_pos > 0:
-                logger.info(f"FTP download resuming from {uri}")
-                self.ftp.voidcmd(f"REST {start_pos}")
-
-            def write_chunk(data: bytes):
-                f.write(data) # noqa
-                self.current_size += len(data)
+                # retrbinary 会携带 rest 发送 REST 命令
+                logger.info("FTP download resuming from %s", uri)
 
-            logger.info(f"FTP download started from {uri}")
-            resp = self.ftp.retrbinary(f"RETR {remote_path}", write_chunk, rest=start_pos)
+            def write(data: bytes):
+                f.write(data)
+                if digest is not None:
+                    digest.update(data)
 
-            if not resp.startswith("226"):
-                logger.error(f"The FTP transfer did not complete {uri}")
+            logger.info("FTP download started from %s", uri)
+            if not self._retrieve(remote_path, start_pos, write):
+                logger.error("The FTP transfer did not complete %s", uri)
                 return Result.FAILURE
 
-            return Result.SUCCESS
+        self._finish_digest(local_path)
+        return Result.SUCCESS
+
+    def _retrieve(self, remote_path: str, start_pos: int, write: Callable[[bytes], None]) -> bool:
+        """在控制连接上从 start_pos 开始下载，返回传输是否完整"""
+        # 与 retrbinary 相同，但读取大小随传输自适应，而非固定的 8 KiB
+        self.ftp.voidcmd("TYPE I")
+        with self.ftp.transfercmd(f"RETR {remote_path}", rest=start_pos or None) as conn:
+            for data in self._sizer.reads(conn.recv):
+                self._mark_first_byte()
+                write(data)
+                self.current_size += len(data)
+                self.checkpoint()
+        return self.ftp.voidresp().startswith("226")
+
+    def _fetch_range(self, remote_path: str, start: int, end: int, write: Callable[[bytes], None]):
+        """在独立的连接上使用 REST 下载 start..end 区间"""
+        host, port, timeout, username, password = self._login_info
+        ftp = FTP()
+        try:
+            ftp.connect(host, port, timeout=timeout)
+            ftp.login(username, password)
+            ftp.voidcmd("TYPE I")
+            remaining = end - start + 1
+            with ftp.transfercmd(f"RETR {remote_path}", rest=start) as conn:
+                for data in self._sizer.reads(conn.recv, remaining):
+                    write(data)
+                    remaining -= len(data)
+            if remaining:
+                raise IOError(f"FTP range {start}-{end} ended {remaining} bytes early")
+        finally:
+            # 区间读完后服务器会回复 426/226，直接断开控制连接即可
+            ftp.close()
 
     def close(self):
         """关闭连接"""
@@ -91,7 +154,6 @@ class FTPProtocolHandler(BaseProtocolHandler):
         self.ftp = FTP()
         try:
             self.ftp.connect(host, port, timeout=timeout)
-            self._detect_capabilities()
         except Exception as e:
             raise ConnectionException(f"FTP connection failed: {e}")
 
@@ -103,23 +165,31 @@ class FTPProtocolHandler(BaseProtocolHandler):
                 raise AuthException("FTP authentication failed")
         except error_perm as e:
             raise AuthException(f"Authentication error: {e}")
+        # 多数服务器登录前拒绝 REST/SIZE，登录后再检测
+        self._detect_capabilities()
 
     def _detect_capabilities(self):
         """检测服务器能力"""
+        # 部分服务器在 ASCII 模式下拒绝 REST，先切换到二进制模式
+        self.ftp.voidcmd("TYPE I")
         try:
-            # 检测REST支持
-            self.ftp.voidcmd("REST 0")
-            self.support_rest = True
-        except error_perm:
-            self.support_rest = False
+            features = self.ftp.sendcmd("FEAT").upper()
+        except (error_perm, error_reply):
+            features = ""
 
-        try:
-            # 检测SIZE支持
-            self.ftp.voidcmd("TYPE I")
-            self.ftp.size("")
-            self.support_size = True
-        except error_perm:
-            self.support_size = False
+        # 只按 FEAT 判断 REST 支持，探测用的 REST 会留下未消费的续传位置，
+        # 下载时由 transfercmd 紧接在 RETR 之前发送 REST
+        self.support_rest = "REST STREAM" in features
+
+        # 检测SIZE支持
+        self.support_size = "SIZE" in features
+        if not self.support_size:
+            try:
+                self.ftp.size("/")
+                self.support_size = True
+            except error_perm as e:
+                # 550 表示命令可用但路径不是文件
+                self.support_size = str(e).startswith("550")
 
     def _get_remote_size(self, remote_path: str) -> int:
         """获取远程文件大小"""
@@ -1,20 +1,35 @@
 import asyncio
+import os
+from importlib.util import find_spec
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-import aiofiles
 import httpx
 
 from yundownload.network.base import BaseProtocolHandler
-from yundownload.utils.config import DEFAULT_HEADERS, DEFAULT_CHUNK_SIZE
+from yundownload.utils.checksum import Checksum
+from yundownload.utils.config import DEFAULT_HEADERS
+from yundownload.utils.content import ContentStore
 from yundownload.utils.core import Result
 from yundownload.utils.equilibrium import DynamicSemaphore
-from yundownload.utils.logger import logger
+from yundownload.utils.exceptions import ChecksumMismatchException
+from yundownload.utils.logger import logger as download_logger
+from yundownload.utils.profiler import run_coroutine
+from yundownload.utils.sink import OrderedParts
+from yundownload.utils.space import reserve
 from yundownload.utils.tools import convert_slice_path
+from yundownload.utils.writer import writer
 
 if TYPE_CHECKING:
     from yundownload.core.resources import Resources
 
+logger = download_logger.subsystem('http')
+
+# httpx 在安装了对应的库时才能解码 brotli 与 zstd
+COMPRESSED_ENCODINGS = ', '.join(['gzip', 'deflate'] +
+                                 (['br'] if find_spec('brotli') or find_spec('brotlicffi') else []) +
+                                 (['zstd'] if find_spec('zstandard') else []))
+
 
 class HttpProtocolHandler(BaseProtocolHandler):
 
@@ -93,13 +108,17 @@ class HttpProtocolHandler(BaseProtocolHandler):
         return check_uri.startswith('http') or check_uri.startswith('https')
 
     def _match_method(self, resources: 'Resources') -> Result:
+        # 只有探测与压缩传输请求压缩编码，区间请求始终针对未编码的内容
+        probe_headers = {'Accept-Encoding': COMPRESSED_ENCODINGS} if resources.http_compression else None
         try:
-            test_response = self.client.head(resources.uri)
+            test_response = self.client.head(resources.uri, headers=probe_headers,
+                                             extensions={'trace': self._trace().trace})
             test_response.raise_for_status()
             content_length = int(test_response.headers.get('Content-Length', 0))
         except httpx.HTTPStatusError as e:
             try:
-                with self.client.stream(self._method, resources.uri, data=resources.http_data) as test_response:
+                with self.client.stream(self._method, resources.uri, data=resources.http_data, headers=probe_headers,
+                                        extensions={'trace': self._trace().trace}) as test_response:
                     test_response.raise_for_status()
                     content_length = int(test_response.headers.get('Content-Length', 0))
             except Exception as e2:
@@ -109,54 +128,227 @@ class HttpProtocolHandler(BaseProtocolHandler):
             logger.error(e, exc_info=True)
             return Result.FAILURE
 
+        if self.sink is not None:
+            return self._sink_download(resources, content_length, test_response)
+        if resources.http_compression and test_response.headers.get('Content-Encoding', 'identity') != 'identity':
+            return self._compressed_download(resources, content_length)
+        if self._checksum is None:
+            self._checksum = Checksum.from_headers(test_response.headers)
         if resources.save_path.exists():
-            if resources.save_path.stat().st_size == content_length:
+            file_size = resources.save_path.stat().st_size
+            if file_size == content_length and self._check_existing(resources.save_path):
                 return Result.EXIST
-            elif resources.save_path.stat().st_size > content_length:
+            elif file_size > content_length:
                 resources.save_path.unlink()
+        store = ContentStore.current()
+        if store:
+            self.content_key = store.etag_key(resources.uri, test_response.headers.get('ETag'), content_length)
+            if self._from_content_store(resources):
+                self._mode = 'store'
+                return Result.EXIST
         resources.save_path.parent.mkdir(parents=True, exist_ok=True)
         breakpoint_flag = self._breakpoint_resumption(test_response)
         resources.metadata['_breakpoint_flag'] = breakpoint_flag
         self._total_size = content_length
         if breakpoint_flag and content_length > self._slice_threshold and not resources.http_stream:
-            logger.info(f'sliced download: {content_length} {resources.uri} to {resources.save_path}')
-            return asyncio.run(self._sliced_download(resources, content_length))
+            logger.info('sliced download: %s %s to %s', content_length, resources.uri, resources.save_path)
+            return run_coroutine(self._sliced_download(resources, content_length))
         else:
-            logger.info(f'stream download: {resources.uri} to {resources.save_path}')
+            logger.info('stream download: %s to %s', resources.uri, resources.save_path)
             return self._stream_download(resources, content_length)
 
+    def _compressed_download(self, resources: 'Resources', encoded_length: int) -> Result:
+        """
+        Stream an encoded response and write it decompressed
+
+        The length, ranges and digest headers of the response refer to the encoded bytes, so the
+        decoded file is written next to the save path and renamed when complete. An existing save
+        path is therefore complete, while a partial file is written again from the start.
+
+        :param encoded_length: Content-Length of the encoded response, 0 when unknown
+        """
+        if resources.save_path.exists() and self._check_existing(resources.save_path):
+            logger.info('file exist skip download: %s to %s', resources.uri, resources.save_path)
+            return Result.EXIST
+        resources.save_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = convert_slice_path(resources.save_path)('decoded')
+        logger.info('compressed download: %s to %s', resources.uri, resources.save_path)
+        with self.client.stream(self._method,
+                                resources.uri,
+                                headers={'Accept-Encoding': COMPRESSED_ENCODINGS},
+                                data=resources.http_data,
+                                extensions={'trace': self._trace().trace}) as response:
+            response.raise_for_status()
+            self._mode = 'stream'
+            self._total_size = encoded_length
+            self._mark_first_byte()
+            # 只能校验调用方给出的解码后内容的摘要
+            digest = self._begin_digest()
+            decoded = 0
+            with partial_path.open('wb') as f:
+                for chunk in self._sizer.chunks(response.iter_bytes()):
+                    f.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    decoded += len(chunk)
+                    # 进度与统计按网络上收到的编码字节计算，与 Content-Length 一致
+                    self.current_size = response.num_bytes_downloaded
+                    self.checkpoint()
+            self.current_size = response.num_bytes_downloaded
+        os.replace(partial_path, resources.save_path)
+        logger.info('decompressed %s %s bytes to %s bytes', response.headers.get('Content-Encoding'),
+                    self.current_size, decoded)
+        self._finish_digest(resources.save_path)
+        return Result.SUCCESS
+
+    def _sink_download(self, resources: 'Resources', content_length: int, test_response: httpx.Response) -> Result:
+        """
+        Pass the content to the sink in order, the save path is not touched
+
+        Retries continue after the delivered bytes with a range request when the server supports
+        ranges. Large files are fetched in slices that are reassembled in memory.
+        """
+        encoded = resources.http_compression and test_response.headers.get('Content-Encoding', 'identity') != 'identity'
+        # 编码后的内容无法按区间续传
+        ranges = not encoded and self._breakpoint_resumption(test_response)
+        if self._checksum is None and not encoded:
+            self._checksum = Checksum.from_headers(test_response.headers)
+        self._total_size = content_length
+        if ranges and content_length > self._slice_threshold and not resources.http_stream:
+            logger.info('sliced download to sink: %s %s', content_length, resources.uri)
+            return run_coroutine(self._sliced_sink_download(resources, content_length))
+        logger.info('stream download to sink: %s', resources.uri)
+        headers = {'Accept-Encoding': COMPRESSED_ENCODINGS} if encoded else {}
+        if ranges and self._delivered:
+            headers['Range'] = f'bytes={self._delivered}-'
+        with self.client.stream(self._method,
+                                resources.uri,
+                                headers=headers,
+                                data=resources.http_data,
+                                extensions={'trace': self._trace().trace}) as response:
+            response.raise_for_status()
+            self._mode = 'stream'
+            self._mark_first_byte()
+            resumed = 0
+            if response.status_code == 206:
+                resumed, self._skip = self._delivered, 0
+                self._add_resumed(resumed)
+            length = None if encoded else int(response.headers.get('Content-Length', 0)) or None
+            for chunk in self._sizer.chunks(response.iter_bytes(), length):
+                self._deliver(chunk)
+                # 压缩传输按网络上收到的编码字节计算进度
+                self.current_size = resumed + response.num_bytes_downloaded
+                self.checkpoint()
+            self.current_size = resumed + response.num_bytes_downloaded
+        return Result.SUCCESS
+
+    async def _sliced_sink_download(self, resources: 'Resources', content_length: int) -> Result:
+        start, self._skip = self._delivered, 0
+        self._add_resumed(start)
+        starts = range(start, content_length, self.sliced_chunk_size)
+        parts = OrderedParts(self._deliver, len(starts))
+        self._mode = 'sliced'
+        self._slices = len(starts)
+        # 按顺序创建任务，信号量按顺序放行，最前面未完成的切片总在下载
+        tasks = [
+            asyncio.create_task(
+                self._sliced_sink_chunk(resources, parts, index, begin,
+                                        min(begin + self.sliced_chunk_size, content_length) - 1,
+                                        resources.semaphore)
+            )
+            for index, begin in enumerate(starts)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if parts.error is not None:
+            raise parts.error
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        if not self.aclient.is_closed:
+            await self.aclient.aclose()
+        return Result.SUCCESS
+
+    async def _sliced_sink_chunk(self, resources: 'Resources', parts: 'OrderedParts', index: int, start: int,
+                                 end: int, sem: 'DynamicSemaphore'):
+        async with sem:
+            try:
+                self.checkpoint()
+                timings = self._trace()
+                async with self.aclient.stream(self._method,
+                                               resources.uri,
+                                               headers={'Range': f'bytes={start}-{end}'},
+                                               data=resources.http_data,
+                                               extensions={'trace': timings.atrace}) as response:
+                    response: httpx.Response
+                    if not response.is_success: sem.record_result(success=False)
+                    response.raise_for_status()
+                    self._mark_first_byte()
+                    received = 0
+                    async for chunk in self._sizer.achunks(response.aiter_bytes(), end - start + 1):
+                        await parts.write(index, chunk)
+                        received += len(chunk)
+                        self.current_size += len(chunk)
+                        self.checkpoint()
+                    # 切片文件可在下次尝试时补齐，内存中的切片缺少字节会让整个流出错
+                    if received != end - start + 1:
+                        sem.record_result(success=False)
+                        raise httpx.RemoteProtocolError(
+                            f'slice {start}-{end} of {resources.uri} ended after {received} bytes')
+                    sem.record_result(timings.ttfb or response.elapsed.total_seconds(), True,
+                                      response.num_bytes_downloaded)
+                    await sem.adaptive_update()
+                # 写出排在其后的已完成部分，sink 出错时同样要唤醒其他部分
+                parts.finish(index)
+            except BaseException as e:
+                parts.abort(e)
+                raise
+
     def _stream_download(self, resources: 'Resources', content_length: int) -> Result:
         headers = {}
         if resources.save_path.exists():
             file_size = resources.save_path.stat().st_size
-            if file_size == content_length:
-                logger.info(f'file exist skip download: {resources.uri} to {resources.save_path}')
+            if file_size == content_length and self._check_existing(resources.save_path):
+                logger.info('file exist skip download: %s to %s', resources.uri, resources.save_path)
                 return Result.EXIST
             elif file_size > content_length:
                 resources.save_path.unlink()
-            else:
+            elif file_size < content_length:
                 headers['Range'] = f'bytes={file_size}-'
+        reserve(resources.save_path, content_length)
 
         with self.client.stream(self._method,
                                 resources.uri,
                                 headers=headers,
-                                data=resources.http_data) as response:
+                                data=resources.http_data,
+                                extensions={'trace': self._trace().trace}) as response:
             response.raise_for_status()
+            self._mode = 'stream'
+            self._mark_first_byte()
             if resources.metadata.get('_breakpoint_flag', False):
                 file_mode = 'ab'
             else:
                 file_mode = 'wb'
             with resources.save_path.open(file_mode) as f:
-                self.current_size += resources.save_path.stat().st_size
-                for chunk in response.iter_bytes(chunk_size=DEFAULT_CHUNK_SIZE):
+                resumed = resources.save_path.stat().st_size
+                self._add_resumed(resumed)
+                digest = self._begin_digest(resources.save_path, resumed)
+                length = int(response.headers.get('Content-Length', 0)) or None
+                for chunk in self._sizer.chunks(response.iter_bytes(), length):
                     f.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
                     self.current_size += len(chunk)
+                    self.checkpoint()
+        self._finish_digest(resources.save_path)
         return Result.SUCCESS
 
     async def _sliced_download(self, resources: 'Resources', content_length: int) -> Result:
         path_template = convert_slice_path(resources.save_path)
         chunks_path = []
         tasks = []
+        self._mode = 'sliced'
+        reserve(resources.save_path, content_length,
+                [path_template(start) for start in range(0, content_length, self.sliced_chunk_size)])
         for start in range(0, content_length, self.sliced_chunk_size):
             end = start + self.sliced_chunk_size - 1
             if end > (content_length - 1):
@@ -168,7 +360,12 @@ class HttpProtocolHandler(BaseProtocolHandler):
                 )
             )
             chunks_path.append(slice_path)
-        results = await asyncio.gather(*tasks)
+        self._slices = len(tasks)
+        # 等待进行中的切片完成，避免抢占或出错时截断写入
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
         if all(results):
             self._merge_chunk(resources.save_path, chunks_path)
             if not self.aclient.is_closed:
@@ -179,62 +376,69 @@ class HttpProtocolHandler(BaseProtocolHandler):
     async def _sliced_chunked_download(self, resources: 'Resources', save_path: Path, start: int, end: int,
                                        sem: 'DynamicSemaphore') -> bool:
         async with sem:
-            logger.info(f'start sliced download: {resources.uri} to {resources.save_path} {start}-{end}')
+            self.checkpoint()
+            logger.debug('start sliced download: %s to %s %s-%s', resources.uri, resources.save_path, start, end)
             headers = {'Range': f'bytes={start}-{end}'}
             if save_path.exists():
                 chunk_file_size = save_path.stat().st_size
                 if chunk_file_size == self.sliced_chunk_size:
-                    logger.info(f'slice exist skip download: {resources.uri} to {save_path}')
-                    self.current_size += save_path.stat().st_size
+                    logger.debug('slice exist skip download: %s to %s', resources.uri, save_path)
+                    self._add_resumed(save_path.stat().st_size)
                     return True
                 elif chunk_file_size > self.sliced_chunk_size:
-                    logger.info(f'slice size is larger than the slice size: {resources.uri} to {save_path}')
+                    logger.debug('slice size is larger than the slice size: %s to %s', resources.uri, save_path)
                     save_path.unlink()
                 elif chunk_file_size == end - start + 1:
-                    logger.info(f'slice exist skip download: {resources.uri} to {save_path}')
-                    self.current_size += save_path.stat().st_size
+                    logger.debug('slice exist skip download: %s to %s', resources.uri, save_path)
+                    self._add_resumed(save_path.stat().st_size)
                     return True
                 else:
                     file_start = start + chunk_file_size
-                    logger.info(f'slice breakpoint resumption: {resources.uri} to {save_path}')
+                    logger.debug('slice breakpoint resumption: %s to %s', resources.uri, save_path)
                     headers['Range'] = f'bytes={file_start}-{end}'
                     if file_start == end:
-                        logger.info(f'slice exist skip download: {resources.uri} to {save_path}')
-                        self.current_size += save_path.stat().st_size
+                        logger.debug('slice exist skip download: %s to %s', resources.uri, save_path)
+                        self._add_resumed(save_path.stat().st_size)
                         return True
+            timings = self._trace()
             async with self.aclient.stream(self._method,
                                            resources.uri,
                                            headers=headers,
-                                           data=resources.http_data) as response:
+                                           data=resources.http_data,
+                                           extensions={'trace': timings.atrace}) as response:
                 response: httpx.Response
                 if not response.is_success: sem.record_result(success=False)
                 response.raise_for_status()
-                async with aiofiles.open(save_path, 'ab') as f:
-                    self.current_size += save_path.stat().st_size
-                    async for chunk in response.aiter_bytes(chunk_size=DEFAULT_CHUNK_SIZE):
+                self._mark_first_byte()
+                # 区间响应的 Content-MD5 与 Content-Digest 是该区间的摘要，可单独校验切片
+                expected = Checksum.from_headers(response.headers, partial=True)
+                digest = expected.new() if expected is not None else None
+                async with writer.open(save_path, append=True) as f:
+                    resumed = f.offset
+                    self._add_resumed(resumed)
+                    length = int(response.headers.get('Content-Length', 0)) or None
+                    async for chunk in self._sizer.achunks(response.aiter_bytes(), length):
                         await f.write(chunk)
+                        if digest is not None:
+                            digest.update(chunk)
                         self.current_size += len(chunk)
-                sem.record_result(response.elapsed.total_seconds(), True)
+                        self.checkpoint()
+                if digest is not None and not expected.matches(digest):
+                    # 只删除该切片，重试时其他切片按已存在跳过
+                    save_path.unlink(missing_ok=True)
+                    sem.record_result(success=False)
+                    raise ChecksumMismatchException(f'{resources.uri} {headers["Range"]}', expected.describe(),
+                                                    expected.describe(digest))
+                if digest is not None and not resumed:
+                    # 摘要覆盖了整个切片
+                    self._verified_slices.add(save_path)
+                # 控制器以首字节时间衡量排队延迟，与切片大小无关
+                sem.record_result(timings.ttfb or response.elapsed.total_seconds(), True,
+                                  response.num_bytes_downloaded)
                 await sem.adaptive_update()
-            logger.info(f'sliced download success: {resources.uri} to {save_path}')
+            logger.debug('sliced download success: %s to %s', resources.uri, save_path)
             return True
 
-    @staticmethod
-    def _merge_chunk(save_path: Path, result: list[Path]):
-        with save_path.open('wb') as f:
-            for chunk_path in result:
-                with chunk_path.open('rb') as f_chunk:
-                    while True:
-                        chunk = f_chunk.read(DEFAULT_CHUNK_SIZE)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                logger.info(f'merge chunk success: {save_path} to {chunk_path}')
-        for chunk_path in result:
-            chunk_path.unlink()
-            logger.info(f'delete chunk success: {chunk_path}')
-        logger.info(f'merge file success: {save_path}')
-
     def _breakpoint_resumption(self, response):
         if response.headers.get('Accept-Ranges') == 'bytes':
             return True
@@ -244,7 +448,8 @@ class HttpProtocolHandler(BaseProtocolHandler):
             except httpx.RequestNotRead:
                 content = None
             with self.client.stream(self._method, response.request.url, content=content,
-                                    headers={'Range': 'bytes=0-1'}) as test_response:
+                                    headers={'Range': 'bytes=0-1'},
+                                    extensions={'trace': self._trace().trace}) as test_response:
                 test_response.raise_for_status()
                 return (test_response.headers.get('Content-Range', '').startswith('bytes 0-1/') or
                         test_response.headers.get('Content-Length') == '2')
@@ -1,4 +1,5 @@
 import asyncio
+import os
 from pathlib import Path
 from typing import TYPE_CHECKING
 from urllib.parse import urlparse, urljoin
@@ -6,21 +7,31 @@ from shutil import rmtree
 
 import aiofiles
 import m3u8
-from httpx import AsyncClient, Response, AsyncHTTPTransport
+from httpx import AsyncClient, Response, AsyncHTTPTransport, HTTPError
 
 from yundownload.network.base import BaseProtocolHandler
 from yundownload.utils.core import Result
-from yundownload.utils.logger import logger
+from yundownload.utils.exceptions import DownloadException
+from yundownload.utils.logger import logger as download_logger
+from yundownload.utils.profiler import run_coroutine
+from yundownload.utils.sink import OrderedParts
+from yundownload.utils.space import merged_path, reserve
+from yundownload.utils.writer import writer
 
 if TYPE_CHECKING:
     from yundownload.core.resources import Resources
     from yundownload.utils.equilibrium import DynamicSemaphore
 
-from yundownload.utils import DEFAULT_CHUNK_SIZE
+from yundownload.utils.config import DEFAULT_MERGE_CHUNK_SIZE
 from Crypto.Cipher import AES
 
+logger = download_logger.subsystem('m3u8')
+
 
 class M3U8ProtocolHandler(BaseProtocolHandler):
+    # 估算分段总大小时最多探测的分段数
+    SIZE_SAMPLES = 8
+
     @staticmethod
     def check_protocol(uri: str) -> bool:
         parse = urlparse(uri)
@@ -28,7 +39,7 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
 
     def download(self, resources: 'Resources') -> 'Result':
         super().download(resources)
-        return asyncio.run(self.download_segments(resources))
+        return run_coroutine(self.download_segments(resources))
 
     async def download_segments(self, resources: 'Resources') -> 'Result':
         """
@@ -38,7 +49,7 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
         :return: Result
         """
         resources.update_semaphore()
-        if resources.save_path.exists():
+        if self.sink is None and resources.save_path.exists() and self._check_existing(resources.save_path):
             return Result.EXIST
         async with AsyncClient(
                 auth=resources.http_auth,
@@ -58,29 +69,41 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
         ) as client:
             final_playlist = await self.handle_variant_playlist(client, resources)
             segments = self.parse_segments(final_playlist)
+            if self.sink is not None:
+                return await self.sink_segments(segments, client, resources.semaphore)
             tasks = []
             video_path = resources.save_path.parent / f"{resources.save_path.stem}"
             video_path.mkdir(parents=True, exist_ok=True)
             self._total = len(segments)
-            segment_paths = []
+            self._mode = 'segments'
+            segment_paths = [video_path / f"{index}.ts" for index in range(len(segments))]
+            # 其他加密方式不合并，分段留给调用方
+            if segments and (not segments[0]['encryption'] or segments[0]['encryption']['method'] == 'AES-128'):
+                await self.reserve_space(client, resources.save_path, segments, segment_paths, resources.semaphore)
             for index, seg in enumerate(segments):
-                segment_path = video_path / f"{index}.ts"
                 tasks.append(
                     asyncio.create_task(
-                        self.download_segment(index, seg, segment_path, client, resources.semaphore)
+                        self.download_segment(index, seg, segment_paths[index], client, resources.semaphore)
                     )
                 )
-                segment_paths.append(segment_path)
 
-            results = await asyncio.gather(*tasks)
+            # 等待进行中的分段完成，避免抢占或出错时截断写入
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
 
             if all([r & (Result.SUCCESS | Result.EXIST) for r in results]):
                 if not segments[0]['encryption']:
-                    await self.merge_segments(segment_paths, resources.save_path)
+                    await self.merge_segments(segment_paths, resources.save_path, digest=self._begin_digest())
+                    self._finish_digest(resources.save_path)
                 elif segments[0]['encryption'] and segments[0]['encryption']['method'] == 'AES-128':
-                    key_resp = await client.get(segments[0]['encryption']['key_uri'])
+                    key_resp = await client.get(segments[0]['encryption']['key_uri'],
+                                                extensions={'trace': self._trace().atrace})
                     key_content = key_resp.content
-                    await self.merge_segments(segment_paths, resources.save_path, key_content, segments)
+                    await self.merge_segments(segment_paths, resources.save_path, key_content, segments,
+                                              self._begin_digest())
+                    self._finish_digest(resources.save_path)
 
                 else:
                     logger.info("This is a encrypted m3u8, please decrypt it by yourself")
@@ -102,55 +125,204 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
         :return:
         """
         async with sem:
-            logger.info(f"Downloading fragments #{index} encryption {bool(seg['encryption'])} from {seg['uri']}")
-            async with client.stream('GET', seg['uri']) as response:
+            self.checkpoint()
+            logger.debug("Downloading fragments #%s encryption %s from %s", index, bool(seg['encryption']), seg['uri'])
+            timings = self._trace()
+            async with client.stream('GET', seg['uri'], extensions={'trace': timings.atrace}) as response:
                 response: Response
                 if not response.is_success: sem.record_result(success=False)
                 response.raise_for_status()
+                self._mark_first_byte()
                 if save_path.exists() and response.headers.get('Content-Length') == str(save_path.stat().st_size):
                     sem.record_result(success=True)
                     await sem.adaptive_update()
                     return Result.EXIST
-                async with aiofiles.open(save_path, "wb") as f:
-                    async for chunk in response.aiter_bytes(chunk_size=DEFAULT_CHUNK_SIZE):
+                async with writer.open(save_path) as f:
+                    length = int(response.headers.get('Content-Length', 0)) or None
+                    async for chunk in self._sizer.achunks(response.aiter_bytes(), length):
                         await f.write(chunk)
                         self.current_size += len(chunk)
-                sem.record_result(response.elapsed.total_seconds(), True)
+                        self.checkpoint()
+                sem.record_result(timings.ttfb or response.elapsed.total_seconds(), True,
+                                  response.num_bytes_downloaded)
                 await sem.adaptive_update()
-            logger.info(f"Download fragments #{index} success from {seg['uri']}")
+            logger.debug("Download fragments #%s success from %s", index, seg['uri'])
             self._steps += 1
             return Result.SUCCESS
 
+    async def reserve_space(self, client: 'AsyncClient', save_path: Path, segments: list, segment_paths: list[Path],
+                            sem: 'DynamicSemaphore'):
+        """
+        Check the free space for the segments and the merged file before downloading them
+
+        The playlist carries no sizes except ``EXT-X-BYTERANGE``, segments already on disk count
+        with their local size. The rest is extrapolated from HEAD requests on at most
+        ``SIZE_SAMPLES`` evenly spaced segments, nothing is checked when they announce no length.
+
+        :param client: Network connection pooling
+        :param save_path: The path of the merged file
+        :param segments: Fragment information
+        :param segment_paths: The paths to save the clips
+        :param sem: Asynchronous semaphore
+        """
+        known = 0
+        unknown = []
+        for seg, segment_path in zip(segments, segment_paths):
+            if seg['byterange']:
+                known += seg['byterange']
+            elif segment_path.exists():
+                known += segment_path.stat().st_size
+            else:
+                unknown.append(seg)
+
+        async def segment_length(seg: dict) -> int:
+            # 估算用的探测不计入传输统计
+            async with sem:
+                try:
+                    response = await client.head(seg['uri'])
+                except HTTPError:
+                    return 0
+            return int(response.headers.get('Content-Length', 0)) if response.is_success else 0
+
+        if unknown:
+            samples = unknown[::-(-len(unknown) // self.SIZE_SAMPLES)]
+            lengths = await asyncio.gather(*(segment_length(seg) for seg in samples))
+            if not all(lengths):
+                logger.debug("Segment sizes unknown, free space not checked for %s", save_path)
+                return
+            known += sum(lengths) * len(unknown) // len(samples)
+        reserve(save_path, known, segment_paths)
+
+    async def sink_segments(self, segments: list, client: 'AsyncClient', sem: 'DynamicSemaphore') -> 'Result':
+        """
+        Pass the segments to the sink in order, AES-128 segments decrypted while they arrive
+
+        :param segments: Fragment information
+        :param client: Network connection pooling
+        :param sem: Asynchronous semaphore
+        :return: Result
+        """
+        key_content = None
+        encryption = segments[0]['encryption'] if segments else None
+        if encryption and encryption['method'] == 'AES-128':
+            key_resp = await client.get(encryption['key_uri'], extensions={'trace': self._trace().atrace})
+            key_resp.raise_for_status()
+            key_content = key_resp.content
+        elif encryption:
+            logger.info("This is a encrypted m3u8, please decrypt it by yourself")
+        self._total = len(segments)
+        self._mode = 'segments'
+        parts = OrderedParts(self._deliver, len(segments))
+        # 按顺序创建任务，信号量按顺序放行，最前面未完成的分段总在下载
+        tasks = [
+            asyncio.create_task(self.sink_segment(index, seg, client, sem, parts, key_content))
+            for index, seg in enumerate(segments)
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if parts.error is not None:
+            raise parts.error
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return Result.SUCCESS
+
+    async def sink_segment(self, index: int, seg: dict, client: 'AsyncClient', sem: 'DynamicSemaphore',
+                           parts: 'OrderedParts', key_content: bytes = None):
+        """
+        Download a clip into the ordered parts of the sink
+
+        :param index: Slice index
+        :param seg: Fragment information
+        :param client: Network connection pooling
+        :param sem: Asynchronous semaphore
+        :param parts: Reassembles the segments in order
+        :param key_content: AES-128 key
+        """
+        async with sem:
+            try:
+                self.checkpoint()
+                logger.debug("Downloading fragments #%s to sink from %s", index, seg['uri'])
+                timings = self._trace()
+                async with client.stream('GET', seg['uri'], extensions={'trace': timings.atrace}) as response:
+                    response: Response
+                    if not response.is_success: sem.record_result(success=False)
+                    response.raise_for_status()
+                    self._mark_first_byte()
+                    cipher = (AES.new(key_content, AES.MODE_CBC, bytes.fromhex(seg['encryption']['iv'][2:]))
+                              if key_content else None)
+                    rest = b''
+                    length = int(response.headers.get('Content-Length', 0)) or None
+                    async for chunk in self._sizer.achunks(response.aiter_bytes(), length):
+                        self.current_size += len(chunk)
+                        if cipher is not None:
+                            # 按 16 字节的块解密，不完整的块留到下一次
+                            chunk = rest + chunk
+                            cut = len(chunk) - len(chunk) % AES.block_size
+                            chunk, rest = cipher.decrypt(chunk[:cut]), chunk[cut:]
+                        if chunk:
+                            await parts.write(index, chunk)
+                        self.checkpoint()
+                    if rest:
+                        # 加密的分段应为整数个块，剩余的字节说明分段被截断或没有填充
+                        raise DownloadException(f'AES-128 segment #{index} {seg["uri"]} ends with {len(rest)} bytes '
+                                                f'that are not a whole block')
+                    sem.record_result(timings.ttfb or response.elapsed.total_seconds(), True,
+                                      response.num_bytes_downloaded)
+                    await sem.adaptive_update()
+                # 写出排在其后的已完成部分，sink 出错时同样要唤醒其他部分
+                parts.finish(index)
+            except BaseException as e:
+                parts.abort(e)
+                raise
+            self._steps += 1
+
     @staticmethod
-    async def merge_segments(segment_paths: list[Path], save_path: Path, key_content: bytes = None, segments: list = None) -> None:
-        async with aiofiles.open(save_path, "wb") as f:
+    async def merge_segments(segment_paths: list[Path], save_path: Path, key_content: bytes = None, segments: list = None,
+                             digest=None) -> None:
+        """
+        Concatenate the segments into save_path, decrypting AES-128 segments, and remove them
+
+        The segments are written into the merged file reserved by ``reserve_space`` and renamed
+        when complete.
+
+        :param digest: Running hash updated with the merged content
+        """
+        merged = merged_path(save_path)
+        # 保留预分配的空间，写完后截断到实际长度
+        async with aiofiles.open(merged, "r+b" if merged.exists() else "wb") as f:
             if key_content and segments:
                 for index, segment_path in enumerate(segment_paths):
                     cipher = AES.new(key_content, AES.MODE_CBC, bytes.fromhex(segments[index]['encryption']['iv'][2:]))
                     async with aiofiles.open(segment_path, "rb") as segment_file:
                         while True:
-                            chunk = await segment_file.read(16384)
+                            chunk = await segment_file.read(DEFAULT_MERGE_CHUNK_SIZE)
                             if not chunk:
                                 break
-                            await f.write(cipher.decrypt(chunk))
-                    logger.info(f"Merge fragments #{segment_path} to {save_path}")
+                            chunk = cipher.decrypt(chunk)
+                            if digest is not None:
+                                digest.update(chunk)
+                            await f.write(chunk)
+                    logger.debug("Merge fragments #%s to %s", segment_path, save_path)
 
             else:
                 for segment_path in segment_paths:
                     async with aiofiles.open(segment_path, "rb") as segment_file:
-                        chunk_size = DEFAULT_CHUNK_SIZE
                         while True:
-                            chunk = await segment_file.read(chunk_size)
+                            chunk = await segment_file.read(DEFAULT_MERGE_CHUNK_SIZE)
                             if not chunk:
                                 break
+                            if digest is not None:
+                                digest.update(chunk)
                             await f.write(chunk)
-                    logger.info(f"Merge fragments #{segment_path} to {save_path}")
+                    logger.debug("Merge fragments #%s to %s", segment_path, save_path)
+            await f.truncate()
+        os.replace(merged, save_path)
 
         for segment_path in segment_paths:
             segment_path.unlink()
-            logger.info(f"Delete fragments #{segment_path}")
+            logger.debug("Delete fragments #%s", segment_path)
         rmtree(segment_paths[0].parent, ignore_errors=True)
-        logger.info(f"Merge fragments success to {save_path}")
+        logger.info("Merge fragments success to %s", save_path)
 
     @staticmethod
     def parse_segments(playlist: m3u8.M3U8) -> list:
@@ -160,7 +332,9 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
             segment_info = {
                 'duration': seg.duration,
                 'uri': urljoin(playlist.base_uri, seg.uri),
-                'encryption': None
+                'encryption': None,
+                # EXT-X-BYTERANGE 给出的分段长度
+                'byterange': int(seg.byterange.split('@')[0]) if seg.byterange else None
             }
 
             if seg.key:
@@ -179,7 +353,7 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
         if not playlist.is_variant:
             return playlist
 
-        logger.info(f'm3u8 contains {len(playlist.playlists)} bitrate: {resources.uri} to {resources.save_path}')
+        logger.info('m3u8 contains %s bitrate: %s to %s', len(playlist.playlists), resources.uri, resources.save_path)
 
         # Select the sub-playlist with the highest bandwidth
         best_playlist = max(
@@ -187,8 +361,9 @@ class M3U8ProtocolHandler(BaseProtocolHandler):
             key=lambda p: p.stream_info.bandwidth
         )
 
-        logger.info(
-            f'Selected sub-bitrate: {best_playlist.uri}, bindwidth: {best_playlist.stream_info.bandwidth}bps resolution: {best_playlist.stream_info.resolution} codecs: {best_playlist.stream_info.codecs}')
+        logger.info('Selected sub-bitrate: %s, bindwidth: %sbps resolution: %s codecs: %s', best_playlist.uri,
+                    best_playlist.stream_info.bandwidth, best_playlist.stream_info.resolution,
+                    best_playlist.stream_info.codecs)
 
         # Load the child playlist
         sub_url = urljoin(playlist.base_uri, best_playlist.uri)
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Callable
 from urllib.parse import urlparse, unquote
 
 import paramiko
@@ -9,18 +9,29 @@ from paramiko.ssh_exception import SSHException
 from yundownload.core.resources import Resources
 from yundownload.network.base import BaseProtocolHandler
 from yundownload.utils import retry
+from yundownload.utils.chunking import ChunkSizer
+from yundownload.utils.config import DEFAULT_MAX_CHUNK_SIZE
 from yundownload.utils.core import Result
 from yundownload.utils.exceptions import ConnectionException, AuthException
-from yundownload.utils.config import DEFAULT_CHUNK_SIZE
-from yundownload.utils.logger import logger
+from yundownload.utils.logger import logger as download_logger
+from yundownload.utils.space import reserve
+
+
+logger = download_logger.subsystem('sftp')
 
 
 class SFTPProtocolHandler(BaseProtocolHandler):
+    # 每个文件同时在途的 32 KiB 读请求数，限制预取的窗口
+    PREFETCH_REQUESTS = 256
+    MAX_READ_SIZE = 256 * 1024
+
     def __init__(self):
         super().__init__()
         self.transport: Optional[paramiko.Transport] = None
         self.sftp: Optional[paramiko.SFTPClient] = None
         self.support_resume = True
+        # paramiko 通过逐次拼接 32 KiB 的块完成大块读取，读取越大反而越慢
+        self._sizer = ChunkSizer(maximum=min(DEFAULT_MAX_CHUNK_SIZE, self.MAX_READ_SIZE))
 
     @staticmethod
     def check_protocol(uri: str) -> bool:
@@ -46,34 +57,86 @@ class SFTPProtocolHandler(BaseProtocolHandler):
         self._connect(host, port)
         self._login(username, password)
 
-        logger.info(f"Login success to {uri}")
+        logger.info("Login success to %s", uri)
 
         file_stat = self.sftp.stat(remote_path)
         file_size = file_stat.st_size
 
+        if self.sink is not None:
+            # 内存中无法重组乱序到达的区间，下载到 sink 时只使用单通道
+            self._total_size = file_size
+            self._mode = 'stream'
+            start_pos, self._skip = self._delivered, 0
+            self._add_resumed(start_pos)
+
+            def deliver(data: bytes):
+                self._mark_first_byte()
+                self._deliver(data)
+                self.current_size += len(data)
+                self.checkpoint()
+
+            logger.info("SFTP download to sink started from %s", uri)
+            if start_pos < file_size:
+                self._fetch_range(remote_path, start_pos, file_size - 1, deliver)
+            return Result.SUCCESS
+
         prepare_result = self._prepare_local_file(local_path, file_size)
-        if prepare_result & Result.EXIST:
+        if prepare_result & Result.EXIST and self._check_existing(local_path):
             return Result.EXIST
 
+        self._total_size = file_size
+        if file_size > resources.sftp_slice_threshold:
+            logger.info('sliced download: %s %s to %s', file_size, uri, local_path)
+            return self._threaded_sliced_download(
+                resources,
+                file_size,
+                resources.sftp_sliced_chunk_size,
+                lambda start, end, write: self._fetch_range(remote_path, start, end, write)
+            )
+
+        reserve(local_path, file_size)
         start_pos = local_path.stat().st_size if local_path.exists() else 0
+        self._mode = 'stream'
+        self._add_resumed(start_pos)
+        digest = self._begin_digest(local_path, start_pos)
 
         with self.sftp.open(remote_path, 'rb') as remote_file:
             remote_file.seek(start_pos)
+            # 预取以流水线方式发出读请求，否则每 32 KiB 等待一次往返
+            remote_file.prefetch(file_size, self.PREFETCH_REQUESTS)
 
             with open(local_path, 'ab' if start_pos > 0 else 'wb') as local_file:
-                while True:
-                    data = remote_file.read(DEFAULT_CHUNK_SIZE)
-                    if not data:
-                        break
+                for data in self._sizer.reads(remote_file.read, file_size - start_pos):
+                    self._mark_first_byte()
 
                     local_file.write(data)
+                    if digest is not None:
+                        digest.update(data)
                     self.current_size += len(data)
+                    self.checkpoint()
 
         if local_path.stat().st_size != file_size:
             raise IOError("File size mismatch after download")
 
+        self._finish_digest(local_path)
         return Result.SUCCESS
 
+    def _fetch_range(self, remote_path: str, start: int, end: int, write: Callable[[bytes], None]):
+        """在同一 SSH 连接的独立 SFTP 通道上下载 start..end 区间"""
+        sftp = paramiko.SFTPClient.from_transport(self.transport)
+        try:
+            with sftp.open(remote_path, 'rb') as remote_file:
+                remote_file.seek(start)
+                remote_file.prefetch(end + 1, self.PREFETCH_REQUESTS)
+                remaining = end - start + 1
+                for data in self._sizer.reads(remote_file.read, remaining):
+                    write(data)
+                    remaining -= len(data)
+                if remaining:
+                    raise IOError(f"SFTP range {start}-{end} ended {remaining} bytes early")
+        finally:
+            sftp.close()
+
     def close(self):
         """关闭连接"""
         if self.sftp:
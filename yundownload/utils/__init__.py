@@ -5,12 +5,28 @@ from .exceptions import (
     ChunkUnsupportedException,
     NotSupportedProtocolException,
     ConnectionException,
-    AuthException
+    AuthException,
+    InterruptException,
+    PreemptException,
+    PauseException,
+    CancelException,
+    ChecksumMismatchException,
+    InsufficientSpaceException,
 )
 from .work import WorkerFuture
+from .stats import TransferStats
+from .trace import TimingSummary
+from .checksum import Checksum
+from .sink import Sink, ChunkStream
+from .metrics import MetricsRegistry
+from .profiler import TaskProfiler, summarize_profiles
 from .config import (
     DEFAULT_HEADERS,
     DEFAULT_CHUNK_SIZE,
+    DEFAULT_MIN_CHUNK_SIZE,
+    DEFAULT_MAX_CHUNK_SIZE,
+    DEFAULT_WRITE_BUFFER_SIZE,
+    DEFAULT_STREAM_BUFFER_SIZE,
     DEFAULT_SLICED_CHUNK_SIZE,
     DEFAULT_TIMEOUT,
     DEFAULT_MAX_RETRY,
@@ -18,4 +34,13 @@ from .config import (
     DEFAULT_SLICED_FILE_SUFFIX,
 )
 from .core import Result
-from .equilibrium import DynamicSemaphore, DynamicConcurrencyController
\ No newline at end of file
+from .equilibrium import (
+    DynamicSemaphore,
+    ThreadDynamicSemaphore,
+    BaseConcurrencyController,
+    DynamicConcurrencyController,
+    AIMDConcurrencyController,
+    GradientConcurrencyController,
+    BBRConcurrencyController,
+    CONCURRENCY_STRATEGIES,
+)
\ No newline at end of file
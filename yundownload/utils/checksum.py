@@ -0,0 +1,160 @@
+import base64
+import binascii
+import hashlib
+import re
+import zlib
+from pathlib import Path
+from typing import Mapping, Optional
+
+from .config import DEFAULT_MERGE_CHUNK_SIZE
+
+# 同时提供多个摘要时优先使用更强的算法
+PREFERENCE = ('sha512', 'sha256', 'sha1', 'md5', 'crc32')
+
+
+class _CRC32:
+    """
+    hashlib style wrapper of zlib.crc32, used by S3 checksums
+    """
+    __slots__ = ('value',)
+    name = 'crc32'
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data: bytes):
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(4, 'big')
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+def _algorithm(name: str) -> Optional[str]:
+    name = name.strip().lower().replace('-', '')
+    return name if name in PREFERENCE else None
+
+
+def _decode(value: str, algorithm: str) -> Optional[bytes]:
+    """
+    Digest bytes from hex or base64
+    """
+    value = value.strip().strip(':').strip('"')
+    size = hashlib.new(algorithm).digest_size if algorithm != 'crc32' else 4
+    if re.fullmatch(r'[0-9a-fA-F]+', value) and len(value) == size * 2:
+        return bytes.fromhex(value)
+    try:
+        digest = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest if len(digest) == size else None
+
+
+class Checksum:
+    """
+    Expected digest of a download, checked while the bytes are written
+
+    Supports md5, sha1, sha256, sha512 and crc32.
+    """
+    __slots__ = ('algorithm', 'expected')
+
+    def __init__(self, algorithm: str, expected: bytes):
+        """
+        :param algorithm: Hash algorithm
+        :param expected: Expected digest
+        """
+        self.algorithm = algorithm
+        self.expected = expected
+
+    @classmethod
+    def parse(cls, value: str) -> 'Checksum':
+        """
+        Parse ``'<algorithm>:<digest>'``, e.g. ``'sha256:9f86d0...'``, the digest in hex or base64
+
+        :raise ValueError: Unsupported algorithm or malformed digest
+        """
+        name, _, digest = value.partition(':')
+        algorithm = _algorithm(name)
+        expected = _decode(digest, algorithm) if algorithm else None
+        if expected is None:
+            raise ValueError(f'Unsupported checksum {value!r}, expected <algorithm>:<digest> with one of '
+                             f'{", ".join(PREFERENCE)}')
+        return cls(algorithm, expected)
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str], partial: bool = False) -> Optional['Checksum']:
+        """
+        Digest announced by HTTP response headers
+
+        ``Content-MD5`` and ``Content-Digest`` describe the body of the response, ``Repr-Digest``,
+        ``Digest`` and ``x-amz-checksum-*`` the whole file.
+
+        :param headers: Response headers
+        :param partial: The response carries a range of the file
+        :return: The strongest supported digest or None
+        """
+        found: dict[str, bytes] = {}
+
+        def add(name: str, value: str):
+            algorithm = _algorithm(name)
+            if algorithm and algorithm not in found:
+                digest = _decode(value, algorithm)
+                if digest is not None:
+                    found[algorithm] = digest
+
+        fields = ('content-digest',) if partial else ('repr-digest', 'content-digest', 'digest')
+        for field in fields:
+            # RFC 9530 的字典格式 sha-256=:base64:, RFC 3230 的 SHA-256=base64
+            for item in (headers.get(field) or '').split(','):
+                name, _, value = item.partition('=')
+                add(name, value)
+        if headers.get('content-md5'):
+            add('md5', headers['content-md5'])
+        # 分段上传的对象是各段摘要的摘要，无法与下载内容比较
+        if not partial and (headers.get('x-amz-checksum-type') or '').upper() != 'COMPOSITE':
+            for algorithm in ('sha256', 'sha1', 'crc32'):
+                value = headers.get(f'x-amz-checksum-{algorithm}') or ''
+                if value and '-' not in value:
+                    add(algorithm, value)
+        for algorithm in PREFERENCE:
+            if algorithm in found:
+                return cls(algorithm, found[algorithm])
+        return None
+
+    def new(self):
+        """
+        Start hashing, the object has ``update`` and ``digest``
+        """
+        return _CRC32() if self.algorithm == 'crc32' else hashlib.new(self.algorithm)
+
+    def hash_file(self, path: Path, length: Optional[int] = None, digest=None):
+        """
+        Hash the first length bytes of a file, all of it by default
+
+        :param digest: Running hash to continue, a new one by default
+        :return: The running hash
+        """
+        digest = digest or self.new()
+        with path.open('rb') as f:
+            while length is None or length > 0:
+                block = f.read(DEFAULT_MERGE_CHUNK_SIZE if length is None else min(DEFAULT_MERGE_CHUNK_SIZE, length))
+                if not block:
+                    break
+                digest.update(block)
+                if length is not None:
+                    length -= len(block)
+        return digest
+
+    def matches(self, digest) -> bool:
+        return digest.digest() == self.expected
+
+    def describe(self, digest=None) -> str:
+        """
+        ``'<algorithm>:<hex>'`` of the expected or of a computed digest
+        """
+        return f'{self.algorithm}:{(digest.digest() if digest is not None else self.expected).hex()}'
+
+    def __repr__(self):
+        return f'<Checksum {self.describe()}>'
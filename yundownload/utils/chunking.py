@@ -0,0 +1,150 @@
+import math
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, Optional
+
+from .config import DEFAULT_CHUNK_SIZE, DEFAULT_MIN_CHUNK_SIZE, DEFAULT_MAX_CHUNK_SIZE
+
+
+class ChunkSizer:
+    """
+    Read size of a transfer tuned from its measured throughput and the cost of handling a chunk
+
+    Handling a chunk costs the caller a fixed part (a write call or queued disk write, a
+    checkpoint) plus a part proportional to its size. Both are fitted by a weighted linear
+    regression over the sizes seen, and the size is chosen to keep the fixed part at
+    ``OVERHEAD_SHARE`` of the transfer time: ``throughput * fixed cost / OVERHEAD_SHARE``.
+    Slow links and small files get small chunks, fast bulk transfers get large ones. The size
+    is a power of two within the bounds, never longer than ``MAX_INTERVAL`` seconds of data,
+    so interruptions and progress stay responsive. Equal bounds give a fixed size.
+    """
+    __slots__ = ('minimum', 'maximum', 'size', '_rate', '_size', '_cost', '_size_sq', '_size_cost')
+    OVERHEAD_SHARE = 0.01
+    MAX_INTERVAL = 0.5
+    # 指数加权平均中新样本的权重
+    ALPHA = 0.3
+
+    def __init__(self,
+                 minimum: int = DEFAULT_MIN_CHUNK_SIZE,
+                 maximum: int = DEFAULT_MAX_CHUNK_SIZE,
+                 initial: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param minimum: Smallest read size in bytes
+        :param maximum: Largest read size in bytes
+        :param initial: Read size before the first measurement
+        """
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.size = min(max(initial, self.minimum), self.maximum)
+        self._rate: Optional[float] = None
+        # 读取大小与处理耗时的指数加权矩，用于拟合 耗时 = 固定开销 + 每字节开销 * 大小
+        self._size = self._cost = self._size_sq = self._size_cost = 0.0
+
+    def record(self, nbytes: int, elapsed: float, cost: float):
+        """
+        Update the size after a chunk
+
+        :param nbytes: Size of the chunk
+        :param elapsed: Seconds spent receiving the chunk
+        :param cost: Seconds the caller spent handling the chunk
+        """
+        total = elapsed + cost
+        if total <= 0 or nbytes <= 0:
+            return
+        rate = nbytes / total
+        weight = 1 if self._rate is None else self.ALPHA
+        self._rate = rate if self._rate is None else self._rate + weight * (rate - self._rate)
+        self._size += weight * (nbytes - self._size)
+        self._cost += weight * (cost - self._cost)
+        self._size_sq += weight * (nbytes * nbytes - self._size_sq)
+        self._size_cost += weight * (nbytes * cost - self._size_cost)
+        target = min(self._rate * self.fixed_cost / self.OVERHEAD_SHARE, self._rate * self.MAX_INTERVAL)
+        self.size = min(max(1 << max(round(math.log2(max(target, 1))), 0), self.minimum), self.maximum)
+
+    @property
+    def fixed_cost(self) -> float:
+        """
+        Estimated seconds the caller spends per chunk regardless of its size
+        """
+        variance = self._size_sq - self._size * self._size
+        if variance <= (self._size * 0.01) ** 2:
+            # 大小尚未变化时无法区分两部分，全部视为固定开销，放大读取后即可拟合
+            return self._cost
+        per_byte = (self._size_cost - self._size * self._cost) / variance
+        return max(self._cost - per_byte * self._size, 0.0)
+
+    def _limit(self, remaining: Optional[int]) -> int:
+        return self.size if remaining is None else max(min(self.size, remaining), 1)
+
+    def chunks(self, pieces: Iterable[bytes], length: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Regroup the pieces of a stream, e.g. ``response.iter_bytes()``, into chunks of the current size
+
+        A chunk is also handed on after ``MAX_INTERVAL`` seconds when the link slows down.
+
+        :param pieces: Pieces as they are received
+        :param length: Expected number of bytes, chunks do not wait for more
+        """
+        buffer, buffered = [], 0
+        last = time.perf_counter()
+        for piece in pieces:
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered < self._limit(length) and time.perf_counter() - last < self.MAX_INTERVAL:
+                continue
+            chunk = buffer[0] if len(buffer) == 1 else b''.join(buffer)
+            buffer, buffered = [], 0
+            received = time.perf_counter()
+            yield chunk
+            done = time.perf_counter()
+            self.record(len(chunk), received - last, done - received)
+            last = done
+            if length is not None:
+                length -= len(chunk)
+        if buffer:
+            yield b''.join(buffer)
+
+    async def achunks(self, pieces: AsyncIterable[bytes], length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Asynchronous ``chunks``, e.g. for ``response.aiter_bytes()``
+        """
+        buffer, buffered = [], 0
+        last = time.perf_counter()
+        async for piece in pieces:
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered < self._limit(length) and time.perf_counter() - last < self.MAX_INTERVAL:
+                continue
+            chunk = buffer[0] if len(buffer) == 1 else b''.join(buffer)
+            buffer, buffered = [], 0
+            received = time.perf_counter()
+            yield chunk
+            done = time.perf_counter()
+            self.record(len(chunk), received - last, done - received)
+            last = done
+            if length is not None:
+                length -= len(chunk)
+        if buffer:
+            yield b''.join(buffer)
+
+    def reads(self, read: Callable[[int], bytes], length: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Call ``read(size)``, e.g. ``socket.recv``, with the current size until it returns nothing
+
+        :param read: Function reading at most size bytes
+        :param length: Number of bytes to read at most
+        """
+        last = time.perf_counter()
+        while length is None or length > 0:
+            data = read(self._limit(length))
+            if not data:
+                return
+            received = time.perf_counter()
+            yield data
+            done = time.perf_counter()
+            self.record(len(data), received - last, done - received)
+            last = done
+            if length is not None:
+                length -= len(data)
+
+    def __repr__(self):
+        return f'<ChunkSizer {self.size} bytes>'
@@ -4,6 +4,7 @@ from urllib.parse import urlparse
 
 from .. import Downloader, Resources
 from .. import version
+from .equilibrium import CONCURRENCY_STRATEGIES
 
 
 def cli():
@@ -14,6 +15,8 @@ def cli():
     parser.add_argument('-O', dest='save_path', help="保存路径")
     parser.add_argument('--mc', type=int, default=1, help="最小并发数")
     parser.add_argument('--mx', type=int, default=10, help="最大并发数")
+    parser.add_argument('--strategy', default='default', choices=list(CONCURRENCY_STRATEGIES),
+                        help="自适应并发策略")
     parser.add_argument('--timeout', type=int, default=10, help="请求超时时间，单位秒")
     parser.add_argument('--version', action='version', version=f'YunDownload {version.__version__}',
                         help="显示版本信息并退出")
@@ -25,6 +28,7 @@ def cli():
             save_path=args.save_path if args.save_path else Path(urlparse(args.uri).path).name,
             min_concurrency=args.mc,
             max_concurrency=args.mx,
+            concurrency_strategy=args.strategy,
             http_timeout=args.timeout,
         )
         result = dl.submit(resources).state
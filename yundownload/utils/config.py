@@ -7,6 +7,15 @@ DEFAULT_HEADERS = {
     'Accept-Encoding': 'identity'
 }
 DEFAULT_CHUNK_SIZE = int(os.getenv(Environment.DEFAULT_CHUNK_SIZE, 1024 * 1024))
+# 自适应读取大小的范围，两者相等时固定为该大小
+DEFAULT_MIN_CHUNK_SIZE = int(os.getenv(Environment.MIN_CHUNK_SIZE, 64 * 1024))
+DEFAULT_MAX_CHUNK_SIZE = int(os.getenv(Environment.MAX_CHUNK_SIZE, 4 * 1024 * 1024))
+# 合并切片与分段时的缓冲大小，保持为 16 的倍数以便逐块解密
+DEFAULT_MERGE_CHUNK_SIZE = 8 * 1024 * 1024
+# 等待写入磁盘的字节数上限，超过后下载暂停读取
+DEFAULT_WRITE_BUFFER_SIZE = int(os.getenv(Environment.WRITE_BUFFER_SIZE, 64 * 1024 * 1024))
+# 下载到流时为调用方与乱序完成的切片、分段各自缓冲的字节数上限
+DEFAULT_STREAM_BUFFER_SIZE = int(os.getenv(Environment.STREAM_BUFFER_SIZE, 64 * 1024 * 1024))
 DEFAULT_SLICED_CHUNK_SIZE = int(os.getenv(Environment.DEFAULT_SLICED_CHUNK_SIZE, 100 * 1024 * 1024))
 DEFAULT_TIMEOUT = int(os.getenv(Environment.DEFAULT_TIMEOUT, 60))
 DEFAULT_MAX_RETRY = int(os.getenv(Environment.DEFAULT_MAX_RETRY, 3))
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Union, Optional, Literal
+from urllib.parse import urlparse
+
+from ..utils.logger import logger
+
+LinkMode = Literal['auto', 'reflink', 'hardlink', 'copy']
+
+# linux/fs.h FICLONE
+_FICLONE = 0x40049409
+
+# 进程池子进程中由 ContentStore.bind 设置
+_worker_store: Optional['ContentStore'] = None
+
+
+def _reflink(source: Path, target: Path):
+    import fcntl
+    with source.open('rb') as src, target.open('wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+def link_file(source: Union[str, Path], target: Union[str, Path], mode: 'LinkMode' = 'auto') -> str:
+    """
+    Make target a copy of source without transferring it again
+
+    ``auto`` tries a copy-on-write reflink, then a hardlink and finally a plain copy.
+    An existing target is replaced atomically.
+
+    :param source: Existing file
+    :param target: Path to create
+    :param mode: 'auto', 'reflink', 'hardlink' or 'copy'
+    :return: The method that was used
+    """
+    source, target = Path(source), Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_name(f'{target.name}.{os.getpid()}.link')
+    methods = ('reflink', 'hardlink', 'copy') if mode == 'auto' else (mode,)
+    for method in methods:
+        try:
+            temp.unlink(missing_ok=True)
+            if method == 'reflink':
+                _reflink(source, temp)
+            elif method == 'hardlink':
+                os.link(source, temp)
+            else:
+                shutil.copyfile(source, temp)
+            os.replace(temp, target)
+            return method
+        except (OSError, ImportError) as e:
+            temp.unlink(missing_ok=True)
+            if method == methods[-1]:
+                raise
+            logger.debug('%s %s to %s unavailable: %s', method, source, target, e)
+    raise ValueError(f'Unknown link mode: {mode}')
+
+
+class ContentStore:
+    """
+    Content-addressed store of downloaded files
+
+    Finished downloads are stored under their SHA-256 digest. A download whose digest is
+    already known is linked to the stored object, and HTTP downloads with a strong ETag
+    seen before are linked from the store without being transferred again.
+
+    Layout::
+
+        root/objects/ab/abcdef...   file content
+        root/etags/12/1234ab...     digest of the content behind a host, ETag and size
+    """
+
+    def __init__(self, root: Union[str, Path], link_mode: 'LinkMode' = 'auto'):
+        """
+        :param root: Store directory
+        :param link_mode: How files are materialized: 'auto', 'reflink', 'hardlink' or 'copy'
+        """
+        self.root = Path(root)
+        self.link_mode = link_mode
+
+    @staticmethod
+    def bind(store: Optional['ContentStore']):
+        """
+        Make the store available to the downloads of this process
+        """
+        global _worker_store
+        _worker_store = store
+
+    @staticmethod
+    def current() -> Optional['ContentStore']:
+        return _worker_store
+
+    @staticmethod
+    def etag_key(uri: str, etag: Optional[str], size: int) -> Optional[str]:
+        """
+        Key of the content behind an ETag, weak ETags are not usable
+
+        ETags are only unique per resource, servers commonly derive them from the modification
+        time and size, so the host, path, query and size are part of the key.
+
+        :param uri: Resource URI
+        :param etag: ETag response header
+        :param size: Content length
+        :return: Key or None
+        """
+        if not etag or etag.startswith('W/') or not size:
+            return None
+        parsed = urlparse(uri)
+        return hashlib.sha256(f'{parsed.netloc}\n{parsed.path}\n{parsed.query}\n{etag}\n{size}'.encode()).hexdigest()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / 'objects' / digest[:2] / digest
+
+    def _etag_path(self, key: str) -> Path:
+        return self.root / 'etags' / key[:2] / key
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """
+        Find the stored object of an ETag key
+
+        :param key: Key from ``etag_key``
+        :return: Object path or None
+        """
+        try:
+            digest = self._etag_path(key).read_text().strip()
+        except OSError:
+            return None
+        path = self._object_path(digest)
+        return path if path.exists() else None
+
+    def materialize(self, key: str, target: Path) -> bool:
+        """
+        Create target from the object stored under an ETag key
+
+        :param key: Key from ``etag_key``
+        :param target: Save path
+        :return: Whether the object was found
+        """
+        source = self.lookup(key)
+        if source is None:
+            return False
+        method = link_file(source, target, self.link_mode)
+        logger.info('content store hit, %s %s to %s', method, source, target)
+        return True
+
+    def add(self, path: Path, key: Optional[str] = None, digest: Optional[str] = None) -> str:
+        """
+        Store a finished download, a duplicate of a stored object is replaced by a link
+
+        :param path: Downloaded file
+        :param key: Optional key from ``etag_key`` to remember for the content
+        :param digest: SHA-256 of the file when it is already known, e.g. checked during the download
+        :return: SHA-256 digest
+        """
+        if digest is None:
+            digest = hashlib.sha256()
+            with path.open('rb') as f:
+                while block := f.read(1024 * 1024):
+                    digest.update(block)
+            digest = digest.hexdigest()
+        target = self._object_path(digest)
+        if target.exists():
+            if not os.path.samefile(target, path):
+                link_file(target, path, self.link_mode)
+                logger.info('content store duplicate %s, linked %s', digest, path)
+        else:
+            link_file(path, target, self.link_mode)
+        if key:
+            etag_path = self._etag_path(key)
+            etag_path.parent.mkdir(parents=True, exist_ok=True)
+            temp = etag_path.with_name(f'{etag_path.name}.{os.getpid()}.tmp')
+            temp.write_text(digest)
+            os.replace(temp, etag_path)
+        return digest
+
+    def __repr__(self):
+        return f'<ContentStore {self.root}>'
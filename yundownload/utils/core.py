@@ -3,11 +3,22 @@ from enum import IntFlag
 
 class Environment:
     LOG_EVERY = 'YUNDOWNLOAD_LOG_EVERY'
+    LOG_LEVELS = 'YUNDOWNLOAD_LOG_LEVELS'
+    LOG_QUEUE = 'YUNDOWNLOAD_LOG_QUEUE'
+    PROGRESS_EVERY = 'YUNDOWNLOAD_PROGRESS_EVERY'
     DEFAULT_CHUNK_SIZE = 'YUNDOWNLOAD_DEFAULT_CHUNK_SIZE'
+    MIN_CHUNK_SIZE = 'YUNDOWNLOAD_MIN_CHUNK_SIZE'
+    MAX_CHUNK_SIZE = 'YUNDOWNLOAD_MAX_CHUNK_SIZE'
+    WRITE_BUFFER_SIZE = 'YUNDOWNLOAD_WRITE_BUFFER_SIZE'
+    STREAM_BUFFER_SIZE = 'YUNDOWNLOAD_STREAM_BUFFER_SIZE'
     DEFAULT_SLICED_CHUNK_SIZE = 'YUNDOWNLOAD_DEFAULT_SLICED_CHUNK_SIZE'
     DEFAULT_TIMEOUT = 'YUNDOWNLOAD_DEFAULT_TIMEOUT'
     DEFAULT_MAX_RETRY = 'YUNDOWNLOAD_DEFAULT_MAX_RETRY'
     DEFAULT_RETRY_DELAY = 'YUNDOWNLOAD_DEFAULT_RETRY_DELAY'
+    HOST_PROFILE_PATH = 'YUNDOWNLOAD_HOST_PROFILE_PATH'
+    HOST_PROFILE_HALF_LIFE = 'YUNDOWNLOAD_HOST_PROFILE_HALF_LIFE'
+    PROFILE_DIR = 'YUNDOWNLOAD_PROFILE_DIR'
+    PROFILE_SLOW_CALLBACK = 'YUNDOWNLOAD_PROFILE_SLOW_CALLBACK'
 
 
 class Result(IntFlag):
@@ -16,6 +27,7 @@ class Result(IntFlag):
     EXIST = 4
     WAIT = 8
     UNKNOWN = 16
+    CANCEL = 32
 
     def is_success(self) -> bool:
         return bool(self & Result.SUCCESS)
@@ -29,5 +41,8 @@ class Result(IntFlag):
     def is_wait(self) -> bool:
         return bool(self & Result.WAIT)
 
+    def is_cancel(self) -> bool:
+        return bool(self & Result.CANCEL)
+
     def __str__(self) -> str:
         return self.name.lower()
@@ -2,25 +2,111 @@ import asyncio
 import collections
 import math
 import statistics
+import threading
 import time
+from abc import ABC, abstractmethod
+from typing import Type, Union, Optional
 
 from ..utils.logger import logger
 
+concurrency_logger = logger.subsystem("concurrency")
 
-class DynamicConcurrencyController:
+
+class BaseConcurrencyController(ABC):
     """
-    Dynamic concurrency control classes
+    Adaptive concurrency strategy base class
+
+    A strategy receives the outcome of every request through ``record_result``
+    and answers the permit count ``DynamicSemaphore`` should converge to through
+    ``calculate_concurrency``.
     """
+    # 时间源，模拟器会替换为虚拟时钟
+    clock = staticmethod(time.monotonic)
 
     def __init__(self, min_concurrency=2, max_concurrency=30, window_size=100):
-        # 并发控制参数
         self.min_concurrency = min_concurrency
         self.max_concurrency = max_concurrency
         self.current_concurrency = min_concurrency
-        self.last_adjustment = time.monotonic()
+        self.window_size = window_size
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def record_result(self, response_time: float = None, success=True, nbytes: int = 0):
+        """
+        Record the result of a single request
+
+        Subclasses extend this and call it first to keep the lifetime counters.
+
+        :param response_time: Request duration in seconds
+        :param success: Whether the request succeeded
+        :param nbytes: Number of bytes delivered by the request
+        """
+        self.total_requests += 1
+        if not success:
+            self.total_failures += 1
+
+    @abstractmethod
+    def calculate_concurrency(self) -> int:
+        """
+        Calculate the new concurrency target
+
+        :return: Target number of permits
+        """
+        pass
+
+    @property
+    def baseline_response_time(self) -> Optional[float]:
+        """无排队时的基准响应时间，未知时为 None"""
+        return None
+
+    def snapshot(self) -> dict:
+        """
+        Export the learned state
+
+        :return: Converged concurrency, baseline response time and failure rate
+        """
+        return {
+            'concurrency': self.current_concurrency,
+            'base_response_time': self.baseline_response_time,
+            'failure_rate': self.total_failures / self.total_requests if self.total_requests else 0,
+            'requests': self.total_requests,
+        }
+
+    def warm_start(self, concurrency: float, base_response_time: float = None):
+        """
+        Start from previously learned values instead of ``min_concurrency``
+
+        :param concurrency: Learned concurrency
+        :param base_response_time: Learned baseline response time
+        """
+        self.current_concurrency = self._clamp(concurrency)
+
+    def _clamp(self, concurrency: float) -> float:
+        """限制在并发边界内"""
+        return max(self.min_concurrency, min(self.max_concurrency, concurrency))
+
+    def get_current_concurrency(self):
+        """获取当前并发数"""
+        return round(self.current_concurrency)
+
+    def __len__(self):
+        return self.calculate_concurrency()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.get_current_concurrency()}>"
+
+
+class DynamicConcurrencyController(BaseConcurrencyController):
+    """
+    Dynamic concurrency control classes
+    """
+
+    def __init__(self, min_concurrency=2, max_concurrency=30, window_size=100):
+        # 并发控制参数
+        super().__init__(min_concurrency, max_concurrency, window_size)
+        self.last_adjustment = self.clock()
 
         # 指标采样窗口
-        self.window_size = window_size
         self.response_times = collections.deque(maxlen=window_size)
         self.successes = collections.deque(maxlen=window_size)
         self.failures = collections.deque(maxlen=window_size)
@@ -37,8 +123,9 @@ class DynamicConcurrencyController:
         # 信号量
         self.semaphore = asyncio.Semaphore(min_concurrency)
 
-    def record_result(self, response_time: None, success=True):
+    def record_result(self, response_time: float = None, success=True, nbytes: int = 0):
         """记录每次请求的结果"""
+        super().record_result(response_time, success, nbytes)
         if response_time:
             self.response_times.append(response_time)
         if success:
@@ -49,6 +136,15 @@ class DynamicConcurrencyController:
         # 动态校准基准响应时间
         self._calibrate_base_response_time()
 
+    @property
+    def baseline_response_time(self) -> Optional[float]:
+        return self.base_response_time
+
+    def warm_start(self, concurrency: float, base_response_time: float = None):
+        super().warm_start(concurrency, base_response_time)
+        if base_response_time:
+            self.base_response_time = base_response_time
+
     def calculate_concurrency(self):
         """计算新的并发数值"""
         if len(self.response_times) < 10:  # 冷启动阶段
@@ -117,7 +213,7 @@ class DynamicConcurrencyController:
 
     def _calculate_load_factor(self):
         """计算系统负载因子"""
-        throughput = len(self.successes) / (time.monotonic() - self.last_adjustment + 1e-7)
+        throughput = len(self.successes) / (self.clock() - self.last_adjustment + 1e-7)
         throughput_ratio = throughput / (self.last_throughput + 1e-7)
         self.last_throughput = throughput
 
@@ -154,17 +250,275 @@ class DynamicConcurrencyController:
 
     def _linear_ramp_up(self):
         """冷启动阶段线性增长"""
-        if time.monotonic() - self.last_adjustment > 5.0:  # 每5秒增长一次
+        if self.clock() - self.last_adjustment > 5.0:  # 每5秒增长一次
             self.current_concurrency = min(self.current_concurrency + 1, self.max_concurrency)
-            self.last_adjustment = time.monotonic()
+            self.last_adjustment = self.clock()
         return self.current_concurrency
 
-    def get_current_concurrency(self):
-        """获取当前并发数"""
-        return round(self.current_concurrency)
 
-    def __len__(self):
-        return self.calculate_concurrency()
+class AIMDConcurrencyController(BaseConcurrencyController):
+    """
+    Additive increase / multiplicative decrease concurrency control (TCP Reno style)
+
+    The target doubles every round while below the slow start threshold and grows
+    by one permit per round afterwards. A failure or a response time above
+    ``latency_tolerance`` times the fastest observed one cuts it by ``backoff_ratio``.
+    A round is as many completed requests as the current concurrency.
+    """
+
+    def __init__(self, min_concurrency=2, max_concurrency=30, window_size=100,
+                 backoff_ratio=0.5, latency_tolerance=2.0):
+        super().__init__(min_concurrency, max_concurrency, window_size)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.slow_start_threshold = max_concurrency
+        self.response_times = collections.deque(maxlen=window_size)
+        self._round_successes = 0
+        # 降窗后一个回合内忽略新的拥塞信号，避免连续腰斩
+        self._recovery = 0
+
+    def record_result(self, response_time: float = None, success=True, nbytes: int = 0):
+        """记录每次请求的结果"""
+        super().record_result(response_time, success, nbytes)
+        congested = not success
+        if response_time:
+            if self.response_times and response_time > self.latency_tolerance * min(self.response_times):
+                congested = True
+            self.response_times.append(response_time)
+
+        if self._recovery > 0:
+            self._recovery -= 1
+            return
+        if congested:
+            self.slow_start_threshold = self._clamp(self.current_concurrency * self.backoff_ratio)
+            self.current_concurrency = self.slow_start_threshold
+            self._round_successes = 0
+            self._recovery = self.get_current_concurrency()
+        else:
+            self._round_successes += 1
+
+    @property
+    def baseline_response_time(self) -> Optional[float]:
+        return min(self.response_times) if self.response_times else None
+
+    def warm_start(self, concurrency: float, base_response_time: float = None):
+        super().warm_start(concurrency, base_response_time)
+        # 已知收敛点，跳过慢启动直接进入线性增长
+        self.slow_start_threshold = self.current_concurrency
+        if base_response_time:
+            self.response_times.append(base_response_time)
+
+    def calculate_concurrency(self):
+        """计算新的并发数值"""
+        if self._round_successes >= self.get_current_concurrency():
+            self._round_successes = 0
+            if self.current_concurrency < self.slow_start_threshold:
+                new_concurrency = min(self.current_concurrency * 2, self.slow_start_threshold)
+            else:
+                new_concurrency = self.current_concurrency + 1
+            self.current_concurrency = self._clamp(new_concurrency)
+        return self.get_current_concurrency()
+
+
+class GradientConcurrencyController(BaseConcurrencyController):
+    """
+    Latency gradient concurrency control (Vegas / Gradient2 style)
+
+    A short and a long exponential moving average of the response time are kept.
+    While the short one stays within ``tolerance`` of the long one the target grows
+    by roughly sqrt(concurrency) per sample, once queueing inflates the short term
+    latency the gradient pulls the target down proportionally.
+    """
+
+    def __init__(self, min_concurrency=2, max_concurrency=30, window_size=100,
+                 smoothing=0.2, tolerance=1.5):
+        super().__init__(min_concurrency, max_concurrency, window_size)
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.short_rtt = None
+        self.long_rtt = None
+        self._long_alpha = 2 / (window_size + 1)
+        self._pending = 0
+        self._failures = 0
+
+    def record_result(self, response_time: float = None, success=True, nbytes: int = 0):
+        """记录每次请求的结果"""
+        super().record_result(response_time, success, nbytes)
+        if not success:
+            self._failures += 1
+            return
+        if not response_time:
+            return
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = response_time
+        else:
+            self.short_rtt = 0.5 * response_time + 0.5 * self.short_rtt
+            self.long_rtt = self._long_alpha * response_time + (1 - self._long_alpha) * self.long_rtt
+        self._pending += 1
+
+    @property
+    def baseline_response_time(self) -> Optional[float]:
+        return self.long_rtt
+
+    def warm_start(self, concurrency: float, base_response_time: float = None):
+        super().warm_start(concurrency, base_response_time)
+        if base_response_time:
+            self.short_rtt = self.long_rtt = base_response_time
+
+    def calculate_concurrency(self):
+        """计算新的并发数值"""
+        if self._failures:
+            self._failures = 0
+            self._pending = 0
+            self.current_concurrency = self._clamp(self.current_concurrency * 0.8)
+            return self.get_current_concurrency()
+        if not self._pending:
+            return self.get_current_concurrency()
+        self._pending = 0
+
+        # 长期基准远高于短期时说明负载已下降，让基准逐步回落
+        if self.long_rtt / self.short_rtt > 2:
+            self.long_rtt *= 0.95
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        new_concurrency = self.current_concurrency * gradient + math.sqrt(self.current_concurrency)
+        new_concurrency = (1 - self.smoothing) * self.current_concurrency + self.smoothing * new_concurrency
+        self.current_concurrency = self._clamp(new_concurrency)
+        return self.get_current_concurrency()
+
+
+class BBRConcurrencyController(BaseConcurrencyController):
+    """
+    Throughput-maximizing concurrency control (BBR style)
+
+    The controller estimates the bottleneck delivery rate (windowed maximum per
+    round) and the propagation time (windowed minimum response time), and keeps
+    their product in flight. During startup the target grows by ``startup_gain``
+    per round until the delivery rate stops improving by 25% for three rounds,
+    afterwards it cycles through probing gains to discover new bandwidth.
+    """
+    STARTUP = 'startup'
+    PROBE_BW = 'probe_bw'
+    # 并发相当于拥塞窗口而非发送速率，探测后不再额外排空
+    PROBE_GAINS = (1.25, 1, 1, 1, 1, 1, 1, 1)
+
+    def __init__(self, min_concurrency=2, max_concurrency=30, window_size=100,
+                 startup_gain=2.0, bandwidth_rounds=10):
+        super().__init__(min_concurrency, max_concurrency, window_size)
+        self.startup_gain = startup_gain
+        self.mode = self.STARTUP
+        self.response_times = collections.deque(maxlen=window_size)
+        self.delivery_rates = collections.deque(maxlen=bandwidth_rounds)
+        self._full_bandwidth = 0
+        self._full_bandwidth_rounds = 0
+        self._cycle_index = 0
+        self._reset_round()
+
+    def _reset_round(self):
+        self._round_start = self.clock()
+        self._round_delivered = 0
+        self._round_requests = 0
+        self._round_failures = 0
+
+    def record_result(self, response_time: float = None, success=True, nbytes: int = 0):
+        """记录每次请求的结果"""
+        super().record_result(response_time, success, nbytes)
+        if response_time:
+            self.response_times.append(response_time)
+        if success:
+            self._round_delivered += nbytes or 1
+            self._round_requests += 1
+        else:
+            self._round_failures += 1
+
+    @property
+    def baseline_response_time(self) -> Optional[float]:
+        return min(self.response_times) if self.response_times else None
+
+    def warm_start(self, concurrency: float, base_response_time: float = None):
+        super().warm_start(concurrency, base_response_time)
+        # 已知收敛点，直接进入带宽探测阶段
+        self.mode = self.PROBE_BW
+        if base_response_time:
+            self.response_times.append(base_response_time)
+
+    @property
+    def bandwidth(self) -> float:
+        """瓶颈带宽估计（单位与 record_result 的 nbytes 一致）"""
+        return max(self.delivery_rates) if self.delivery_rates else 0
+
+    def calculate_concurrency(self):
+        """计算新的并发数值"""
+        if self._round_requests + self._round_failures < self.get_current_concurrency():
+            return self.get_current_concurrency()
+
+        elapsed = self.clock() - self._round_start
+        failures = self._round_failures
+        if self._round_requests and elapsed > 0:
+            self.delivery_rates.append(self._round_delivered / elapsed)
+            unit = self._round_delivered / self._round_requests
+        else:
+            unit = 1
+        self._reset_round()
+
+        # 限流或失败时直接降窗，退出启动阶段
+        if failures:
+            self.mode = self.PROBE_BW
+            self.current_concurrency = self._clamp(self.current_concurrency * 0.7)
+            return self.get_current_concurrency()
+
+        if not self.response_times or not self.delivery_rates:
+            return self.get_current_concurrency()
+        in_flight = self.bandwidth / unit * min(self.response_times)
+
+        if self.mode == self.STARTUP:
+            if self.bandwidth >= self._full_bandwidth * 1.25:
+                self._full_bandwidth = self.bandwidth
+                self._full_bandwidth_rounds = 0
+            else:
+                self._full_bandwidth_rounds += 1
+            if self._full_bandwidth_rounds < 3:
+                self.current_concurrency = self._clamp(self.current_concurrency * self.startup_gain)
+                return self.get_current_concurrency()
+            # 带宽不再增长，排空启动阶段积压的并发
+            self.mode = self.PROBE_BW
+            self.current_concurrency = self._clamp(math.ceil(in_flight))
+            return self.get_current_concurrency()
+
+        self._cycle_index = (self._cycle_index + 1) % len(self.PROBE_GAINS)
+        self.current_concurrency = self._clamp(math.ceil(in_flight * self.PROBE_GAINS[self._cycle_index]))
+        return self.get_current_concurrency()
+
+
+CONCURRENCY_STRATEGIES: dict[str, Type['BaseConcurrencyController']] = {
+    'default': DynamicConcurrencyController,
+    'aimd': AIMDConcurrencyController,
+    'gradient': GradientConcurrencyController,
+    'bbr': BBRConcurrencyController,
+}
+
+
+def create_concurrency_controller(strategy: Union[str, Type['BaseConcurrencyController']] = 'default',
+                                  min_concurrency=2,
+                                  max_concurrency=30,
+                                  window_size=100) -> 'BaseConcurrencyController':
+    """
+    Create an adaptive concurrency controller
+
+    :param strategy: Strategy name registered in CONCURRENCY_STRATEGIES or a controller class
+    :param min_concurrency: Adaptive concurrency minimum
+    :param max_concurrency: Adaptive concurrency maximum
+    :param window_size: Adaptive concurrency window size
+    :return: Concurrency controller
+    """
+    if isinstance(strategy, str):
+        if strategy not in CONCURRENCY_STRATEGIES:
+            raise ValueError(f"Unknown concurrency strategy: {strategy}, "
+                             f"available: {', '.join(CONCURRENCY_STRATEGIES)}")
+        strategy = CONCURRENCY_STRATEGIES[strategy]
+    if not (isinstance(strategy, type) and issubclass(strategy, BaseConcurrencyController)):
+        raise TypeError("strategy must be a strategy name or a subclass of BaseConcurrencyController")
+    return strategy(min_concurrency, max_concurrency, window_size)
 
 
 class DynamicSemaphore(asyncio.Semaphore):
@@ -172,11 +526,12 @@ class DynamicSemaphore(asyncio.Semaphore):
     Dynamic control of concurrent semaphores
     """
 
-    def __init__(self, dcc: 'DynamicConcurrencyController'):
+    def __init__(self, dcc: 'BaseConcurrencyController'):
         initial_permits = len(dcc)
         self._dcc = dcc
         super().__init__(value=initial_permits)
         self._target = initial_permits  # 当前目标并发数
+        self._debt = 0  # 缩容时尚未收回的已发放许可
         self._lock = asyncio.Lock()  # 状态修改锁
 
     async def adaptive_update(self):
@@ -189,7 +544,7 @@ class DynamicSemaphore(asyncio.Semaphore):
     async def update(self, new_target: int):
         """动态调整信号量容量（线程安全）"""
         async with self._lock:
-            logger.info(f"❤️Adjusting concurrency from {self._target} to {new_target}")
+            concurrency_logger.debug("❤️Adjusting concurrency from %s to %s", self._target, new_target)
             if new_target < 0:
                 raise ValueError("Concurrency cannot be negative")
 
@@ -198,7 +553,10 @@ class DynamicSemaphore(asyncio.Semaphore):
 
             # 调整可用许可数量
             if delta > 0:
-                # 扩容：增加可用许可
+                # 扩容：先抵消未收回的许可，再增加可用许可
+                repaid = min(self._debt, delta)
+                self._debt -= repaid
+                delta -= repaid
                 self._value += delta
 
                 waiters = getattr(self, '_waiters', None)
@@ -210,8 +568,16 @@ class DynamicSemaphore(asyncio.Semaphore):
                     for _ in range(min(delta, waiters_count)):
                         self._wake_up_next()
             elif delta < 0:
-                # 缩容：减少可用许可（不影响已获取许可）
-                self._value = max(0, self._value + delta)
+                # 缩容：先减少可用许可，不足部分在已获取许可释放时收回
+                reclaimed = min(self._value, -delta)
+                self._value -= reclaimed
+                self._debt += -delta - reclaimed
+
+    def release(self):
+        if self._debt > 0:
+            self._debt -= 1
+            return
+        super().release()
 
     @property
     def current_target(self):
@@ -223,5 +589,72 @@ class DynamicSemaphore(asyncio.Semaphore):
         """获取当前可用许可数"""
         return self._value
 
-    def record_result(self, rt: float = None, success: bool = True):
-        self._dcc.record_result(rt, success)
+    def record_result(self, rt: float = None, success: bool = True, nbytes: int = 0):
+        self._dcc.record_result(rt, success, nbytes)
+
+
+class ThreadDynamicSemaphore:
+    """
+    Thread-safe dynamic semaphore for the blocking protocol handlers
+
+    Driven by the same concurrency controllers as ``DynamicSemaphore``. Shrinking
+    takes effect as held permits are released.
+    """
+
+    def __init__(self, dcc: 'BaseConcurrencyController'):
+        self._dcc = dcc
+        self._cond = threading.Condition()
+        self._target = len(dcc)  # 当前目标并发数
+        self._in_use = 0
+
+    def acquire(self) -> bool:
+        with self._cond:
+            while self._in_use >= self._target:
+                self._cond.wait()
+            self._in_use += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def adaptive_update(self):
+        """根据并发控制器调整信号量容量"""
+        with self._cond:
+            new_target = self._dcc.calculate_concurrency()
+            if new_target != self._target:
+                self._update(new_target)
+
+    def update(self, new_target: int):
+        """调整信号量容量"""
+        with self._cond:
+            self._update(new_target)
+
+    def _update(self, new_target: int):
+        concurrency_logger.debug("❤️Adjusting concurrency from %s to %s", self._target, new_target)
+        if new_target < 0:
+            raise ValueError("Concurrency cannot be negative")
+        self._target = new_target
+        self._cond.notify_all()
+
+    @property
+    def current_target(self):
+        """获取当前目标并发数"""
+        return self._target
+
+    @property
+    def available_permits(self):
+        """获取当前可用许可数"""
+        return max(0, self._target - self._in_use)
+
+    def record_result(self, rt: float = None, success: bool = True, nbytes: int = 0):
+        with self._cond:
+            self._dcc.record_result(rt, success, nbytes)
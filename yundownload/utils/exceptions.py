@@ -12,6 +12,7 @@ class ChunkUnsupportedException(DownloadException):
     def __init__(self, uri: str):
         super().__init__(f"Chunked transfer encoding is not supported for URI: {uri}")
 
+
 class NotSupportedProtocolException(DownloadException):
     """
     Raised when the protocol is not supported.
@@ -19,6 +20,7 @@ class NotSupportedProtocolException(DownloadException):
     def __init__(self, uri: str):
         super().__init__(f"Unable to find specified protocol handler for URI: {uri}")
 
+
 class ConnectionException(DownloadException):
     """
     Raised when the connection to the server fails.
@@ -26,9 +28,59 @@ class ConnectionException(DownloadException):
     def __init__(self, uri: str):
         super().__init__(f"Connection to server failed for URI: {uri}")
 
+
 class AuthException(DownloadException):
     """
     Raised when the authentication fails.
     """
     def __init__(self, uri: str):
-        super().__init__(f"Authentication failed for URI: {uri}")
\ No newline at end of file
+        super().__init__(f"Authentication failed for URI: {uri}")
+
+
+class InterruptException(DownloadException):
+    """
+    Raised at a checkpoint when a running download is asked to stop. It is never retried.
+    """
+    pass
+
+
+class PreemptException(InterruptException):
+    """
+    Raised when a running download yields its worker to a higher priority task.
+    """
+    def __init__(self, uri: str):
+        super().__init__(f"Download preempted by a higher priority task for URI: {uri}")
+
+
+class PauseException(InterruptException):
+    """
+    Raised when a running download is paused, it yields its worker until it is resumed.
+    """
+    def __init__(self, uri: str):
+        super().__init__(f"Download paused for URI: {uri}")
+
+
+class CancelException(InterruptException):
+    """
+    Raised when a running download is cancelled, partial data is kept for a later resume.
+    """
+    def __init__(self, uri: str):
+        super().__init__(f"Download cancelled for URI: {uri}")
+
+
+class ChecksumMismatchException(DownloadException):
+    """
+    Raised when downloaded content does not match its expected digest, the bad data is removed.
+    """
+    def __init__(self, uri: str, expected: str, actual: str):
+        super().__init__(f"Checksum mismatch for URI: {uri}, expected {expected} got {actual}")
+
+
+class InsufficientSpaceException(DownloadException):
+    """
+    Raised before a download starts when its volume has not enough free space for it.
+    """
+    def __init__(self, path: str, required: int, available: int):
+        self.required = required
+        self.available = available
+        super().__init__(f"Insufficient disk space for {path}: {required} bytes required, {available} available")
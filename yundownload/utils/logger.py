@@ -1,12 +1,43 @@
+import atexit
 import logging
-from typing import TYPE_CHECKING
+import multiprocessing.util
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING, Optional, Union
 import colorlog
 
+from .core import Environment
+
 if TYPE_CHECKING:
     from ..core import Resources
     from ..utils import Result
 
 
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 记录在同一进程内传递，参数保持原样，只提前渲染异常堆栈
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SubsystemLogger(logging.Logger):
+    """
+    Logger of a subsystem, not registered with the logging manager
+    """
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        # 未注册的 logger 不会被 manager 清理级别缓存
+        self._cache.clear()
+
+
 class Logger(logging.Logger):
     def __init__(self):
         super().__init__('download', level=logging.INFO)
@@ -22,30 +53,128 @@ class Logger(logging.Logger):
             }
         )
 
+        # 级别由 logger 与子系统控制，处理器不再过滤
         handler = logging.StreamHandler()
-        handler.setLevel(logging.INFO)
         handler.setFormatter(formatter)
         self.addHandler(handler)
+        self._subsystems: dict[str, 'SubsystemLogger'] = {}
+        self._listener: Optional[QueueListener] = None
+        self._queue_handler: Optional[QueueHandler] = None
+        # 进程池子进程在启动时清空终结器，之后重新注册退出时的刷新
+        multiprocessing.util.register_after_fork(self, Logger._register_flush)
+
+        if os.getenv(Environment.LOG_LEVELS):
+            self.set_levels(os.getenv(Environment.LOG_LEVELS))
+        if os.getenv(Environment.LOG_QUEUE, '').lower() in ('1', 'true', 'yes', 'on'):
+            self.use_queue()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self._cache.clear()
+        for child in self._subsystems.values():
+            child._cache.clear()
+
+    def subsystem(self, name: str) -> 'SubsystemLogger':
+        """
+        Get the logger of a subsystem, e.g. ``http`` or ``scheduler``
+
+        Subsystem loggers propagate to this logger and inherit its level until one is set.
+
+        :param name: Subsystem name
+        :return: Logger named ``download.<name>``
+        """
+        child = self._subsystems.get(name)
+        if child is None:
+            child = SubsystemLogger(f'{self.name}.{name}')
+            child.parent = self
+            self._subsystems[name] = child
+        return child
+
+    def set_levels(self, levels: Union[str, dict[str, Union[int, str]]]):
+        """
+        Set the level of subsystems
+
+        :param levels: Mapping or ``http=DEBUG,m3u8=WARNING`` string, the key ``*`` sets the level of this logger
+        """
+        if isinstance(levels, str):
+            levels = dict(item.split('=', 1) for item in levels.replace(' ', '').split(',') if item)
+        for name, level in levels.items():
+            level = level.upper() if isinstance(level, str) else level
+            (self if name == '*' else self.subsystem(name)).setLevel(level)
+
+    def use_queue(self) -> QueueListener:
+        """
+        Move the handlers to a background thread, callers only put records on a queue
+
+        Records are formatted and written by the listener thread. Remaining records are
+        flushed when the process exits.
+
+        :return: The queue listener
+        """
+        if self._listener is not None:
+            return self._listener
+        handlers = list(self.handlers)
+        for handler in handlers:
+            self.removeHandler(handler)
+        self._start_listener(handlers)
+        atexit.register(self.stop_queue)
+        self._register_flush()
+        return self._listener
+
+    def _register_flush(self):
+        # 进程池子进程通过 os._exit 退出，不会执行 atexit
+        if self._listener is not None:
+            multiprocessing.util.Finalize(None, self.stop_queue, exitpriority=100)
+
+    def _start_listener(self, handlers: list[logging.Handler]):
+        records = queue.SimpleQueue()
+        self._queue_handler = DeferredQueueHandler(records)
+        self.addHandler(self._queue_handler)
+        self._listener = QueueListener(records, *handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def _after_fork(self):
+        # 监听线程不会被 fork 复制，子进程中重新启动
+        if self._listener is not None:
+            handlers = list(self._listener.handlers)
+            self.removeHandler(self._queue_handler)
+            self._start_listener(handlers)
+
+    def stop_queue(self):
+        """
+        Flush the queue and write records from the calling thread again
+        """
+        listener, self._listener = self._listener, None
+        if listener is None:
+            return
+        self.removeHandler(self._queue_handler)
+        self._queue_handler = None
+        listener.stop()
+        for handler in listener.handlers:
+            self.addHandler(handler)
 
     def resource_start(self, resources: 'Resources'):
-        self.info(f'🚀Start downloading metadata: {resources.uri} to {resources.save_path}')
+        self.info('🚀Start downloading metadata: %s to %s', resources.uri, resources.save_path)
 
     def resource_result(self, resources: 'Resources', result: 'Result'):
-        self.info(f'🏁Downloading result: {result} metadata: {resources.uri} to {resources.save_path}')
+        self.info('🏁Downloading result: %s metadata: %s to %s', result, resources.uri, resources.save_path)
 
     def resource_error(self, resources: 'Resources', error: Exception):
-        self.error(f'🏗Downloading error: {error} metadata: {resources.uri} to {resources.save_path}', exc_info=True)
+        self.error('🏗Downloading error: %s metadata: %s to %s', error, resources.uri, resources.save_path,
+                   exc_info=True)
 
     def resource_exist(self, resources: 'Resources'):
-        self.info(f'📦Downloading exist: metadata: {resources.uri} to {resources.save_path}')
+        self.info('📦Downloading exist: metadata: %s to %s', resources.uri, resources.save_path)
 
     def resource_log(self, resources: 'Resources', message: str, lever: int | str = logging.INFO):
-        self.log(lever, f'❓Downloading message: {message} metadata: {resources.uri} to {resources.save_path}')
+        if isinstance(lever, str):
+            lever = logging.getLevelName(lever.upper())
+        self.log(lever, '❓Downloading message: %s metadata: %s to %s', message, resources.uri, resources.save_path)
 
     def resource_p2s(self, resources: 'Resources', progress: float, speed: float):
-        self.info(
-            f'📊Downloading progress: {progress} speed: {round(speed / 1024 / 1024, 2)} MB/S '
-            f'metadata: {resources.uri} to {resources.save_path}')
+        self.info('📊Downloading progress: %s speed: %s MB/S metadata: %s to %s',
+                  progress, round(speed / 1024 / 1024, 2), resources.uri, resources.save_path)
 
 
 logger = Logger()
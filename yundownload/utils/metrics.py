@@ -0,0 +1,365 @@
+import bisect
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Union, Sequence, TYPE_CHECKING
+from urllib.parse import urlparse
+
+from .logger import logger
+from .tools import Interval
+from .trace import PHASE_BUCKETS
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+                    for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter
+    """
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down, optionally computed when the registry is rendered
+    """
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def reset(self, values: dict[tuple, float]):
+        """
+        Replace every labelled value, used by collectors
+        """
+        with self._lock:
+            self._values = dict(values)
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram with fixed buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # 各桶计数、总和、总数
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def merge(self, counts: Sequence[int], total: float, count: int, **labels):
+        """
+        Add observations counted elsewhere with the same buckets, e.g. in a worker process
+
+        :param counts: Non-cumulative count of every bucket including +Inf
+        :param total: Sum of the observed values
+        :param count: Number of observations
+        """
+        if len(counts) != len(self.buckets):
+            raise ValueError(f"Expected {len(self.buckets)} bucket counts, got {len(counts)}")
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                    lines.append(f'{self.name}_bucket{le} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics in the Prometheus text exposition format
+
+    Values are recorded in the parent process: the workers already report their progress
+    through the shared task slots and return their statistics with the result, so the
+    registry aggregates every pool process without adding work to the download loops.
+    Collectors are called before rendering to refresh gauges computed on demand.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, '_Metric'] = {}
+        self._collectors: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._server: Optional['ThreadingHTTPServer'] = None
+        self._writer: Optional['Interval'] = None
+
+    def _register(self, metric: '_Metric') -> '_Metric':
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} is already registered with another type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> 'Counter':
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> 'Gauge':
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)) -> 'Histogram':
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        Call collector before every render
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """
+        :return: All metrics in the text exposition format
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning('metrics collector failed: %s', e)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+    def serve(self, port: int = 9464, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+        """
+        Serve the metrics over HTTP from a daemon thread
+
+        :param port: Port, 0 picks a free one
+        :param host: Address to bind, loopback by default
+        :return: The server, its server_address holds the bound port
+        """
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        if self._server is not None:
+            raise RuntimeError("Metrics are already being served")
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='yundownload-metrics', daemon=True).start()
+        logger.info('serving metrics on http://%s:%s/metrics', host, self._server.server_address[1])
+        return self._server
+
+    def write_textfile(self, path: Union[str, Path]):
+        """
+        Write the metrics for the node exporter textfile collector, the file is replaced atomically
+        """
+        path = Path(path)
+        temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        temp.write_text(self.render())
+        os.replace(temp, path)
+
+    def write_textfile_every(self, path: Union[str, Path], interval: float = 15):
+        """
+        Rewrite the textfile periodically from a background thread until ``close``
+        """
+        if self._writer is not None:
+            raise RuntimeError("A textfile writer is already running")
+        self._writer = Interval(interval, self.write_textfile, args=[path])
+        self._writer.daemon = True
+        self._writer.start()
+
+    def close(self):
+        """
+        Stop the HTTP server and the textfile writer
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def __repr__(self):
+        return f'<MetricsRegistry {len(self._metrics)} metrics>'
+
+
+def protocol_label(protocol: type) -> str:
+    """HttpProtocolHandler -> http"""
+    name = protocol.__name__
+    return name[:-len('ProtocolHandler')].lower() if name.endswith('ProtocolHandler') else name
+
+
+class DownloadMetrics:
+    """
+    Downloader metrics recorded from finished runs and the shared progress of running tasks
+    """
+
+    def __init__(self, registry: 'MetricsRegistry', scheduler):
+        """
+        :param registry: Registry the metrics are added to
+        :param scheduler: DownloadScheduler whose tasks are observed
+        """
+        self.registry = registry
+        self.scheduler = scheduler
+        labels = ('protocol', 'host')
+        self.downloads = registry.counter('yundownload_downloads_total', 'Finished downloads by result',
+                                          labels + ('result',))
+        self.bytes = registry.counter('yundownload_bytes_total', 'Bytes received by finished runs', labels)
+        self.retries = registry.counter('yundownload_retries_total', 'Retried download attempts', labels)
+        self.errors = registry.counter('yundownload_errors_total', 'Downloads that failed or raised', labels)
+        self.duration = registry.histogram('yundownload_download_duration_seconds', 'Wall time of download runs',
+                                           ('protocol',), (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 14400))
+        self.ttfb = registry.histogram('yundownload_ttfb_seconds', 'Time to the first response carrying data',
+                                       ('protocol',))
+        self.phases = registry.histogram('yundownload_request_phase_seconds',
+                                         'Duration of the phases of HTTP requests: connect, tls, send, wait, '
+                                         'ttfb and transfer', ('protocol', 'phase'), PHASE_BUCKETS)
+        self.active = registry.gauge('yundownload_active_transfers', 'Tasks running in the process pool')
+        self.queued = registry.gauge('yundownload_queued_tasks', 'Tasks waiting in the scheduler')
+        self.paused = registry.gauge('yundownload_paused_tasks', 'Paused tasks')
+        self.throughput = registry.gauge('yundownload_throughput_bytes_per_second',
+                                         'Current throughput of the running tasks', labels)
+        self.concurrency = registry.gauge('yundownload_concurrency_target',
+                                          'Concurrency target of the adaptive controllers of running tasks', labels)
+        registry.add_collector(self.collect)
+
+    @staticmethod
+    def _labels(task) -> dict:
+        return {'protocol': protocol_label(task.protocol), 'host': urlparse(task.resources.uri).hostname or ''}
+
+    def record(self, task, result, error: Optional[BaseException] = None, final: bool = True):
+        """
+        Record a finished run of a task, called by the scheduler for every run
+
+        :param task: ScheduledTask
+        :param result: Result of the run, None when the worker raised
+        :param error: Exception raised by the worker
+        :param final: Whether the task is done or will run again after yielding its worker
+        """
+        labels = self._labels(task)
+        stats = task.stats
+        if stats is not None:
+            self.bytes.inc(stats.bytes, **labels)
+            if stats.retries:
+                self.retries.inc(stats.retries, **labels)
+            self.duration.observe(stats.wall_time, protocol=labels['protocol'])
+            if stats.ttfb is not None:
+                self.ttfb.observe(stats.ttfb, protocol=labels['protocol'])
+            if stats.timings is not None:
+                for phase, (counts, total, count) in stats.timings.series.items():
+                    self.phases.merge(counts, total, count, protocol=labels['protocol'], phase=phase)
+        if not final:
+            return
+        if error is not None or (result is not None and result.is_failure()):
+            self.errors.inc(**labels)
+        self.downloads.inc(**labels, result=str(result) if error is None else 'error')
+
+    def collect(self):
+        self.active.set(self.scheduler.running)
+        self.queued.set(self.scheduler.queued)
+        self.paused.set(self.scheduler.paused)
+        throughput: dict[tuple, float] = {}
+        concurrency: dict[tuple, float] = {}
+        for task in self.scheduler.running_tasks():
+            progress = task.progress()
+            labels = self._labels(task)
+            key = (labels['protocol'], labels['host'])
+            throughput[key] = throughput.get(key, 0) + progress.speed
+            concurrency[key] = concurrency.get(key, 0) + progress.concurrency
+        self.throughput.reset(throughput)
+        self.concurrency.reset(concurrency)
+
+    def close(self):
+        # 最后采集一次，关闭后的仪表盘不会停留在运行中的数值
+        self.collect()
+        self.registry.remove_collector(self.collect)
@@ -0,0 +1,188 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Coroutine, Optional, Union
+
+from .logger import logger
+
+if TYPE_CHECKING:
+    from ..core import Resources
+
+_worker_profiler: Optional['TaskProfiler'] = None
+_asyncio_logger = logging.getLogger('asyncio')
+
+
+class _SlowCallbacks(logging.Handler):
+    """
+    Collects the slow callback warnings of the asyncio debug mode
+    """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records: list[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        if str(record.msg).startswith('Executing'):
+            self.records.append(record.getMessage())
+
+
+class TaskProfiler:
+    """
+    Profiles every download of a worker process and writes one report per task
+
+    Each task produces ``<name>.prof`` with the pstats data, readable with ``pstats`` or
+    snakeviz, and ``<name>.txt`` with the hottest functions and the asyncio callbacks that
+    blocked the event loop longer than ``slow_callback`` seconds. Threads started by the
+    download, e.g. the slices of FTP and SFTP, are profiled too.
+    """
+
+    def __init__(self, directory: Union[str, Path], slow_callback: float = 0.1, top: int = 30):
+        """
+        :param directory: Directory the reports are written to
+        :param slow_callback: Seconds a callback may run before the event loop reports it, 0 disables the
+            asyncio debug mode, whose source tracebacks show up in the profile
+        :param top: Number of functions listed in the summaries
+        """
+        self.directory = Path(directory)
+        self.slow_callback = slow_callback
+        self.top = top
+        self._count = 0
+        self._slow: Optional['_SlowCallbacks'] = None
+
+    @staticmethod
+    def bind(profiler: Optional['TaskProfiler']):
+        """
+        Profile the downloads of this process
+        """
+        global _worker_profiler
+        _worker_profiler = profiler
+
+    @staticmethod
+    def current() -> Optional['TaskProfiler']:
+        return _worker_profiler
+
+    @property
+    def slow_callbacks(self) -> Optional[int]:
+        """
+        Slow callbacks reported so far by the task being profiled, None outside of a task
+        """
+        return len(self._slow.records) if self._slow is not None else None
+
+    @contextmanager
+    def profile(self, resources: 'Resources'):
+        """
+        Profile the block and write the report of the resources when it exits
+        """
+        self._count += 1
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{self._count}-' \
+               f'{re.sub(r"[^A-Za-z0-9._-]+", "_", Path(resources.save_path).name)[:80]}'
+        profiles: list[cProfile.Profile] = []
+        threads: list[str] = []
+        main = cProfile.Profile()
+        self._slow = _SlowCallbacks()
+        _asyncio_logger.addHandler(self._slow)
+        # 线程数在所有版本上都由钩子统计
+        threading.setprofile(self._thread_hook(profiles, threads))
+        begin, cpu = time.perf_counter(), time.process_time()
+        main.enable()
+        try:
+            yield
+        finally:
+            main.disable()
+            wall, cpu = time.perf_counter() - begin, time.process_time() - cpu
+            threading.setprofile(None)
+            _asyncio_logger.removeHandler(self._slow)
+            slow, self._slow = self._slow.records, None
+            try:
+                self._write(name, resources, main, profiles, len(threads), slow, wall, cpu)
+            except Exception as e:
+                logger.warning('writing the profile of %s failed: %s', resources.uri, e)
+
+    @staticmethod
+    def _thread_hook(profiles: list, threads: list):
+        def start(frame, event, arg):
+            sys.setprofile(None)
+            # 进程内的常驻服务线程（进度报告等）不属于单个任务
+            if threading.current_thread().name.startswith('yundownload-'):
+                return
+            threads.append(threading.current_thread().name)
+            # 3.12 起 cProfile 基于 sys.monitoring，已覆盖所有线程
+            if sys.version_info < (3, 12):
+                profile = cProfile.Profile()
+                profiles.append(profile)
+                profile.enable()
+
+        return start
+
+    def _write(self, name: str, resources: 'Resources', main: 'cProfile.Profile', profiles: list, threads: int,
+               slow: list[str], wall: float, cpu: float):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stats = pstats.Stats(main)
+        for profile in profiles:
+            stats.add(profile)
+        stats.dump_stats(self.directory / f'{name}.prof')
+        report = io.StringIO()
+        report.write(f'uri: {resources.uri}\nsave_path: {resources.save_path}\n'
+                     f'wall: {wall:.3f}s cpu: {cpu:.3f}s threads: {threads + 1}\n'
+                     f'slow callbacks (>{self.slow_callback}s): {len(slow)}\n')
+        for record in slow[:self.top]:
+            report.write(f'  {record}\n')
+        report.write('\n')
+        _print_hottest(stats, report, self.top)
+        (self.directory / f'{name}.txt').write_text(report.getvalue())
+        logger.info('profile of %s written to %s', resources.uri, self.directory / f'{name}.txt')
+
+    def __repr__(self):
+        return f'<TaskProfiler {self.directory}>'
+
+
+def _print_hottest(stats: 'pstats.Stats', stream: io.StringIO, top: int):
+    stats.stream = stream
+    stream.write('hottest functions by own time\n')
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    stream.write('hottest functions by cumulative time\n')
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+
+def summarize_profiles(directory: Union[str, Path], top: int = 30) -> str:
+    """
+    Merge every task profile of a directory, e.g. all workers of a run, into one summary
+
+    :param directory: Directory of a TaskProfiler
+    :param top: Number of functions listed
+    :return: The hottest functions over all tasks
+    """
+    paths = sorted(Path(directory).glob('*.prof'))
+    if not paths:
+        return ''
+    stats = pstats.Stats(str(paths[0]))
+    for path in paths[1:]:
+        stats.add(str(path))
+    report = io.StringIO()
+    report.write(f'{len(paths)} task profiles in {directory}\n\n')
+    _print_hottest(stats, report, top)
+    return report.getvalue()
+
+
+async def _watch(coro: Coroutine, slow_callback: float):
+    asyncio.get_running_loop().slow_callback_duration = slow_callback
+    return await coro
+
+
+def run_coroutine(coro: Coroutine):
+    """
+    ``asyncio.run`` for the download loops, in debug mode with slow callback detection while profiling
+    """
+    profiler = _worker_profiler
+    if profiler is None or profiler.slow_callbacks is None or not profiler.slow_callback:
+        return asyncio.run(coro)
+    return asyncio.run(_watch(coro, profiler.slow_callback), debug=True)
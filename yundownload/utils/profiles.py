@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union, TYPE_CHECKING
+from urllib.parse import urlparse
+
+from ..utils.core import Environment
+from ..utils.logger import logger
+
+if TYPE_CHECKING:
+    from ..utils.equilibrium import BaseConcurrencyController
+
+
+class HostProfileStore:
+    """
+    Learned concurrency profiles per host
+
+    Profiles live in memory for the lifetime of the process. When a path is given
+    they are also merged into a JSON file so that other worker processes and later
+    runs can warm-start from them.
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None, half_life: float = 6 * 3600, min_requests: int = 10):
+        """
+        Host profile store
+
+        :param path: Optional JSON file the profiles are persisted to
+        :param half_life: Seconds after which a learned concurrency decays halfway back to the minimum
+        :param min_requests: Requests a download must have made before its state is considered converged
+        """
+        self.path = Path(path) if path else None
+        self.half_life = half_life
+        self.min_requests = min_requests
+        self._profiles: dict[str, dict] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_key(uri: str) -> str:
+        """
+        Normalize a URI to the key its profile is stored under
+
+        :param uri: Resource URI
+        :return: scheme://host:port
+        """
+        parsed = urlparse(uri)
+        return f"{parsed.scheme.lower()}://{(parsed.hostname or '').lower()}:{parsed.port or ''}"
+
+    def get(self, uri: str) -> Optional[dict]:
+        """
+        Get the profile for the host of a URI
+
+        :param uri: Resource URI
+        :return: Profile dict or None
+        """
+        with self._lock:
+            self._load()
+            return self._profiles.get(self.host_key(uri))
+
+    def warm_start(self, uri: str, controller: 'BaseConcurrencyController') -> bool:
+        """
+        Seed a fresh controller with the decayed profile of its host
+
+        :param uri: Resource URI
+        :param controller: Concurrency controller that has not made any requests yet
+        :return: Whether a profile was applied
+        """
+        profile = self.get(uri)
+        if not profile:
+            return False
+        weight = 0.5 ** (max(0.0, time.time() - profile['updated_at']) / self.half_life)
+        concurrency = (controller.min_concurrency +
+                       (profile['concurrency'] - controller.min_concurrency) * weight)
+        # 基准响应时间过旧时不再可信
+        base_response_time = profile.get('base_response_time') if weight >= 0.5 else None
+        controller.warm_start(concurrency, base_response_time)
+        logger.debug("Warm start concurrency %s for %s (weight %.2f)",
+                     controller.get_current_concurrency(), self.host_key(uri), weight)
+        return True
+
+    def record(self, uri: str, controller: 'BaseConcurrencyController'):
+        """
+        Store the state a controller converged to
+
+        :param uri: Resource URI
+        :param controller: Concurrency controller after the download
+        """
+        snapshot = controller.snapshot()
+        if snapshot['requests'] < self.min_requests:
+            return
+        key = self.host_key(uri)
+        with self._lock:
+            self._load()
+            self._profiles[key] = {
+                'concurrency': snapshot['concurrency'],
+                'base_response_time': snapshot['base_response_time'],
+                'failure_rate': snapshot['failure_rate'],
+                'updated_at': time.time(),
+            }
+            self._save()
+
+    def clear(self):
+        """
+        Forget every learned profile, including the persisted file
+        """
+        with self._lock:
+            self._profiles.clear()
+            self._loaded = True
+            if self.path and self.path.exists():
+                self.path.unlink()
+
+    def _read(self) -> dict:
+        try:
+            with self.path.open('r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Unable to read host profiles %s: %s", self.path, e)
+            return {}
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.path:
+            self._profiles.update(self._read())
+
+    def _save(self):
+        if not self.path:
+            return
+        # 合并其他进程写入的条目，保留各主机最新的记录
+        profiles = self._read()
+        for key, profile in self._profiles.items():
+            if key not in profiles or profiles[key]['updated_at'] <= profile['updated_at']:
+                profiles[key] = profile
+        self._profiles = profiles
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with temp_path.open('w', encoding='utf-8') as f:
+                json.dump(profiles, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning("Unable to persist host profiles %s: %s", self.path, e)
+
+
+host_profiles = HostProfileStore(
+    os.getenv(Environment.HOST_PROFILE_PATH),
+    float(os.getenv(Environment.HOST_PROFILE_HALF_LIFE, 6 * 3600))
+)
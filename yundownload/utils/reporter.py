@@ -0,0 +1,212 @@
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+from .core import Environment
+from .logger import logger
+
+if TYPE_CHECKING:
+    from ..core import Resources
+    from ..network.base import BaseProtocolHandler
+
+
+class Snapshot:
+    """
+    Progress of one transfer at a sampling tick
+    """
+    __slots__ = ('resources', 'bytes_done', 'total', 'steps', 'steps_total', 'speed', 'concurrency', 'elapsed')
+
+    def __init__(self, resources: 'Resources', bytes_done: int, total: int, steps: int, steps_total: int,
+                 speed: float, concurrency: int, elapsed: float):
+        self.resources = resources
+        self.bytes_done = bytes_done
+        self.total = total
+        self.steps = steps
+        self.steps_total = steps_total
+        self.speed = speed
+        self.concurrency = concurrency
+        self.elapsed = elapsed
+
+    @property
+    def fraction(self) -> float:
+        """
+        Completed share between 0 and 1, 0 when the size is unknown
+        """
+        if self.steps_total:
+            return self.steps / self.steps_total
+        if self.total:
+            return min(1.0, self.bytes_done / self.total)
+        return 0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        Seconds left at the smoothed speed, None when the size or speed is unknown
+        """
+        if not self.total or self.speed <= 0:
+            return None
+        return max(self.total - self.bytes_done, 0) / self.speed
+
+    def __repr__(self):
+        return (f'<Snapshot {self.resources.uri} {self.bytes_done}/{self.total} bytes '
+                f'{self.speed / 1024 / 1024:.2f} MB/S>')
+
+
+class _Transfer:
+    __slots__ = ('handler', 'started', 'last_time', 'last_bytes', 'speed', 'last_logged')
+
+    def __init__(self, handler: 'BaseProtocolHandler', now: float):
+        self.handler = handler
+        self.started = now
+        self.last_time = now
+        self.last_bytes = 0
+        self.speed: Optional[float] = None
+        self.last_logged = now
+
+
+class ProgressReporter:
+    """
+    Samples every active transfer of the process from a single timer thread
+
+    The speed is an exponentially weighted moving average of the bytes received between
+    ticks, so reading a snapshot has no side effects. Each tick publishes the snapshot to
+    the shared task slot of the transfer, logs it every ``log_every`` seconds and hands all
+    snapshots to the subscribers.
+    """
+
+    def __init__(self, interval: float = 0.5, log_every: float = 5, half_life: float = 2):
+        """
+        :param interval: Seconds between samples
+        :param log_every: Seconds between progress log lines of a transfer
+        :param half_life: Seconds after which a sample counts half in the smoothed speed
+        """
+        self.interval = interval
+        self.log_every = log_every
+        self.half_life = half_life
+        self._transfers: dict[int, '_Transfer'] = {}
+        self._subscribers: list[Callable[[list['Snapshot']], None]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, handler: 'BaseProtocolHandler'):
+        """
+        Start sampling a transfer
+        """
+        with self._lock:
+            self._transfers[id(handler)] = _Transfer(handler, time.monotonic())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='yundownload-progress', daemon=True)
+                self._thread.start()
+
+    def unregister(self, handler: 'BaseProtocolHandler') -> Optional['Snapshot']:
+        """
+        Stop sampling a transfer after a final sample that is published and logged
+
+        :return: The final snapshot
+        """
+        with self._lock:
+            transfer = self._transfers.pop(id(handler), None)
+        if transfer is None:
+            return None
+        snapshot = self._sample(transfer, time.monotonic())
+        self._emit(transfer, snapshot, log=True)
+        return snapshot
+
+    def subscribe(self, callback: Callable[[list['Snapshot']], None]):
+        """
+        Call callback with the snapshots of every tick, from the reporter thread
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[list['Snapshot']], None]):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def snapshot(self, handler: 'BaseProtocolHandler') -> Optional['Snapshot']:
+        """
+        Current progress of a registered transfer without advancing the smoothed speed
+        """
+        transfer = self._transfers.get(id(handler))
+        if transfer is None:
+            return None
+        return self._build(transfer, transfer.speed or 0, time.monotonic())
+
+    def _sample(self, transfer: '_Transfer', now: float) -> 'Snapshot':
+        handler = transfer.handler
+        # 续传时已有的字节不计入速度
+        transferred = handler.current_size - handler._resumed_size
+        elapsed = now - transfer.last_time
+        if transferred < transfer.last_bytes:
+            # 重试时计数器已清零
+            transfer.last_bytes = 0
+        if elapsed > 0:
+            rate = (transferred - transfer.last_bytes) / elapsed
+            weight = 1 - math.exp(-elapsed * math.log(2) / self.half_life) if self.half_life > 0 else 1
+            transfer.speed = rate if transfer.speed is None else transfer.speed + weight * (rate - transfer.speed)
+            transfer.last_time, transfer.last_bytes = now, transferred
+            handler._peak_speed = max(handler._peak_speed, rate)
+        snapshot = self._build(transfer, transfer.speed or 0, now)
+        handler._peak_concurrency = max(handler._peak_concurrency, snapshot.concurrency)
+        return snapshot
+
+    @staticmethod
+    def _build(transfer: '_Transfer', speed: float, now: float) -> 'Snapshot':
+        handler = transfer.handler
+        semaphore = handler.resources.semaphore
+        return Snapshot(handler.resources, handler.current_size, handler._total_size, handler._steps,
+                        handler._total, speed, semaphore.current_target if semaphore is not None else 0,
+                        now - transfer.started)
+
+    def _emit(self, transfer: '_Transfer', snapshot: 'Snapshot', log: bool):
+        handler = transfer.handler
+        handler.snapshot = snapshot
+        if handler.task_slot is not None:
+            handler.task_slot.publish(snapshot.bytes_done, snapshot.total, snapshot.steps, snapshot.steps_total,
+                                      snapshot.speed, snapshot.concurrency)
+        if log:
+            logger.resource_p2s(snapshot.resources, handler.progress, snapshot.speed)
+
+    def _tick(self):
+        now = time.monotonic()
+        with self._lock:
+            transfers = list(self._transfers.values())
+            subscribers = list(self._subscribers)
+        snapshots = []
+        for transfer in transfers:
+            snapshot = self._sample(transfer, now)
+            log = now - transfer.last_logged >= self.log_every
+            if log:
+                transfer.last_logged = now
+            self._emit(transfer, snapshot, log)
+            snapshots.append(snapshot)
+        for callback in subscribers:
+            try:
+                callback(snapshots)
+            except Exception as e:
+                logger.warning('progress subscriber failed: %s', e)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._tick()
+            except Exception as e:
+                logger.warning('progress reporter failed: %s', e)
+
+    def _after_fork(self):
+        # 采样线程不会被 fork 复制，子进程中按需重新启动
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._thread = None
+
+    def __repr__(self):
+        return f'<ProgressReporter {len(self._transfers)} transfers>'
+
+
+reporter = ProgressReporter(float(os.getenv(Environment.PROGRESS_EVERY, 0.5)),
+                            float(os.getenv(Environment.LOG_EVERY, 5)))
+os.register_at_fork(after_in_child=reporter._after_fork)
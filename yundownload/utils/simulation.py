@@ -0,0 +1,271 @@
+"""
+Deterministic simulation of the adaptive concurrency control
+
+The real ``DynamicSemaphore`` and concurrency controllers are driven against
+synthetic server models inside an event loop whose clock is virtual: sleeping
+advances the clock instead of waiting, so minutes of traffic run in milliseconds
+and every run with the same seed produces the same report.
+"""
+import asyncio
+import random
+import selectors
+import statistics
+from typing import Type, Union
+
+from ..utils.equilibrium import BaseConcurrencyController, DynamicSemaphore, CONCURRENCY_STRATEGIES
+
+
+class ServerModel:
+    """
+    Synthetic server base class
+    """
+    request_size = 1024 * 1024
+
+    def respond(self, in_flight: int, rng: random.Random) -> tuple[float, bool]:
+        """
+        Serve a request
+
+        :param in_flight: Requests in flight including this one
+        :param rng: Random source of the simulation
+        :return: Service time in seconds and whether the request succeeded
+        """
+        raise NotImplementedError
+
+
+class BandwidthServer(ServerModel):
+    """
+    Fixed total bandwidth shared by all connections, optionally capped per connection
+    """
+
+    def __init__(self, bandwidth: float, latency: float = 0.05, request_size: int = 1024 * 1024,
+                 per_connection: float = None):
+        """
+        :param bandwidth: Total bandwidth in bytes per second
+        :param latency: Fixed latency per request in seconds
+        :param request_size: Bytes per request
+        :param per_connection: Bandwidth cap of a single connection in bytes per second
+        """
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.request_size = request_size
+        self.per_connection = per_connection
+
+    def respond(self, in_flight: int, rng: random.Random) -> tuple[float, bool]:
+        rate = self.bandwidth / in_flight
+        if self.per_connection:
+            rate = min(rate, self.per_connection)
+        return self.latency + self.request_size / rate, True
+
+
+class LatencyGrowthServer(ServerModel):
+    """
+    Response time grows with the number of requests in flight (queueing server)
+    """
+
+    def __init__(self, base_latency: float = 0.2, growth: float = 0.1, knee: int = 8,
+                 request_size: int = 1024 * 1024):
+        """
+        :param base_latency: Response time without load
+        :param growth: Relative response time increase per request in flight above the knee
+        :param knee: Requests the server handles in parallel without queueing
+        :param request_size: Bytes per request
+        """
+        self.base_latency = base_latency
+        self.growth = growth
+        self.knee = knee
+        self.request_size = request_size
+
+    def respond(self, in_flight: int, rng: random.Random) -> tuple[float, bool]:
+        queued = max(0, in_flight - self.knee)
+        return self.base_latency * (1 + self.growth * queued) ** 2, True
+
+
+class ThrottlingServer(ServerModel):
+    """
+    Rejects requests above a concurrency limit with 429/503 style fast failures
+    """
+
+    def __init__(self, server: 'ServerModel', limit: int, reject_latency: float = 0.01, status: int = 429):
+        """
+        :param server: Model serving the accepted requests
+        :param limit: Requests in flight above which the server throttles
+        :param reject_latency: Response time of a rejected request
+        :param status: Status code the rejection represents
+        """
+        self.server = server
+        self.limit = limit
+        self.reject_latency = reject_latency
+        self.status = status
+        self.request_size = server.request_size
+
+    def respond(self, in_flight: int, rng: random.Random) -> tuple[float, bool]:
+        if in_flight > self.limit:
+            return self.reject_latency, False
+        return self.server.respond(in_flight, rng)
+
+
+class FlakyServer(ServerModel):
+    """
+    Fails a random share of requests
+    """
+
+    def __init__(self, server: 'ServerModel', failure_rate: float = 0.05):
+        """
+        :param server: Model serving the requests
+        :param failure_rate: Probability that a request fails
+        """
+        self.server = server
+        self.failure_rate = failure_rate
+        self.request_size = server.request_size
+
+    def respond(self, in_flight: int, rng: random.Random) -> tuple[float, bool]:
+        service_time, success = self.server.respond(in_flight, rng)
+        if rng.random() < self.failure_rate:
+            return service_time * rng.random(), False
+        return service_time, success
+
+
+class SimulationReport:
+    """
+    Result of a simulation run
+    """
+
+    def __init__(self, strategy: str, duration: float, timeline: list[tuple[float, int]],
+                 completions: list[tuple[float, int]], failures: int):
+        """
+        :param strategy: Name of the controller class
+        :param duration: Simulated seconds
+        :param timeline: (time, semaphore target) for every adjustment
+        :param completions: (time, bytes) for every successful request
+        :param failures: Number of failed requests
+        """
+        self.strategy = strategy
+        self.duration = duration
+        self.timeline = timeline
+        self.completions = completions
+        self.failures = failures
+
+        steady_start = duration / 2
+        steady = self._targets_between(steady_start, duration)
+        self.steady_state_concurrency = statistics.mean(steady)
+        self.steady_state_throughput = sum(
+            size for t, size in completions if t >= steady_start
+        ) / (duration - steady_start)
+        self.oscillation = (statistics.pstdev(steady) / self.steady_state_concurrency
+                            if self.steady_state_concurrency else 0)
+        self.convergence_time = self._convergence_time()
+
+    def _targets_between(self, start: float, end: float) -> list[int]:
+        targets = [target for t, target in self.timeline if start <= t <= end]
+        before = [target for t, target in self.timeline if t < start]
+        if before:
+            targets.insert(0, before[-1])
+        return targets
+
+    def _convergence_time(self) -> float:
+        """目标并发最后一次离开稳态区间（±max(1, 10%)）的时间"""
+        band = max(1.0, 0.1 * self.steady_state_concurrency)
+        converged_at = 0.0
+        for t, target in self.timeline:
+            if t <= self.duration and abs(target - self.steady_state_concurrency) > band:
+                converged_at = t
+        return converged_at
+
+    def as_dict(self) -> dict:
+        return {
+            'strategy': self.strategy,
+            'convergence_time': round(self.convergence_time, 3),
+            'steady_state_throughput': round(self.steady_state_throughput, 3),
+            'steady_state_concurrency': round(self.steady_state_concurrency, 3),
+            'oscillation': round(self.oscillation, 4),
+            'failures': self.failures,
+        }
+
+    def __repr__(self):
+        return (f"<SimulationReport {self.strategy} converged {self.convergence_time:.1f}s "
+                f"throughput {self.steady_state_throughput / 1024 / 1024:.2f} MB/S "
+                f"concurrency {self.steady_state_concurrency:.1f} oscillation {self.oscillation:.3f}>")
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    """Advances the loop clock by the poll timeout instead of blocking"""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Simulation stalled: nothing is scheduled")
+        self.now += timeout
+        return []
+
+
+class _VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self._virtual_selector = _VirtualSelector()
+        super().__init__(self._virtual_selector)
+
+    def time(self):
+        return self._virtual_selector.now
+
+
+def simulate(strategy: Union[str, Type['BaseConcurrencyController']],
+             server: 'ServerModel',
+             duration: float = 300,
+             min_concurrency: int = 2,
+             max_concurrency: int = 30,
+             window_size: int = 100,
+             seed: int = 0) -> 'SimulationReport':
+    """
+    Drive a concurrency controller against a server model under a virtual clock
+
+    :param strategy: Strategy name registered in CONCURRENCY_STRATEGIES or a controller class
+    :param server: Synthetic server model
+    :param duration: Simulated seconds
+    :param min_concurrency: Adaptive concurrency minimum
+    :param max_concurrency: Adaptive concurrency maximum
+    :param window_size: Adaptive concurrency window size
+    :param seed: Random seed
+    :return: Simulation report
+    """
+    if isinstance(strategy, str):
+        strategy = CONCURRENCY_STRATEGIES[strategy]
+    loop = _VirtualTimeEventLoop()
+    # 在实例化前替换时钟，保证初始化时读取的也是虚拟时间
+    controller_cls = type(strategy.__name__, (strategy,), {'clock': staticmethod(loop.time)})
+    rng = random.Random(seed)
+    timeline: list[tuple[float, int]] = []
+    completions: list[tuple[float, int]] = []
+    failures = 0
+    in_flight = 0
+
+    async def request(sem: 'DynamicSemaphore'):
+        nonlocal failures, in_flight
+        while loop.time() < duration:
+            async with sem:
+                in_flight += 1
+                service_time, success = server.respond(in_flight, rng)
+                await asyncio.sleep(service_time)
+                in_flight -= 1
+                if success:
+                    completions.append((loop.time(), server.request_size))
+                    sem.record_result(service_time, True, server.request_size)
+                else:
+                    failures += 1
+                    sem.record_result(success=False)
+                await sem.adaptive_update()
+                if timeline[-1][1] != sem.current_target:
+                    timeline.append((loop.time(), sem.current_target))
+
+    async def run():
+        controller = controller_cls(min_concurrency, max_concurrency, window_size)
+        sem = DynamicSemaphore(controller)
+        timeline.append((loop.time(), sem.current_target))
+        await asyncio.gather(*(request(sem) for _ in range(max_concurrency)))
+
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+    return SimulationReport(strategy.__name__, duration, timeline, completions, failures)
@@ -0,0 +1,241 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Optional
+
+from .config import DEFAULT_STREAM_BUFFER_SIZE
+from .core import Result
+from .exceptions import CancelException, DownloadException
+
+if TYPE_CHECKING:
+    from ..core import Resources
+    from ..network.base import BaseProtocolHandler
+    from .stats import TransferStats
+
+
+class Sink(ABC):
+    """
+    Destination receiving the content of a download in order instead of its save path
+    """
+
+    @abstractmethod
+    def write(self, data: bytes):
+        """
+        Take the next bytes of the content, blocking applies backpressure to the download
+
+        Asynchronous transfers call it from their event loop, a slow sink slows every
+        connection of the download.
+        """
+        pass
+
+
+class OrderedParts:
+    """
+    Passes parts that are downloaded concurrently, e.g. slices or segments, to a writer in order
+
+    The first unfinished part is written through. Parts after it are buffered until they are
+    next, at most ``buffer_size`` bytes in total, beyond that their downloads wait. Parts are
+    expected to acquire their connection in order, so the first unfinished part always runs.
+    """
+    __slots__ = ('buffer_size', 'error', '_write', '_head', '_parts', '_finished', '_buffered', '_waiters')
+
+    def __init__(self, write: Callable[[bytes], None], count: int, buffer_size: int = DEFAULT_STREAM_BUFFER_SIZE):
+        """
+        :param write: Receives the content in order
+        :param count: Number of parts
+        :param buffer_size: Bytes of later parts kept in memory
+        """
+        self.buffer_size = buffer_size
+        self.error: Optional[BaseException] = None
+        self._write = write
+        self._head = 0
+        self._parts: list[list[bytes]] = [[] for _ in range(count)]
+        self._finished = [False] * count
+        self._buffered = 0
+        self._waiters: list['asyncio.Future'] = []
+
+    async def write(self, index: int, data: bytes):
+        """
+        Add the next bytes of a part
+        """
+        while self.error is None and index != self._head and self._buffered and \
+                self._buffered + len(data) > self.buffer_size:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        if self.error is not None:
+            raise self.error
+        if index == self._head:
+            self._write(data)
+        else:
+            self._parts[index].append(data)
+            self._buffered += len(data)
+
+    def finish(self, index: int):
+        """
+        Mark a part complete, the buffered parts that follow it are written
+        """
+        self._finished[index] = True
+        while self._head < len(self._parts) and self._finished[self._head]:
+            self._head += 1
+            if self._head < len(self._parts):
+                for data in self._parts[self._head]:
+                    self._write(data)
+                    self._buffered -= len(data)
+                self._parts[self._head] = []
+        self._wake()
+
+    def abort(self, error: BaseException):
+        """
+        Stop all parts after one failed, waiting parts raise the error
+        """
+        if self.error is None:
+            self.error = error
+        self._parts = [[] for _ in self._parts]
+        self._buffered = 0
+        self._wake()
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class ChunkStream(Sink):
+    """
+    In-order chunks of a download running in a background thread
+
+    Iterate it, ``async for`` it or ``read`` it like a file. At most ``buffer_size`` bytes
+    wait for the consumer, the download pauses while the buffer is full. Closing the
+    stream before the end cancels the download. Errors of the download are raised by
+    the iteration once the chunks before them are consumed.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_STREAM_BUFFER_SIZE):
+        """
+        :param buffer_size: Bytes buffered for the consumer
+        """
+        self.buffer_size = buffer_size
+        self.result: Optional['Result'] = None
+        self.stats: Optional['TransferStats'] = None
+        self._chunks: deque[bytes] = deque()
+        self._buffered = 0
+        self._cond = threading.Condition()
+        self._done = False
+        self._cancelled = False
+        self._error: Optional[BaseException] = None
+        self._uri = ''
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, handler: 'BaseProtocolHandler', resources: 'Resources') -> 'ChunkStream':
+        """
+        Run the download of resources into this stream
+        """
+        self._uri = resources.uri
+        handler.sink = self
+        self._thread = threading.Thread(target=self._run, args=(handler, resources),
+                                        name='yundownload-stream', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, handler: 'BaseProtocolHandler', resources: 'Resources'):
+        error = None
+        try:
+            self.result = handler(resources)
+            self.stats = handler.stats
+            if not self.result & (Result.SUCCESS | Result.EXIST) and not self._cancelled:
+                error = DownloadException(f'Download finished with {self.result!r} for URI: {resources.uri}')
+                error.__cause__ = handler.error
+        except BaseException as e:
+            error = e
+        finally:
+            handler.sink = None
+            with self._cond:
+                self._done = True
+                self._error = error
+                self._cond.notify_all()
+
+    def write(self, data: bytes):
+        with self._cond:
+            while self._buffered >= self.buffer_size and not self._cancelled:
+                self._cond.wait()
+            if self._cancelled:
+                raise CancelException(self._uri)
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self._cond.notify_all()
+
+    def _next(self, limit: int = -1) -> Optional[bytes]:
+        """
+        The next chunk, at most limit bytes when limit is not negative, None at the end
+        """
+        with self._cond:
+            while not self._chunks and not self._done:
+                self._cond.wait()
+            if self._chunks:
+                data = self._chunks.popleft()
+                if 0 <= limit < len(data):
+                    # 其余部分留在队首
+                    data, rest = data[:limit], data[limit:]
+                    self._chunks.appendleft(rest)
+                self._buffered -= len(data)
+                self._cond.notify_all()
+                return data
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            return None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        data = self._next()
+        if data is None:
+            raise StopIteration
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        data = await asyncio.get_running_loop().run_in_executor(None, self._next)
+        if data is None:
+            raise StopAsyncIteration
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read up to size bytes, all remaining bytes when negative, b'' at the end
+        """
+        parts, length = [], 0
+        while size < 0 or length < size:
+            data = self._next(size - length if size >= 0 else -1)
+            if data is None:
+                break
+            parts.append(data)
+            length += len(data)
+        return b''.join(parts)
+
+    def close(self):
+        """
+        Stop consuming, a running download is cancelled
+        """
+        with self._cond:
+            self._cancelled = True
+            self._chunks.clear()
+            self._buffered = 0
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def __enter__(self) -> 'ChunkStream':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f'<ChunkStream {self._uri} {self._buffered} bytes buffered>'
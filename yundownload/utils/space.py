@@ -0,0 +1,107 @@
+import errno
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .exceptions import InsufficientSpaceException
+from .logger import logger
+from .tools import convert_slice_path
+
+# 文件系统不支持预分配时返回的错误，此时退回按块增长
+_UNSUPPORTED = {errno.EINVAL, errno.EOPNOTSUPP, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP), errno.ENOSYS}
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def free_space(path: Path) -> Optional[int]:
+    """
+    Bytes available to this user on the volume of path, None when unknown
+
+    :param path: A file or directory, it does not need to exist yet
+    """
+    path = path.absolute()
+    for directory in (path, *path.parents):
+        if directory.exists():
+            try:
+                return shutil.disk_usage(directory).free
+            except OSError:
+                return None
+    return None
+
+
+def ensure_space(path: Path, required: int):
+    """
+    :raise InsufficientSpaceException: The volume of path has less than required bytes free
+    """
+    if required <= 0:
+        return
+    available = free_space(path)
+    if available is not None and available < required:
+        raise InsufficientSpaceException(str(path), required, available)
+
+
+def merged_path(save_path: Path) -> Path:
+    """
+    Temporary file the slices or segments of save_path are merged into before it is renamed
+    """
+    return convert_slice_path(save_path)('merged')
+
+
+def preallocate(path: Path, length: int) -> bool:
+    """
+    Reserve the first length bytes of path with ``posix_fallocate``, creating it if needed
+
+    The file is extended to length, so only files that are complete once renamed are reserved.
+
+    :return: Whether the extent was reserved, False when the platform or filesystem cannot
+    :raise InsufficientSpaceException: The volume is full
+    """
+    if not hasattr(os, 'posix_fallocate') or length <= 0:
+        return False
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o666)
+    try:
+        size = os.fstat(fd).st_size
+        os.posix_fallocate(fd, 0, length)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            # 释放失败前已分配的部分
+            os.ftruncate(fd, size)
+            raise InsufficientSpaceException(str(path), length, free_space(path) or 0) from e
+        if e.errno not in _UNSUPPORTED:
+            raise
+        logger.debug('preallocation is not supported for %s: %s', path, e)
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+def reserve(save_path: Path, length: int, parts: Iterable[Path] = ()) -> Optional[Path]:
+    """
+    Check the free space for the rest of a download before any bytes move
+
+    A download written in parts also needs the merged file next to the parts until they are
+    removed, it is reserved up front at its full length.
+
+    :param save_path: Save path of the download
+    :param length: Size of the download, nothing is checked when unknown (0)
+    :param parts: Slice or segment files, empty for a download written to save_path directly
+    :return: The reserved merged file for a download in parts
+    :raise InsufficientSpaceException: Not enough free space
+    """
+    if length <= 0:
+        return None
+    parts = list(parts)
+    if not parts:
+        ensure_space(save_path, length - file_size(save_path))
+        return None
+    merged = merged_path(save_path)
+    ensure_space(save_path, 2 * length - sum(file_size(part) for part in parts) - file_size(merged))
+    preallocate(merged, length)
+    return merged
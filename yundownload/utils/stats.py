@@ -0,0 +1,85 @@
+from typing import Optional
+
+from .trace import TimingSummary
+
+
+class TransferStats:
+    """
+    Statistics of one download run, returned by the worker along with the Result
+    """
+    __slots__ = ('mode', 'bytes', 'resumed_bytes', 'total_size', 'wall_time', 'ttfb', 'peak_speed', 'retries',
+                 'slices', 'segments', 'peak_concurrency', 'controller', 'timings', 'chunk_size',
+                 'checksum')
+
+    def __init__(self,
+                 mode: Optional[str] = None,
+                 bytes: int = 0,  # noqa
+                 resumed_bytes: int = 0,
+                 total_size: int = 0,
+                 wall_time: float = 0,
+                 ttfb: Optional[float] = None,
+                 peak_speed: float = 0,
+                 retries: int = 0,
+                 slices: int = 0,
+                 segments: int = 0,
+                 peak_concurrency: int = 0,
+                 controller: Optional[dict] = None,
+                 timings: Optional['TimingSummary'] = None,
+                 chunk_size: int = 0,
+                 checksum: Optional[str] = None):
+        """
+        :param mode: Transfer path that ran: 'stream', 'sliced', 'segments', 'store' or None when nothing was fetched
+        :param bytes: Bytes received over the network, including attempts that were retried
+        :param resumed_bytes: Bytes already on disk from an earlier run
+        :param total_size: Remote size, 0 when unknown
+        :param wall_time: Seconds the handler ran
+        :param ttfb: Seconds from the start until the first response carrying data, None without one
+        :param peak_speed: Highest throughput in bytes per second over a progress interval
+        :param retries: Number of retried attempts
+        :param slices: Number of slices of a sliced download
+        :param segments: Number of segments of a playlist
+        :param peak_concurrency: Highest concurrency target of the adaptive controller
+        :param controller: Final state of the adaptive controller, see ``BaseConcurrencyController.snapshot``
+        :param timings: Phase timings of the traced HTTP requests, None for other protocols
+        :param chunk_size: Read size the transfer settled on, 0 when nothing was read
+        :param checksum: Verified digest of the content as '<algorithm>:<hex>', None when none was checked
+        """
+        self.mode = mode
+        self.bytes = bytes
+        self.resumed_bytes = resumed_bytes
+        self.total_size = total_size
+        self.wall_time = wall_time
+        self.ttfb = ttfb
+        self.peak_speed = peak_speed
+        self.retries = retries
+        self.slices = slices
+        self.segments = segments
+        self.peak_concurrency = peak_concurrency
+        self.controller = controller
+        self.timings = timings
+        self.chunk_size = chunk_size
+        self.checksum = checksum
+
+    @property
+    def speed(self) -> float:
+        """
+        Average throughput in bytes per second
+        """
+        return self.bytes / self.wall_time if self.wall_time > 0 else 0
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['speed'] = self.speed
+        data['timings'] = self.timings.to_dict() if self.timings is not None else None
+        return data
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return (f'<TransferStats {self.mode} {self.bytes} bytes in {self.wall_time:.2f}s '
+                f'{self.speed / 1024 / 1024:.2f} MB/S retries {self.retries}>')
@@ -4,7 +4,7 @@ from pathlib import Path
 from random import randint
 from string import Template
 from threading import Thread, Event
-from typing import Callable, Union, TypeVar, ParamSpec, Awaitable
+from typing import Callable, Union, TypeVar, ParamSpec, Awaitable, Type
 
 from ..utils.config import DEFAULT_SLICED_FILE_SUFFIX
 from ..utils.logger import logger
@@ -19,7 +19,7 @@ def convert_slice_path(path: Path) -> Callable[[int], Path]:
         DEFAULT_SLICED_FILE_SUFFIX
     ))
 
-    def render_slice_path(slice_id: int) -> Path:
+    def render_slice_path(slice_id: Union[int, str]) -> Path:
         return Path(template_path.substitute(slice_id=slice_id))
 
     return render_slice_path
@@ -28,7 +28,8 @@ def convert_slice_path(path: Path) -> Callable[[int], Path]:
 def retry(
         retry_count: int = 1,
         retry_delay: Union[int, tuple[float, float]] = 2,
-        before_retry: Callable[[], None] = None
+        before_retry: Callable[[], None] = None,
+        no_retry: tuple[Type[Exception], ...] = ()
 ):
     """
     Retry the decorator
@@ -36,6 +37,7 @@ def retry(
     :param retry_count: Number of retries
     :param retry_delay: Retry interval
     :param before_retry: Optional function to call before each retry
+    :param no_retry: Exception types that are raised immediately
     :return:
     """
 
@@ -46,11 +48,13 @@ def retry(
                     before_retry()
                 try:
                     return func(*args, **kwargs)
+                except no_retry:
+                    raise
                 except Exception as e:
                     if i == retry_count - 1:
-                        logger.error(f"Retry {i + 1}/{retry_count} times, error: {e}", exc_info=True)
+                        logger.error("Retry %s/%s times, error: %s", i + 1, retry_count, e, exc_info=True)
                         raise e
-                    logger.warning(f"Retry {i + 1}/{retry_count} times, error: {e}", exc_info=True)
+                    logger.warning("Retry %s/%s times, error: %s", i + 1, retry_count, e, exc_info=True)
                     if isinstance(retry_delay, tuple):
                         time.sleep(randint(*retry_delay))
                     else:
@@ -65,7 +69,8 @@ def retry(
 def retry_async(
         retry_count: int = 1,
         retry_delay: Union[int, tuple[float, float]] = 2,
-        before_retry: Callable[[], Awaitable[None]] = None
+        before_retry: Callable[[], Awaitable[None]] = None,
+        no_retry: tuple[Type[Exception], ...] = ()
 ):
     """
     Asynchronous retryer
@@ -73,6 +78,7 @@ def retry_async(
     :param retry_count: Number of retries
     :param retry_delay: Retry interval
     :param before_retry: Optional function to call before each retry
+    :param no_retry: Exception types that are raised immediately
     :return:
     """
 
@@ -83,11 +89,13 @@ def retry_async(
                     await before_retry()
                 try:
                     return await func(*args, **kwargs)
+                except no_retry:
+                    raise
                 except Exception as e:
                     if i == retry_count - 1:
-                        logger.error(f"Retry Async {i + 1}/{retry_count} times, error: {e}", exc_info=True)
+                        logger.error("Retry Async %s/%s times, error: %s", i + 1, retry_count, e, exc_info=True)
                         raise e
-                    logger.warning(f"Retry Async {i + 1}/{retry_count} times, error: {e}", exc_info=True)
+                    logger.warning("Retry Async %s/%s times, error: %s", i + 1, retry_count, e, exc_info=True)
                     if isinstance(retry_delay, tuple):
                         await asyncio.sleep(randint(*retry_delay))
                     else:
@@ -0,0 +1,130 @@
+import bisect
+import time
+from typing import Optional
+
+# 各阶段耗时的直方图分桶（秒），与指标中的分桶一致
+PHASE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PHASES = ('connect', 'tls', 'send', 'wait', 'ttfb', 'transfer')
+
+# httpcore 追踪事件 -> 阶段，名称解析包含在 connect_tcp 中
+_EVENT_PHASES = {
+    'connect_tcp': 'connect',
+    'connect_unix_socket': 'connect',
+    'start_tls': 'tls',
+    'send_request_headers': 'send',
+    'send_request_body': 'send',
+    'receive_response_headers': 'wait',
+    'receive_response_body': 'transfer',
+}
+
+
+class TimingSummary:
+    """
+    Phase durations of every traced request of a download, kept as histogram buckets
+
+    Phases:
+
+    - ``connect``: name resolution and TCP connect, only for requests that opened a connection
+    - ``tls``: TLS handshake, only for new HTTPS connections
+    - ``send``: writing the request headers and body
+    - ``wait``: from the request being sent until the response headers arrived, the server think time
+    - ``ttfb``: from issuing the request until the response headers arrived, including pool waits and connecting
+    - ``transfer``: reading the response body
+    """
+    __slots__ = ('requests', 'series')
+
+    def __init__(self):
+        self.requests = 0
+        # 阶段 -> [各桶计数, 总和, 总数]
+        self.series: dict[str, list] = {}
+
+    def observe(self, phase: str, duration: float):
+        series = self.series.get(phase)
+        if series is None:
+            series = self.series[phase] = [[0] * (len(PHASE_BUCKETS) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(PHASE_BUCKETS, duration)] += 1
+        series[1] += duration
+        series[2] += 1
+        if phase == 'ttfb':
+            self.requests += 1
+
+    def mean(self, phase: str) -> Optional[float]:
+        """
+        Average duration of a phase, None when it was never observed
+        """
+        series = self.series.get(phase)
+        return series[1] / series[2] if series else None
+
+    def count(self, phase: str) -> int:
+        series = self.series.get(phase)
+        return series[2] if series else 0
+
+    def to_dict(self) -> dict:
+        data = {'requests': self.requests, 'connections': self.count('connect')}
+        data.update((phase, self.mean(phase)) for phase in PHASES)
+        return data
+
+    def __getstate__(self):
+        return self.requests, self.series
+
+    def __setstate__(self, state):
+        self.requests, self.series = state
+
+    def __repr__(self):
+        ttfb = self.mean('ttfb')
+        return f'<TimingSummary {self.requests} requests ttfb {ttfb or 0:.3f}s>'
+
+
+class RequestTimings:
+    """
+    Phase timings of one HTTP request, collected through the httpcore ``trace`` extension
+
+    Pass ``extensions={'trace': timings.trace}`` to a synchronous client and ``timings.atrace``
+    to an asynchronous one. Redirect hops share the extensions and count as separate requests.
+    """
+    __slots__ = ('summary', 'started', 'phases', 'ttfb', '_open')
+
+    def __init__(self, summary: Optional['TimingSummary'] = None):
+        """
+        :param summary: Summary every completed phase is added to
+        """
+        self.summary = summary
+        self.started = time.monotonic()
+        self.phases: dict[str, float] = {}
+        self.ttfb: Optional[float] = None
+        self._open: dict[str, float] = {}
+
+    def trace(self, name: str, info: dict):
+        # 事件名形如 http11.send_request_headers.started
+        _, _, name = name.partition('.')
+        event, _, state = name.rpartition('.')
+        phase = _EVENT_PHASES.get(event)
+        if phase is None:
+            return
+        now = time.monotonic()
+        if state == 'started':
+            self._open[phase] = now
+            return
+        begin = self._open.pop(phase, None)
+        if begin is None or state != 'complete':
+            return
+        # 请求头与请求体合并为一次发送
+        self.phases[phase] = self.phases.get(phase, 0) + now - begin
+        if phase == 'wait':
+            self.ttfb = now - self.started
+            self.phases['ttfb'] = self.ttfb
+            self._flush()
+        elif phase == 'transfer':
+            self._flush()
+
+    async def atrace(self, name: str, info: dict):
+        self.trace(name, info)
+
+    def _flush(self):
+        if self.summary is not None:
+            for phase, duration in self.phases.items():
+                self.summary.observe(phase, duration)
+        self.phases = {}
+
+    def __repr__(self):
+        return f'<RequestTimings ttfb {self.ttfb}>'
@@ -1,17 +1,203 @@
+import asyncio
+import multiprocessing
+import time
 from concurrent.futures import Future
-from typing import Type, TYPE_CHECKING
+from typing import Type, TYPE_CHECKING, Optional, Callable, AsyncIterator, Sequence
 from .core import Result
 
 if TYPE_CHECKING:
     from network import BaseProtocolHandler
     from ..core.resources import Resources
+    from ..core.scheduler import ScheduledTask
+    from .stats import TransferStats
+
+# 进程池子进程中由 TaskSlots.bind 设置
+_worker_slots: Optional['TaskSlots'] = None
+
+
+class TaskSlots:
+    """
+    Fixed table of state shared with the pool processes, one slot per dispatched task
+    """
+    # 字段偏移
+    CONTROL = 0
+    BYTES_DONE = 1
+    TOTAL = 2
+    STEPS = 3
+    STEPS_TOTAL = 4
+    SPEED = 5
+    CONCURRENCY = 6
+    UPDATED_AT = 7
+    FIELDS = 8
+
+    # 控制字
+    RUN = 0
+    PREEMPT = 1
+    PAUSE = 2
+    CANCEL = 3
+
+    def __init__(self, size: int):
+        """
+        :param size: Number of tasks that can run at the same time
+        """
+        self.size = size
+        self.array = multiprocessing.RawArray('d', size * self.FIELDS)
+        self._free = list(range(size - 1, -1, -1))
+
+    @staticmethod
+    def bind(slots: 'TaskSlots'):
+        """
+        Process pool initializer that makes the table available in the worker
+        """
+        global _worker_slots
+        _worker_slots = slots
+
+    @staticmethod
+    def attach(index: Optional[int]) -> Optional['TaskSlot']:
+        """
+        Get the view of a slot inside a worker process
+
+        :param index: Slot index passed along with the task
+        :return: Slot view or None when the task was not dispatched with a slot
+        """
+        if index is None or _worker_slots is None:
+            return None
+        return TaskSlot(_worker_slots, index)
+
+    def acquire(self) -> int:
+        index = self._free.pop()
+        base = index * self.FIELDS
+        self.array[base:base + self.FIELDS] = [0] * self.FIELDS
+        return index
+
+    def release(self, index: int):
+        self._free.append(index)
+
+    def available(self) -> int:
+        return len(self._free)
+
+    def get(self, index: int, field: int) -> float:
+        return self.array[index * self.FIELDS + field]
+
+    def set(self, index: int, field: int, value: float):
+        self.array[index * self.FIELDS + field] = value
+
+    def snapshot(self, index: int) -> list[float]:
+        """复制一个槽位的全部字段"""
+        base = index * self.FIELDS
+        return self.array[base:base + self.FIELDS]
+
+
+class TaskSlot:
+    """
+    View of the shared state of one running task
+    """
+
+    def __init__(self, slots: 'TaskSlots', index: int):
+        self._slots = slots
+        self.index = index
+
+    @property
+    def control(self) -> int:
+        return int(self._slots.get(self.index, TaskSlots.CONTROL))
+
+    def publish(self, bytes_done: int, total: int, steps: int, steps_total: int, speed: float, concurrency: int):
+        """
+        Publish the progress of the task to the parent process
+        """
+        base = self.index * TaskSlots.FIELDS + TaskSlots.BYTES_DONE
+        # 时间戳最后写入，父进程据此判断是否有新数据
+        self._slots.array[base:base + TaskSlots.FIELDS - 1] = [
+            bytes_done, total, steps, steps_total, speed, concurrency, time.time()
+        ]
+
+
+class Progress:
+    """
+    Progress of a task as last published by its worker
+    """
+    __slots__ = ('bytes_done', 'total', 'steps', 'steps_total', 'speed', 'concurrency', 'updated_at')
+
+    def __init__(self, fields: Optional[Sequence[float]] = None):
+        """
+        :param fields: Slot fields, None for a task that has not published anything yet
+        """
+        fields = fields or [0] * TaskSlots.FIELDS
+        self.bytes_done = int(fields[TaskSlots.BYTES_DONE])
+        self.total = int(fields[TaskSlots.TOTAL])
+        self.steps = int(fields[TaskSlots.STEPS])
+        self.steps_total = int(fields[TaskSlots.STEPS_TOTAL])
+        self.speed = fields[TaskSlots.SPEED]
+        self.concurrency = int(fields[TaskSlots.CONCURRENCY])
+        self.updated_at = fields[TaskSlots.UPDATED_AT]
+
+    @property
+    def fraction(self) -> float:
+        """
+        Completed share between 0 and 1, 0 when the size is unknown
+        """
+        if self.steps_total:
+            return self.steps / self.steps_total
+        if self.total:
+            return min(1.0, self.bytes_done / self.total)
+        return 0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        Seconds left at the current speed, None when the size or speed is unknown
+        """
+        if not self.total or self.speed <= 0:
+            return None
+        return max(self.total - self.bytes_done, 0) / self.speed
+
+    def __repr__(self):
+        return (f'<Progress {self.bytes_done}/{self.total} bytes {self.fraction:.1%} '
+                f'{self.speed / 1024 / 1024:.2f} MB/S concurrency {self.concurrency}>')
 
 
 class WorkerFuture:
-    def __init__(self, future: Future, protocol: Type['BaseProtocolHandler'], resources: 'Resources'):
+    def __init__(self, future: Future, protocol: Type['BaseProtocolHandler'], resources: 'Resources',
+                 task: Optional['ScheduledTask'] = None):
         self._future = future
         self._protocol = protocol
         self.resources = resources
+        self._task = task
+
+    @property
+    def progress(self) -> 'Progress':
+        """
+        Latest progress published by the worker, read from shared memory without blocking
+        """
+        if self._task is None:
+            return Progress()
+        return self._task.progress()
+
+    @property
+    def stats(self) -> Optional['TransferStats']:
+        """
+        Transfer statistics of the last run, None until the task is done
+        """
+        if self._task is None:
+            return None
+        return self._task.stats
+
+    async def events(self, interval: float = 0.5) -> AsyncIterator['Progress']:
+        """
+        Stream progress updates until the task is done, the last event is the final progress
+
+        :param interval: Polling interval in seconds
+        """
+        last_update = None
+        while True:
+            done = self.done()
+            progress = self.progress
+            if done or progress.updated_at != last_update:
+                last_update = progress.updated_at
+                yield progress
+            if done:
+                return
+            await asyncio.sleep(interval)
 
     def wait(self):
         self._future.result()
@@ -29,13 +215,40 @@ class WorkerFuture:
         """
         return self._future.done()
 
-    def cancel(self):
+    def cancel(self) -> bool:
         """
-        取消任务
-        :return:
+        取消任务，运行中的任务在下一个数据块边界停止并保留已下载的部分
+        :return: 是否已发出取消
         """
+        if self._task is not None:
+            return self._task.scheduler.cancel(self._task)
         return self._future.cancel()
 
+    def pause(self) -> bool:
+        """
+        暂停任务，运行中的任务在下一个数据块边界让出工作进程，直到 resume
+        :return: 是否已暂停
+        """
+        if self._task is None:
+            return False
+        return self._task.scheduler.pause(self._task)
+
+    def resume(self) -> bool:
+        """
+        恢复已暂停的任务，从已下载的部分继续
+        :return: 任务是否处于暂停状态
+        """
+        if self._task is None:
+            return False
+        return self._task.scheduler.resume(self._task)
+
+    def paused(self) -> bool:
+        """
+        任务是否被暂停
+        :return:
+        """
+        return self._task is not None and self._task.paused and not self.done()
+
     def running(self):
         """
         任务是否正在运行
@@ -48,10 +261,21 @@ class WorkerFuture:
         任务是否被取消
         :return:
         """
-        return self._future.cancelled()
-
-    def __repr__(self):
-        return f'<WorkerFuture {self._future}>'
+        if self._future.cancelled():
+            return True
+        return self.done() and self._future.exception() is None and self._future.result() is Result.CANCEL
 
+    def exception(self) -> Optional[BaseException]:
+        """
+        :return: 任务在工作进程外抛出的异常
+        """
+        return self._future.exception()
 
+    def add_done_callback(self, fn: Callable[['WorkerFuture'], None]):
+        """
+        任务完成后调用 fn(worker_future)，已完成时立即调用
+        """
+        self._future.add_done_callback(lambda _: fn(self))
 
+    def __repr__(self):
+        return f'<WorkerFuture {self._future}>'
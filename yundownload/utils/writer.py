@@ -0,0 +1,223 @@
+import asyncio
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from .config import DEFAULT_WRITE_BUFFER_SIZE
+from .logger import logger
+
+# 单次 pwritev 的缓冲区数量上限
+IOV_MAX = min(os.sysconf('SC_IOV_MAX'), 1024) if hasattr(os, 'sysconf') else 1024
+
+
+def _write_at(fd: int, buffers: list, offset: int) -> int:
+    """
+    Write all buffers at offset, retrying partial writes
+
+    :return: Number of system calls
+    """
+    calls = 0
+    if not hasattr(os, 'pwritev'):
+        # Windows 没有定位写入，文件描述符只由写入线程使用，先定位再写入是安全的
+        data = memoryview(b''.join(buffers))
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            data = data[os.write(fd, data):]
+            calls += 1
+        return calls
+    index = 0
+    while index < len(buffers):
+        written = os.pwritev(fd, buffers[index:index + IOV_MAX], offset)
+        calls += 1
+        offset += written
+        while index < len(buffers) and written >= len(buffers[index]):
+            written -= len(buffers[index])
+            index += 1
+        if written:
+            buffers[index] = memoryview(buffers[index])[written:]
+    return calls
+
+
+class QueuedFile:
+    """
+    File written through the DiskWriter of the process
+
+    ``write`` only queues the data at the next offset and returns at once unless the writer
+    is behind. ``close`` waits until everything is on disk and raises the first write error.
+    """
+    __slots__ = ('path', 'offset', 'error', '_fd', '_writer', '_closed')
+
+    def __init__(self, writer: 'DiskWriter', path: Path, fd: int, offset: int):
+        self.path = path
+        self.offset = offset
+        self.error: Optional[OSError] = None
+        self._fd = fd
+        self._writer = writer
+        self._closed = False
+
+    async def write(self, data: bytes):
+        if self.error is not None:
+            raise self.error
+        await self._writer.submit(self, self.offset, data)
+        self.offset += len(data)
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        await self._writer.submit(self, self.offset, None)
+        if self.error is not None:
+            raise self.error
+
+    async def __aenter__(self) -> 'QueuedFile':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.close()
+        except OSError:
+            # 保留正在传播的异常
+            if exc_type is None:
+                raise
+
+    def __repr__(self):
+        return f'<QueuedFile {self.path} {self.offset} bytes>'
+
+
+class DiskWriter:
+    """
+    Writes the chunks of every asynchronous transfer of the process from a single thread
+
+    Event loops queue ``(file, offset, data)`` requests without a thread round trip. The
+    thread takes everything queued at once and writes adjacent requests of a file with one
+    ``os.pwritev`` call, so a busy process makes fewer and larger system calls. When more
+    than ``buffer_size`` bytes are waiting, writers wait until the disk catches up.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE):
+        """
+        :param buffer_size: Bytes that may wait for the disk before writers are paused
+        """
+        self.buffer_size = buffer_size
+        self.requests = 0
+        self.calls = 0
+        self._queue: list[tuple] = []
+        self._pending = 0
+        self._waiters: list[tuple['asyncio.AbstractEventLoop', 'asyncio.Future']] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self, path: Union[str, Path], append: bool = False) -> 'QueuedFile':
+        """
+        Open a file for writing, truncated or appended to
+
+        :param path: File path
+        :param append: Continue after the existing content
+        """
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0) | (0 if append else os.O_TRUNC)
+        fd = os.open(path, flags, 0o666)
+        return QueuedFile(self, Path(path), fd, os.fstat(fd).st_size if append else 0)
+
+    async def submit(self, file: 'QueuedFile', offset: int, data: Optional[bytes]):
+        """
+        Queue data at offset of file, None closes the file after its queued writes
+        """
+        loop = asyncio.get_running_loop()
+        size = len(data) if data is not None else 0
+        done = loop.create_future() if data is None else None
+        while True:
+            with self._cond:
+                # 判断与入队在同一次加锁中完成，多个循环不会同时越过缓冲上限；单个请求超过缓冲大小时也要放行
+                if data is None or not self._pending or self._pending + size <= self.buffer_size:
+                    self._queue.append((file, offset, data, loop, done))
+                    self._pending += size
+                    if data is not None:
+                        self.requests += 1
+                    if self._thread is None:
+                        self._thread = threading.Thread(target=self._run, name='yundownload-writer', daemon=True)
+                        self._thread.start()
+                    self._cond.notify()
+                    break
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+        if done is not None:
+            await done
+
+    @staticmethod
+    def _resolve(future: 'asyncio.Future'):
+        if not future.done():
+            future.set_result(None)
+
+    def _wake(self, loop: 'asyncio.AbstractEventLoop', future: 'asyncio.Future'):
+        try:
+            loop.call_soon_threadsafe(self._resolve, future)
+        except RuntimeError:
+            # 事件循环已关闭，没有等待者
+            pass
+
+    def _flush(self, batch: list[tuple]):
+        runs: dict[int, list] = {}
+        closes = []
+        for file, offset, data, loop, done in batch:
+            if data is None:
+                closes.append((file, loop, done))
+            else:
+                runs.setdefault(id(file), [file]).append((offset, data))
+        written = calls = 0
+        for file, *requests in runs.values():
+            requests.sort(key=lambda request: request[0])
+            start, buffers, end = requests[0][0], [], requests[0][0]
+            for offset, data in requests + [(None, None)]:
+                # 不相邻的请求单独写入
+                if offset != end and buffers:
+                    if file.error is None:
+                        try:
+                            calls += _write_at(file._fd, buffers, start)
+                        except OSError as e:
+                            logger.warning('writing %s failed: %s', file.path, e)
+                            file.error = e
+                    start, buffers = offset, []
+                if data is not None:
+                    buffers.append(data)
+                    written += len(data)
+                    end = offset + len(data)
+        with self._cond:
+            self._pending -= written
+            self.calls += calls
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            self._wake(loop, waiter)
+        for file, loop, done in closes:
+            try:
+                os.close(file._fd)
+            except OSError as e:
+                file.error = file.error or e
+            self._wake(loop, done)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch, self._queue = self._queue, []
+            try:
+                self._flush(batch)
+            except Exception as e:
+                logger.warning('disk writer failed: %s', e)
+
+    def _after_fork(self):
+        # 写入线程不会被 fork 复制，子进程中按需重新启动
+        self._cond = threading.Condition()
+        self._queue = []
+        self._pending = 0
+        self._waiters = []
+        self._thread = None
+
+    def __repr__(self):
+        return f'<DiskWriter {self._pending} bytes pending>'
+
+
+writer = DiskWriter()
+os.register_at_fork(after_in_child=writer._after_fork)